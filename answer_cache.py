@@ -0,0 +1,62 @@
+"""
+Answer Cache - Remembers streamed /chat answers so repeated questions against
+the same documents are replayed instead of going back to Gemini
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+
+class AnswerCache:
+    """Size-bounded LRU of answer chunks with a per-entry TTL"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, [chunk, ...], meta)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query: str, fingerprint: str, model_name: str, generation_config: dict) -> str:
+        """Stable key for (normalized query, document set, model, generation config)"""
+        raw = json.dumps([query, fingerprint, model_name, generation_config], sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Return the cached chunks for key, or None if missing or expired"""
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key: str) -> Optional[Tuple[List[str], Any]]:
+        """(chunks, meta) for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, chunks: List[str], meta: Any = None):
+        """Store a complete answer, plus anything needed to replay it (meta)"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, list(chunks), meta)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every answer"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
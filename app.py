@@ -1,18 +1,9 @@
 import streamlit as st
 import os
-import shutil
-from llama_index.core import (
-    VectorStoreIndex,
-    SimpleDirectoryReader,
-    Settings,
-    StorageContext,
-    load_index_from_storage
-)
-from llama_index.llms.ollama import Ollama
-from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-import google.generativeai as genai
+import time
 from dotenv import load_dotenv
+from kb_index import sync_index
+from warmup import WarmUp
 
 # Load environment variables
 load_dotenv()
@@ -22,10 +13,53 @@ DATA_DIR = "./data"
 PERSIST_DIR = "./storage"
 OLLAMA_MODEL = "llama3.2:1b"
 EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_CACHE_DIR = "./embedding_cache"  # chunk embeddings reused across re-indexing
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 0)) or None  # batches embedded at once (default: CPU cores)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")  # or "onnx"
+EMBED_ONNX_FILE = os.getenv("EMBED_ONNX_FILE") or None  # e.g. onnx/model_qint8_avx512.onnx
+RETRIEVAL_MODES = {"hybrid": "Hybrid (keyword + vector)", "vector": "Vector", "keyword": "Keyword (BM25)"}
+SYSTEM_PROMPT = (
+    "You answer strictly using the provided context. "
+    "If answer is not in documents, reply: "
+    "'I cannot answer this based on the provided documents.'"
+)
 
 st.set_page_config(page_title="Document Chatbot", layout="wide")
 st.title("Document Chatbot")
 
+
+# LlamaIndex, HuggingFace and Gemini are imported on the warm-up thread, so the
+# page renders while the embedding model loads
+def build_embed_model():
+    from embedding_cache import CachedEncoder, EmbeddingCache
+    from kb_embeddings import CachedEmbedding
+    cache = EmbeddingCache(EMBED_CACHE_DIR, EMBED_MODEL, EMBED_BACKEND, EMBED_ONNX_FILE)
+    encoder = CachedEncoder(EMBED_MODEL, cache, batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS,
+                            backend=EMBED_BACKEND, onnx_file=EMBED_ONNX_FILE)
+    encoder.get_model()  # load the weights here, on the warm-up thread
+    return CachedEmbedding(encoder)
+
+
+def build_llm(api_key):
+    import google.generativeai as genai
+    from llama_index.llms.gemini import Gemini
+    genai.configure(api_key=api_key)
+    # Use Gemini 2.5 Flash - the current stable model
+    return Gemini(model_name="models/gemini-2.5-flash", api_key=api_key)
+
+
+@st.cache_resource(show_spinner=False)
+def start_warmup(_api_key=None):
+    """Start loading the embedding model and Gemini client in the background (once per process)"""
+    warm = WarmUp()
+    warm.add('embeddings', build_embed_model)
+    warm.add('gemini', lambda: build_llm(_api_key), enabled=bool(_api_key))
+    warm.start()
+    return warm
+
+warmup = start_warmup(os.getenv("GEMINI_API_KEY"))
+
 # ----------------------- SIDEBAR SETTINGS ------------------------------------ #
 with st.sidebar:
     st.header("Model Selection")
@@ -69,19 +103,24 @@ with st.sidebar:
         st.info(f"LLM: Gemini (gemini-2.5-flash)")
     
     st.info(f"Embeddings: {EMBED_MODEL}")
+    for name, component in warmup.status()['components'].items():
+        st.caption(f"{name}: {component['status']}")
     
     st.divider()
+    st.subheader("Retrieval")
+    top_k = st.slider("Passages per answer (top-k)", min_value=1, max_value=10, value=4)
+    retrieval_mode = st.selectbox("Search", list(RETRIEVAL_MODES), format_func=RETRIEVAL_MODES.get)
+    mmr_lambda = None
+    if st.checkbox("Diversify passages (MMR)", value=True):
+        mmr_lambda = st.slider("Relevance vs. diversity", min_value=0.0, max_value=1.0, value=0.7, step=0.05,
+                               help="1.0 ranks by relevance only; lower values skip near-duplicate passages")
+    # Filled in after each answer
+    retrieval_panel = st.empty()
 
-    if st.button("Refresh / Re‑index Knowledge Base"):
-        # Clear cached index
-        if "index" in st.session_state:
-            del st.session_state["index"]
-
-        # Delete old storage
-        if os.path.exists(PERSIST_DIR):
-            shutil.rmtree(PERSIST_DIR)
+    st.divider()
 
-        # Indicate indexing will start
+    if st.button("Refresh / Re‑index Knowledge Base"):
+        # Indicate indexing will start (the persisted index is updated incrementally, not deleted)
         st.session_state["indexing"] = True
         st.rerun()
 
@@ -133,8 +172,9 @@ else:
 # ---------------------- LlamaIndex Settings ---------------------------------- #
 @st.cache_resource
 def get_settings(model_type, _api_key=None):
-    """Initialize LLM and embeddings based on user choice"""
-    embed_model = HuggingFaceEmbedding(model_name=EMBED_MODEL)
+    """Initialize LLM and embeddings based on user choice (waiting for warm-up if needed)"""
+    from llama_index.core import Settings
+    embed_model = warmup.wait('embeddings')
     
     # Always set the embedding model first to avoid OpenAI default fallback
     Settings.embed_model = embed_model
@@ -143,10 +183,7 @@ def get_settings(model_type, _api_key=None):
     if not _api_key:
         return None, embed_model
     
-    # Configure the genai library
-    genai.configure(api_key=_api_key)
-    # Use Gemini 2.5 Flash - the current stable model
-    llm = Gemini(model_name="models/gemini-2.5-flash", api_key=_api_key)
+    llm = warmup.wait('gemini')
 
     Settings.llm = llm
     Settings.embed_model = embed_model
@@ -159,94 +196,85 @@ llm, embed_model = get_settings(
 
 
 # ------------------------- Load or Create Index ------------------------------ #
+def run_indexing():
+    """
+    Sync the persisted index with DATA_DIR, embedding only new or changed files
+    Returns (index, version), version being the hash of the index's manifest
+    """
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+
+    def report(fraction, message):
+        status_text.text(message)
+        progress_bar.progress(int(fraction * 100))
+
+    index, stats = sync_index(DATA_DIR, PERSIST_DIR, progress=report)
+
+    # Clear progress indicators
+    progress_bar.empty()
+    status_text.empty()
+    if index is not None:
+        st.success(
+            f"✅ Indexing complete! {stats['added']} added, {stats['updated']} updated, "
+            f"{stats['removed']} removed, {stats['unchanged']} unchanged."
+        )
+    return index, stats['version']
+
+
 @st.cache_resource(show_spinner=False)
 def load_index():
+    """(index, version) or (None, None) while there are no documents"""
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
-        return None
+        return None, None
 
     files = os.listdir(DATA_DIR)
     if not files:
-        return None
+        return None, None
+
+    return run_indexing()
+
+
+# Initialize Index (one per process, shared by every session; a re-index replaces it for all)
+if st.session_state.get("indexing", False):
+    load_index.clear()
+    st.session_state["indexing"] = False
+index, index_version = load_index()
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_keyword_index(_index, index_version):
+    """BM25 over the index's nodes, built once per index version"""
+    from kb_retrieval import build_keyword_index
+    return build_keyword_index(_index)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def get_query_engine(_index, index_version, _llm, top_k, mode, mmr_lambda):
+    """Retriever and streaming query engine for one set of retrieval settings, shared across sessions"""
+    from llama_index.core.query_engine import RetrieverQueryEngine
+    from kb_retrieval import HybridRetriever
+    keyword_index = get_keyword_index(_index, index_version) if mode != "vector" else None
+    retriever = HybridRetriever(_index, top_k=top_k, mode=mode, mmr_lambda=mmr_lambda, keyword_index=keyword_index)
+    query_engine = RetrieverQueryEngine.from_args(retriever, llm=_llm, streaming=True, system_prompt=SYSTEM_PROMPT)
+    return retriever, query_engine
+
+
+def show_retrieval(info):
+    """Latency and per-passage scores of the last retrieval, in the sidebar"""
+    if not info:
+        return
+    with retrieval_panel.container():
+        mmr_note = f" · MMR λ={info['mmr_lambda']}" if info['mmr_lambda'] is not None else ""
+        st.caption(f"Last retrieval: {info['seconds'] * 1000:.0f} ms · {RETRIEVAL_MODES[info['mode']]} · "
+                   f"top-{info['top_k']}{mmr_note}")
+        for hit in info['hits']:
+            ranks = ", ".join(f"{name} #{hit[name + '_rank']}" for name in ("vector", "keyword")
+                              if hit[name + '_rank'] is not None)
+            st.caption(f"{hit['file']}: {hit['score']:.3f}" + (f" ({ranks})" if ranks else ""))
 
-    # Use existing index if available
-    if os.path.exists(PERSIST_DIR):
-        try:
-            with st.spinner("📚 Loading existing index..."):
-                storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
-                index = load_index_from_storage(storage_context)
-                st.success("✅ Index loaded successfully!")
-                return index
-        except:
-            pass
-
-    # Fresh indexing with progress bar
-    st.info(f"📄 Found {len(files)} file(s) to index...")
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    # Step 1: Load documents
-    status_text.text("Step 1/3: Reading documents...")
-    progress_bar.progress(33)
-    documents = SimpleDirectoryReader(DATA_DIR).load_data()
-    
-    # Step 2: Create index
-    status_text.text(f"Step 2/3: Creating embeddings for {len(documents)} document(s)...")
-    progress_bar.progress(66)
-    index = VectorStoreIndex.from_documents(documents)
-    
-    # Step 3: Persist
-    status_text.text("Step 3/3: Saving index...")
-    progress_bar.progress(100)
-    index.storage_context.persist(persist_dir=PERSIST_DIR)
-    
-    # Clear progress indicators
-    progress_bar.empty()
-    status_text.empty()
-    st.success("✅ Indexing complete! You can now chat with your documents.")
-    
-    return index
-
-
-# Initialize Index
-if "index" not in st.session_state:
-    # Check if we're in indexing mode
-    if st.session_state.get("indexing", False):
-        # Show progress manually
-        if os.path.exists(DATA_DIR) and os.listdir(DATA_DIR):
-            files = os.listdir(DATA_DIR)
-            st.info(f"📄 Found {len(files)} file(s) to index...")
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            # Step 1: Load documents
-            status_text.text("Step 1/3: Reading documents...")
-            progress_bar.progress(33)
-            documents = SimpleDirectoryReader(DATA_DIR).load_data()
-            
-            # Step 2: Create index
-            status_text.text(f"Step 2/3: Creating embeddings for {len(documents)} document(s)...")
-            progress_bar.progress(66)
-            index = VectorStoreIndex.from_documents(documents)
-            
-            # Step 3: Persist
-            status_text.text("Step 3/3: Saving index...")
-            progress_bar.progress(100)
-            index.storage_context.persist(persist_dir=PERSIST_DIR)
-            
-            # Clear progress indicators
-            progress_bar.empty()
-            status_text.empty()
-            st.success("✅ Indexing complete! You can now chat with your documents.")
-            
-            st.session_state["index"] = index
-            st.session_state["indexing"] = False
-        else:
-            st.session_state["indexing"] = False
-    else:
-        st.session_state["index"] = load_index()
 
-index = st.session_state["index"]
+show_retrieval(st.session_state.get("last_retrieval"))
 
 # ----------------------------- Chat Interface -------------------------------- #
 st.subheader("💬 Chat with Your Documents")
@@ -275,6 +303,7 @@ else:
             if prompt.strip().lower().startswith("what is the content"):
                 with st.chat_message("assistant"):
                     with st.spinner("Gathering full document content..."):
+                        from llama_index.core import SimpleDirectoryReader
                         docs = SimpleDirectoryReader(DATA_DIR).load_data()
                         full_text = "\n\n---\n\n".join([doc.text for doc in docs])
                         st.markdown(full_text)
@@ -286,17 +315,17 @@ else:
 
             with st.chat_message("assistant"):
                 with st.spinner("Thinking..."):
-                    query_engine = index.as_query_engine(
-                        streaming=True,
-                        similarity_top_k=1,
-                        system_prompt=(
-                            "You answer strictly using the provided context. "
-                            "If answer is not in documents, reply: "
-                            "'I cannot answer this based on the provided documents.'"
-                        )
-                    )
+                    from llama_index.core import QueryBundle
+                    retriever, query_engine = get_query_engine(index, index_version, llm, top_k, retrieval_mode, mmr_lambda)
                     try:
-                        response = query_engine.query(prompt)
+                        query_bundle = QueryBundle(prompt)
+                        start = time.perf_counter()
+                        nodes, hits = retriever.retrieve_with_details(query_bundle)
+                        st.session_state["last_retrieval"] = {
+                            "seconds": time.perf_counter() - start, "mode": retrieval_mode, "top_k": top_k,
+                            "mmr_lambda": mmr_lambda, "hits": hits}
+                        show_retrieval(st.session_state["last_retrieval"])
+                        response = query_engine.synthesize(query_bundle, nodes)
                         placeholder = st.empty()
                         full_response = ""
                         for token in response.response_gen:
@@ -0,0 +1,178 @@
+"""
+ASGI serving mode - The routes of app_flask.py on an asyncio event loop, so many
+SSE chat streams share one process instead of each pinning a sync gunicorn worker
+
+Run with: uvicorn app_asgi:app --host 0.0.0.0 --port $PORT
+"""
+import asyncio
+import json
+import os
+import threading
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from werkzeug.utils import secure_filename
+
+# Shared storage, caches, index and the chat pipeline
+import app_flask as core
+
+
+async def serve_frontend(request):
+    return FileResponse('web/index.html')
+
+
+async def upload_file(request):
+    form = await request.form()
+    try:
+        files = form.getlist('files')
+        if not files:
+            return JSONResponse({'error': 'No files provided'}, status_code=400)
+        uploaded, job = await run_in_threadpool(core.save_documents, core.namespace_for(request.session), [
+            (file.file, secure_filename(file.filename)) for file in files
+            if getattr(file, 'filename', None) and core.allowed_file(file.filename)])
+    finally:
+        await form.close()  # spooled upload temp files
+    return JSONResponse({'message': f'Uploaded {len(uploaded)} file(s)', 'files': uploaded, 'job_id': job.id})
+
+
+async def list_files(request):
+    namespace = core.namespace_for(request.session)
+    return JSONResponse({'files': await run_in_threadpool(core.list_documents, namespace)})
+
+
+async def delete_file(request):
+    filename = request.path_params['filename']
+    try:
+        await run_in_threadpool(core.remove_document, core.namespace_for(request.session), filename)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+    return JSONResponse({'message': f'Deleted {filename}'})
+
+
+async def reindex(request):
+    file_count, job = await run_in_threadpool(core.rebuild_index, core.namespace_for(request.session))
+    return JSONResponse({'message': f'Indexing {file_count} file(s)', 'file_count': file_count,
+                         'job_id': job.id}, status_code=202)
+
+
+async def get_job(request):
+    job = core.ingest_queue.get(request.path_params['job_id'])
+    if job is None:
+        return JSONResponse({'error': 'Unknown job'}, status_code=404)
+    return JSONResponse(job)
+
+
+async def job_events(request):
+    """SSE stream of job snapshots until the job finishes"""
+    job_id = request.path_params['job_id']
+    if core.ingest_queue.get(job_id) is None:
+        return JSONResponse({'error': 'Unknown job'}, status_code=404)
+    return StreamingResponse(sse_stream(lambda: core.ingest_queue.watch(job_id)),
+                             media_type='text/event-stream')
+
+
+async def clear_session(request):
+    try:
+        await run_in_threadpool(core.clear_documents, core.namespace_for(request.session))
+        request.session.clear()
+        print("✅ Session cleared")
+        return Response(status_code=200)
+    except Exception as e:
+        print(f"Error clearing session: {e}")
+        return Response(status_code=500)
+
+
+async def sse_stream(make_events):
+    """
+    Run a blocking event generator (core.chat_events, a job watch) on its own
+    thread and forward the events over SSE
+    This is one OS thread per open stream: the pipeline and the Gemini client
+    underneath it are synchronous, so the event loop only saves the gunicorn
+    worker, not the thread. When the client disconnects the generator is closed,
+    which releases the shared upstream stream (and cancels it if nobody else is
+    reading), but only once its next event arrives: the next Gemini chunk, or
+    the next job update or heartbeat
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def forward(event):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+        except RuntimeError:
+            stop.set()  # event loop already closed
+
+    def pump():
+        events = make_events()
+        try:
+            for event in events:
+                if stop.is_set():
+                    break
+                forward(event)
+        finally:
+            events.close()
+            forward(None)
+
+    threading.Thread(target=pump, name='sse-pump', daemon=True).start()
+    try:
+        while True:
+            event = await queue.get()
+            if event is None:
+                return
+            yield f"data: {json.dumps(event)}\n\n"
+    finally:
+        stop.set()
+
+
+async def chat(request):
+    """Streaming RAG Endpoint"""
+    if not await run_in_threadpool(core.get_model):
+        return JSONResponse({'error': 'Gemini API not configured'}, status_code=500)
+    data = await request.json()
+    query = data.get('query', '')
+    if not query:
+        return JSONResponse({'error': 'No query provided'}, status_code=400)
+    debug = bool(request.headers.get('X-Debug-Timing'))
+    namespace = core.namespace_for(request.session)
+    return StreamingResponse(sse_stream(lambda: core.chat_events(query, namespace, debug=debug)),
+                             media_type='text/event-stream')
+
+
+async def ready(request):
+    """Which components are warm; 503 until all enabled ones are"""
+    status = core.warmup.status()
+    return JSONResponse(status, status_code=200 if status['ready'] else 503)
+
+
+async def metrics(request):
+    """Prometheus text exposition"""
+    return Response(core.REGISTRY.render(), media_type=core.CONTENT_TYPE)
+
+
+app = Starlette(routes=[
+    Route('/', serve_frontend),
+    Route('/upload', upload_file, methods=['POST']),
+    Route('/files', list_files, methods=['GET']),
+    Route('/files/{filename}', delete_file, methods=['DELETE']),
+    Route('/reindex', reindex, methods=['POST']),
+    Route('/jobs/{job_id}', get_job, methods=['GET']),
+    Route('/jobs/{job_id}/events', job_events, methods=['GET']),
+    Route('/clear-session', clear_session, methods=['POST']),
+    Route('/chat', chat, methods=['POST']),
+    Route('/ready', ready, methods=['GET']),
+    Route('/metrics', metrics, methods=['GET']),
+    Mount('/', StaticFiles(directory='web')),
+], middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+               Middleware(SessionMiddleware, secret_key=core.app.secret_key)])
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', 5001)))
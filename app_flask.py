@@ -1,15 +1,31 @@
 from flask import Flask, request, jsonify, send_from_directory, session, Response
 from flask_cors import CORS
 import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 from cloudinary_storage import CloudinaryStorage
-from pypdf import PdfReader
-import io
+from document_mirror import DocumentMirror, remote_key
+from blob_store import BlobStore
+from text_cache import TextCache
+from retrieval import BM25Index, chunk_text, reciprocal_rank_fusion
+from embedding_index import EmbeddingIndex
+from pdf_extract import extract_pdf_text, warm_up as warm_up_pdf
+from answer_cache import AnswerCache
+from coalesce import SingleFlight
+from rate_limiter import RateLimiter, BACKGROUND, INTERACTIVE, is_rate_limit_error
+from context_packing import CHARS_PER_TOKEN, estimate_tokens, format_excerpts, pack_context, shard_context
+from ingest_jobs import JobQueue
+from warmup import WarmUp
+from corpus import CorpusRegistry, Document, scan_directory
+from namespaces import SHARED, Namespace, NamespaceManager
+from metrics import (REGISTRY, CONTENT_TYPE, STAGE_SECONDS, TTFT_SECONDS, STREAM_SECONDS, ANSWER_CACHE,
+                     MAP_SHARDS, GEMINI_RETRIES, GEMINI_RATE_LIMITED, RATE_LIMIT_WAIT_SECONDS, span)
+import hashlib
 import json
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables
 load_dotenv()
@@ -17,13 +33,66 @@ load_dotenv()
 # Configuration
 ALLOWED_EXTENSIONS = {'pdf', 'txt', 'md'}
 DATA_DIR = "./data"
+TEXT_CACHE_DIR = "./text_cache"
+BLOB_DIR = "./blobs"  # uploaded content by SHA-256, hard-linked into the namespace directories
+# Opt-in: each browser session sees only its own documents (DATA_DIR/<namespace>/).
+# Off, everyone shares the documents in DATA_DIR itself
+SESSION_NAMESPACES = os.getenv("SESSION_NAMESPACES", "0").lower() in ("1", "true", "yes")
+NAMESPACE_IDLE_SECONDS = float(os.getenv("NAMESPACE_IDLE_HOURS", 24)) * 3600  # then its documents are deleted
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 4))  # files of one upload stored in parallel
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))  # background extract/chunk/embed/index threads
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", 2))
+INGEST_WAIT_TIMEOUT = float(os.getenv("INGEST_WAIT_TIMEOUT", 120))  # /chat wait when nothing is indexed yet
+CORPUS_POLL_INTERVAL = float(os.getenv("CORPUS_POLL_INTERVAL", 2))  # seconds between corpus change checks (0 = off)
+MIRROR_DIR = "./cloud_mirror"  # local copies of Cloudinary documents
+MIRROR_MAX_BYTES = int(os.getenv("MIRROR_MAX_MB", 500)) * 1024 * 1024  # disk cap for the mirror
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 200))          # words per retrieval chunk
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 40))     # words shared by neighbouring chunks
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 40))  # candidate chunks considered per question
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 8000))  # input tokens per prompt
+PROMPT_OVERHEAD_TOKENS = 300  # instructions and framing around the excerpts
+# Above this many indexed tokens, questions are answered map-reduce style (0 = never)
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("MAP_REDUCE_THRESHOLD_TOKENS", 4 * CONTEXT_TOKEN_BUDGET))
+MAP_REDUCE_TOP_K = int(os.getenv("MAP_REDUCE_TOP_K", 200))          # candidate chunks spread over the shards
+MAP_REDUCE_MAX_SHARDS = int(os.getenv("MAP_REDUCE_MAX_SHARDS", 8))  # map calls per question
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", 4))  # map calls in flight, across requests
+ENABLE_EMBEDDINGS = os.getenv("ENABLE_EMBEDDINGS", "").lower() in ("1", "true", "yes")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_INDEX_DIR = "./embedding_index"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+EMBED_QUANTIZE = os.getenv("EMBED_QUANTIZE", "").lower() in ("1", "true", "yes")  # int8 vectors
+EMBED_CACHE_DIR = "./embedding_cache"
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 0)) or None  # batches embedded at once (default: CPU cores)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")  # or "onnx"
+EMBED_ONNX_FILE = os.getenv("EMBED_ONNX_FILE") or None  # e.g. onnx/model_qint8_avx512.onnx
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 256))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))  # seconds
+WARMUP = os.getenv("WARMUP", "1").lower() in ("1", "true", "yes")  # build slow components in the background
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("MAX_CONCURRENT_GENERATIONS", 8))  # in-flight Gemini streams
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", 15))            # requests per minute budget
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", 1000000))       # tokens per minute budget
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 3))
+RATE_LIMIT_STATE_DIR = os.getenv("RATE_LIMIT_STATE_DIR")   # set to share the budget across workers
+
+GENERATION_CONFIG = {"temperature": 0.0, "max_output_tokens": 2048}
+MAP_GENERATION_CONFIG = {"temperature": 0.0, "max_output_tokens": 512}  # per-shard notes
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
 
 # Create data directory if it doesn't exist
 os.makedirs(DATA_DIR, exist_ok=True)
 
 # Initialize Flask app
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+# Signs the session cookie that holds the namespace id. A random key would orphan
+# every session's documents on restart (and differ between gunicorn workers)
+if SESSION_NAMESPACES and not os.getenv("SECRET_KEY"):
+    raise RuntimeError("SESSION_NAMESPACES needs SECRET_KEY, or every restart loses the sessions' documents")
+app.secret_key = os.getenv("SECRET_KEY") or os.urandom(24)
 CORS(app)
 
 # Initialize Cloudinary storage
@@ -35,9 +104,12 @@ use_cloudinary = all([cloud_name, cloud_api_key, cloud_api_secret])
 
 if use_cloudinary:
     storage = CloudinaryStorage(cloud_name=cloud_name, api_key=cloud_api_key, api_secret=cloud_api_secret)
+    # /chat reads Cloudinary documents through this, fetching only new or changed objects
+    mirror = DocumentMirror(storage, MIRROR_DIR, max_bytes=MIRROR_MAX_BYTES)
     print("✅ Using Cloudinary for file storage")
 else:
     storage = None
+    mirror = None
     print("⚠️  Cloudinary not configured")
 
 # Initialize Gemini
@@ -46,24 +118,50 @@ api_key = os.getenv("GEMINI_API_KEY")
 # Alternative models: models/gemini-2.5-flash, models/gemini-2.0-flash-exp, models/gemini-2.5-pro
 model_name = os.getenv("GEMINI_MODEL", "models/gemini-2.0-flash")
 
-if api_key and api_key.strip() and api_key != "your_api_key_here":
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
-        print(f"✅ Gemini initialized with model: {model_name}")
-    except Exception as e:
-        print(f"⚠️  Error initializing Gemini: {e}")
-        model = None
-else:
-    model = None
+gemini_configured = bool(api_key and api_key.strip() and api_key != "your_api_key_here")
+model = None  # built by get_model(), normally on the warm-up thread
+_model_lock = threading.Lock()
+_model_failed = False
+
+def get_model():
+    """The Gemini model, importing google.generativeai and building it on first call"""
+    global model, _model_failed
+    if model is None and gemini_configured and not _model_failed:
+        with _model_lock:
+            if model is None and not _model_failed:
+                try:
+                    import google.generativeai as genai
+                    genai.configure(api_key=api_key)
+                    model = genai.GenerativeModel(model_name)
+                    print(f"✅ Gemini initialized with model: {model_name}")
+                except Exception as e:
+                    print(f"⚠️  Error initializing Gemini: {e}")
+                    _model_failed = True
+    return model
+
+if not gemini_configured:
     print("⚠️  Gemini API key not configured - please set GEMINI_API_KEY in .env file")
     print("   Get a free API key from: https://aistudio.google.com/apikey")
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def generate_with_retry(model, prompt, generation_config, safety_settings, max_retries=3):
+# Every Gemini call goes through this scheduler (RPM/TPM budgets, chat before background work)
+rate_limiter = RateLimiter(GEMINI_RPM, GEMINI_TPM, state_dir=RATE_LIMIT_STATE_DIR)
+
+def estimate_request_tokens(prompt, generation_config):
+    """Rough TPM cost of a call: estimated prompt tokens plus the output allowance"""
+    return estimate_tokens(prompt) + generation_config.get("max_output_tokens", 0)
+
+def acquire_slot(prompt, generation_config, priority):
+    """Wait for the rate limiter, recording the wait under the call's priority"""
+    waited = rate_limiter.acquire(estimate_request_tokens(prompt, generation_config), priority)
+    RATE_LIMIT_WAIT_SECONDS.observe(waited, priority='interactive' if priority == INTERACTIVE else 'background')
+
+def generate_with_retry(model, prompt, generation_config, safety_settings, max_retries=GEMINI_MAX_RETRIES,
+                        priority=INTERACTIVE):
     for attempt in range(max_retries):
+        acquire_slot(prompt, generation_config, priority)
         try:
             response = model.generate_content(
                 prompt,
@@ -72,47 +170,604 @@ def generate_with_retry(model, prompt, generation_config, safety_settings, max_r
             )
             return response, None
         except Exception as e:
-            error_msg = str(e)
-            is_rate_limit = '429' in error_msg or 'quota' in error_msg.lower() or 'rate limit' in error_msg.lower()
-            if is_rate_limit and attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                print(f"⚠️ Rate limit hit, retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
+            if is_rate_limit_error(e):
+                GEMINI_RATE_LIMITED.inc()
+            if is_rate_limit_error(e) and attempt < max_retries - 1:
+                GEMINI_RETRIES.inc()
+                wait_time = rate_limiter.report_rate_limited(attempt)
+                print(f"⚠️ Rate limit hit, backing off {wait_time:.1f} seconds...")
                 continue
             else:
                 return None, e
     return None, Exception("Max retries exceeded")
 
+def stream_with_retry(model, prompt, generation_config, safety_settings, max_retries=GEMINI_MAX_RETRIES,
+                      priority=INTERACTIVE):
+    """
+    Streaming counterpart of generate_with_retry, yielding text chunks
+    A rate-limit error is only retried before the first chunk has been sent
+    """
+    for attempt in range(max_retries):
+        acquire_slot(prompt, generation_config, priority)
+        started = False
+        try:
+            response = model.generate_content(
+                prompt,
+                generation_config=generation_config,
+                safety_settings=safety_settings,
+                stream=True
+            )
+            for chunk in response:
+                if chunk.text:
+                    started = True
+                    yield chunk.text
+            return
+        except Exception as e:
+            if is_rate_limit_error(e):
+                GEMINI_RATE_LIMITED.inc()
+            if started or not is_rate_limit_error(e) or attempt == max_retries - 1:
+                raise
+            GEMINI_RETRIES.inc()
+            wait_time = rate_limiter.report_rate_limited(attempt)
+            print(f"⚠️ Rate limit hit, backing off {wait_time:.1f} seconds...")
+
 def normalize_query(query):
-    return query.strip().lower()
+    """Case, whitespace and trailing punctuation don't change the question"""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!. ").lower()
 
 def extract_text_from_file(file_content, filename):
+    """
+    TextCache extractor. PDF errors and timeouts propagate, so the ingestion job
+    retries the file instead of the cache keeping empty or partial text
+    """
     if not file_content:
         return ""
     ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
     if ext == 'pdf':
-        try:
-            if len(file_content) < 100:
-                return ""
-            pdf_reader = PdfReader(io.BytesIO(file_content))
-            text = ""
-            for page in pdf_reader.pages:
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n\n"
-                except:
-                    continue
-            return text.strip()
-        except Exception as e:
-            print(f"❌ PDF extraction error for {filename}: {e}")
+        if len(file_content) < 100:
             return ""
+        return extract_pdf_text(file_content, filename)
     else:
         try:
             return file_content.decode('utf-8', errors='ignore')
         except:
             return str(file_content)
 
+# Extracted text keyed by content hash, filled at upload time and reused by /chat
+text_cache = TextCache(TEXT_CACHE_DIR, extract_text_from_file)
+
+# Local uploads are stored once per distinct content (see make_namespace)
+upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='upload')
+
+# Chunk-level BM25 index over the documents, kept in sync on upload/delete and rebuilt by /reindex
+search_index = BM25Index(chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+
+# Optional semantic index over the same chunks (ENABLE_EMBEDDINGS=1, needs numpy + sentence-transformers)
+embedding_index = None
+if ENABLE_EMBEDDINGS:
+    embedding_index = EmbeddingIndex(EMBEDDING_INDEX_DIR, EMBED_MODEL, batch_size=EMBED_BATCH_SIZE,
+                                     quantize=EMBED_QUANTIZE, cache_dir=EMBED_CACHE_DIR, workers=EMBED_WORKERS,
+                                     backend=EMBED_BACKEND, onnx_file=EMBED_ONNX_FILE)
+
+def document_path(namespace, filename):
+    """Local path of a document (a mirrored copy when documents live in Cloudinary)"""
+    if mirror:
+        return mirror.resolve(filename)
+    return os.path.join(namespace.data_dir, filename)
+
+def index_document(namespace, filename, key, report=None):
+    """
+    Extract (through the text cache) and (re)index one document
+    The indexes are keyed by content key, so a document shared by several
+    namespaces is extracted and indexed once
+    """
+    report = report or (lambda stage: None)
+    report('extracting')
+    with span('extract'):
+        # Local keys are content digests; Cloudinary keys (version:etag) are not
+        text = text_cache.get_text(document_path(namespace, filename), digest=None if mirror else key)
+    if embedding_index and not embedding_index.has_document(key, key):
+        report('embedding')
+        with span('embed'):
+            embedding_index.add_document(key, chunk_text(text, CHUNK_SIZE, CHUNK_OVERLAP), key=key)
+    report('indexing')
+    with span('index'):
+        return search_index.add_document(key, text, key=key)
+
+def unindex_document(key):
+    search_index.remove_document(key)
+    if embedding_index:
+        embedding_index.remove_document(key)
+
+def retrieve(query, top_k, corpus):
+    """
+    BM25 hits among the corpus's documents, fused with embedding hits by reciprocal
+    rank when the vector index is on. Hit sources are the corpus's filenames
+    """
+    names = {key: filename for filename, key in distinct_documents(corpus).items()}
+    keys = set(names)
+    hits = search_index.search(query, top_k, sources=keys)
+    if embedding_index:
+        hits = reciprocal_rank_fusion([hits, embedding_index.search(query, top_k, sources=keys)], top_k)
+    hits = hits or search_index.leading_chunks(top_k, sources=keys)
+    return [dict(hit, source=names[hit['source']]) for hit in hits]
+
+def ingest_document(namespace, filename, report=None):
+    """Ingestion job handler: index one document unless it is gone, a duplicate or current"""
+    corpus = namespace.corpus.snapshot.keys
+    if filename not in distinct_documents(corpus):
+        return
+    key = corpus[filename]
+    if search_index.has_document(key, key):
+        return
+    index_document(namespace, filename, key, report)
+
+def ingest_handler(namespace):
+    """JobQueue handler bound to one namespace's documents"""
+    return lambda filename, report: ingest_document(namespace, filename, report)
+
+# Uploads, /reindex and /chat hand indexing work to these background workers
+ingest_queue = JobQueue(workers=INGEST_WORKERS, max_retries=INGEST_MAX_RETRIES)
+
+REGISTRY.gauge("chatbot_ingest_pending_files", "Files queued or being ingested",
+               ingest_queue.pending_count)
+REGISTRY.gauge("chatbot_rate_limit_queue_depth", "Gemini calls waiting for a rate-limit slot",
+               lambda: rate_limiter.metrics()['queue_depth'])
+REGISTRY.gauge("chatbot_rate_limit_paused_seconds", "Time left in the back-off after a 429",
+               lambda: rate_limiter.metrics()['paused_seconds'])
+
+# Finished answers keyed by (normalized query, documents and their indexing state, model, config)
+answer_cache = AnswerCache(max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+
+# Identical questions asked at the same time share one upstream stream
+inflight_answers = SingleFlight()
+generation_slots = threading.BoundedSemaphore(MAX_CONCURRENT_GENERATIONS)
+
+# Map-reduce answering: per-shard notes keyed by (normalized query, shard hash), and the
+# pool that caps how many map calls run at once
+shard_cache = AnswerCache(max_entries=ANSWER_CACHE_SIZE * MAP_REDUCE_MAX_SHARDS, ttl=ANSWER_CACHE_TTL)
+map_pool = ThreadPoolExecutor(max_workers=MAP_REDUCE_CONCURRENCY, thread_name_prefix='map')
+
+def use_map_reduce(corpus):
+    """True when the corpus's indexed text is well past what one prompt can hold"""
+    return bool(MAP_REDUCE_THRESHOLD_TOKENS) and \
+        search_index.text_chars(set(corpus.values())) // CHARS_PER_TOKEN > MAP_REDUCE_THRESHOLD_TOKENS
+
+def map_prompt(query, excerpts):
+    return f"""You are extracting facts for a later summary step.
+
+From the excerpts below, list every fact that helps answer the question, each followed
+by the DOCUMENT name it came from in square brackets. Use only the excerpts. If nothing
+in them is relevant, reply with exactly: NONE
+
+EXCERPTS:
+{excerpts}
+
+QUESTION: {query}
+
+FACTS:"""
+
+def reduce_prompt(query, file_count, file_list, notes):
+    sections = "".join(f"\n\n--- Notes from {', '.join(sources)} ---\n{text}" for sources, text in notes)
+    return f"""You are a strict document analysis assistant.
+
+CRITICAL INSTRUCTIONS:
+1. Answer ONLY using the notes below, which were extracted from the documents.
+2. If the answer is not in the notes, you MUST state: "I cannot find this information in the provided documents."
+3. Do NOT use outside knowledge, general facts, or assumptions.
+4. Merge overlapping notes and keep the [DOCUMENT] attribution for every fact you use.
+
+DOCUMENTS ({file_count} file(s)):
+{file_list}
+
+NOTES:{sections}
+
+USER QUESTION: {query}
+
+ANSWER:"""
+
+def map_shards(query, shards):
+    """
+    Run the extraction prompt over every shard concurrently (at most MAP_REDUCE_CONCURRENCY
+    at a time) and return [(sources, notes)] for the shards that found something
+    Raises if every shard failed
+    """
+    normalized = normalize_query(query)
+
+    def extract(shard):
+        excerpts = format_excerpts(shard)
+        key = AnswerCache.make_key(normalized, hashlib.sha256(excerpts.encode('utf-8')).hexdigest(),
+                                   model_name, MAP_GENERATION_CONFIG)
+        cached = shard_cache.get(key)
+        if cached is not None:
+            MAP_SHARDS.inc(result='hit')
+            return cached[0]
+        # Behind interactive calls: one map-reduce answer should not starve everyone else's chat
+        response, error = generate_with_retry(get_model(), map_prompt(query, excerpts),
+                                              MAP_GENERATION_CONFIG, SAFETY_SETTINGS, priority=BACKGROUND)
+        if error:
+            MAP_SHARDS.inc(result='failed')
+            raise error
+        MAP_SHARDS.inc(result='miss')
+        notes = response.text.strip()
+        shard_cache.put(key, [notes])
+        return notes
+
+    futures = [map_pool.submit(extract, shard) for shard in shards]
+    notes, errors = [], []
+    for shard, future in zip(shards, futures):
+        try:
+            text = future.result()
+        except Exception as e:
+            print(f"❌ Map step failed: {e}")
+            errors.append(e)
+            continue
+        if text and text.upper() != 'NONE':
+            notes.append((list(dict.fromkeys(hit['source'] for hit in shard)), text))
+    if errors and len(errors) == len(shards):
+        raise errors[0]
+    return notes
+
+def distinct_documents(corpus):
+    """The corpus with one name per content key, so duplicate uploads are indexed once"""
+    distinct = {}
+    seen = set()
+    for filename in sorted(corpus):
+        key = corpus[filename]
+        if key not in seen:
+            distinct[filename] = key
+            seen.add(key)
+    return distinct
+
+def sync_search_index(namespace):
+    """
+    Queue ingestion of a namespace's new or changed documents
+    Returns the ids of the jobs covering its unindexed documents: the one queued
+    now and any already in flight (an upload's own job). Empty when all are indexed
+    """
+    active = ingest_queue.active_jobs(namespace.name)
+    unindexed = [filename for filename, key in distinct_documents(namespace.corpus.snapshot.keys).items()
+                 if not search_index.has_document(key, key)]
+    job_ids = {active[filename] for filename in unindexed if filename in active}
+    stale = [filename for filename in unindexed if filename not in active]
+    if stale:
+        job_ids.add(ingest_queue.submit('sync', stale, ingest_handler(namespace), namespace.name).id)
+    return sorted(job_ids)
+
+def prune_indexes():
+    """Drop index entries no namespace refers to any more"""
+    wanted = set()
+    for namespace in namespaces.loaded():
+        wanted.update(namespace.corpus.snapshot.keys.values())
+    indexed = set(search_index.sources)
+    if embedding_index:
+        indexed.update(embedding_index.sources)
+    for source in indexed - wanted:
+        unindex_document(source)
+
+def namespace_dirs():
+    """Documents directories of every namespace on disk, loaded or not (they share BLOB_DIR)"""
+    return [DATA_DIR] + [entry.path for entry in os.scandir(DATA_DIR) if entry.is_dir()]
+
+def make_namespace(name, data_dir):
+    """
+    A namespace and its corpus registry
+    Cloudinary keys are version:etag from the listing, so unchanged objects are never
+    downloaded; local keys are content digests from the blob store, or hashed once
+    for files that predate it
+    """
+    if mirror:
+        def scan(previous):
+            listed_at = time.time() - storage.list_ttl  # the listing may come from list_files' cache
+            files = storage.list_files()
+            mirror.refresh(files, listed_at)
+            return [Document(f['name'], remote_key(f), f.get('bytes') or 0, 0) for f in files]
+        namespace = Namespace(name, data_dir, CorpusRegistry(scan))
+    else:
+        blob_store = BlobStore(BLOB_DIR, data_dir, peer_dirs=namespace_dirs)
+        corpus = CorpusRegistry(lambda previous: scan_directory(data_dir, previous, blob_store.digests()),
+                                watch_dir=data_dir)
+        namespace = Namespace(name, data_dir, corpus, blob_store)
+    # Files added or removed behind the app's back (copied in, another worker's upload)
+    # are picked up by polling and queued for ingestion
+    namespace.corpus.on_change(lambda snapshot: sync_search_index(namespace))
+    return namespace
+
+def expire_namespace(namespace):
+    """Forget an idle namespace's documents (its directory is removed afterwards)"""
+    if namespace.blob_store:
+        for filename in namespace.corpus.snapshot.names:
+            text_cache.evict(local_path(namespace, filename))
+        namespace.blob_store.clear()
+    prune_indexes()
+
+# Each session's documents (DATA_DIR/<namespace>/, linked from the shared blob store)
+# with its own versioned corpus snapshot, whose fingerprint keys the answer cache
+namespaces = NamespaceManager(DATA_DIR, make_namespace, idle_seconds=NAMESPACE_IDLE_SECONDS,
+                              poll_interval=CORPUS_POLL_INTERVAL, on_expire=expire_namespace)
+REGISTRY.gauge("chatbot_namespaces", "Document namespaces loaded in this process",
+               lambda: len(namespaces.loaded()))
+
+def namespace_for(session):
+    """
+    The caller's namespace, keyed by a random id kept in their session (created on
+    first use). Everyone shares one namespace when SESSION_NAMESPACES is off or
+    documents live in Cloudinary
+    """
+    if not SESSION_NAMESPACES or mirror:
+        return namespaces.get(SHARED)
+    name = session.get('namespace')
+    if not NamespaceManager.valid_name(name) or name == SHARED:
+        name = session['namespace'] = NamespaceManager.new_name()
+    namespace = namespaces.get(name)
+    namespace.touch()
+    return namespace
+
+def list_documents(namespace):
+    """Names shown by /files"""
+    return namespace.corpus.snapshot.names
+
+def local_path(namespace, filename):
+    """Where a document is (or would be) on disk, without fetching it"""
+    if mirror:
+        return mirror.path_for(filename)
+    return os.path.join(namespace.data_dir, filename)
+
+def save_document(namespace, fileobj, filename):
+    """
+    Store one uploaded file (Cloudinary when configured, else the blob store)
+    Returns the name it was stored under, which differs from filename when a
+    different document already has that name
+    """
+    with span('upload'):
+        if use_cloudinary and storage:
+            storage.upload_file(fileobj, filename)
+            return filename
+        return namespace.blob_store.add(fileobj, filename)
+
+def save_documents(namespace, uploads):
+    """
+    Store several (fileobj, filename) uploads concurrently and queue their ingestion
+    Returns (stored names, ingestion job)
+    """
+    futures = [upload_pool.submit(save_document, namespace, fileobj, filename) for fileobj, filename in uploads]
+    saved = []
+    for future in futures:
+        try:
+            saved.append(future.result())
+        except Exception as e:
+            print(f"Upload error: {e}")
+    namespace.corpus.refresh(notify=False)
+    return saved, ingest_queue.submit('upload', saved, ingest_handler(namespace), namespace.name)
+
+def remove_document(namespace, filename):
+    """Delete one document and whatever was derived only from it"""
+    if use_cloudinary and storage:
+        storage.delete_file(filename)
+        text_cache.evict(mirror.path_for(filename))
+        mirror.remove(filename)
+    else:
+        filename = secure_filename(filename)
+        text_cache.evict(local_path(namespace, filename))
+        namespace.blob_store.remove(filename)
+    namespace.corpus.refresh(notify=False)
+    prune_indexes()
+
+def rebuild_index(namespace):
+    """Re-index every document of a namespace from scratch. Returns (file_count, job)"""
+    if storage:
+        storage.invalidate_listing()
+    files = namespace.corpus.refresh(notify=False).keys
+    for key in set(files.values()):
+        unindex_document(key)
+    prune_indexes()
+    namespace.answers_generation += 1  # re-indexed content must not replay this namespace's old answers
+    return len(files), ingest_queue.submit('rebuild', list(distinct_documents(files)), ingest_handler(namespace),
+                                         namespace.name)
+
+def clear_documents(namespace):
+    """Delete a namespace's local files (and mirrored copies) and whatever was built only from them"""
+    for filename in namespace.corpus.snapshot.names:
+        text_cache.evict(local_path(namespace, filename))
+    if namespace.blob_store:
+        namespace.blob_store.clear()
+        if os.path.isdir(namespace.data_dir):
+            for entry in os.scandir(namespace.data_dir):
+                if entry.is_file():  # files copied in by hand are not in the blob store
+                    try:
+                        os.remove(entry.path)
+                    except:
+                        pass
+    if mirror:
+        mirror.clear()
+    namespace.corpus.refresh(notify=False)
+    prune_indexes()
+    if namespace.name != SHARED:
+        namespaces.discard(namespace.name)
+
+def chat_events(query, namespace, debug=False):
+    """
+    The /chat pipeline over one namespace's documents, as a generator of SSE payload dicts
+    Shared by the Flask route and the ASGI app (app_asgi.py). With debug set, a
+    final {'timing': {stage: seconds}} event follows the done event
+    """
+    timings = {}
+    start = time.perf_counter()
+    first_chunk_at = None
+    for event in _chat_pipeline(query, namespace, timings):
+        if first_chunk_at is None and 'content' in event:
+            first_chunk_at = time.perf_counter()
+            TTFT_SECONDS.observe(first_chunk_at - start)
+        yield event
+    end = time.perf_counter()
+    if first_chunk_at is not None:
+        STREAM_SECONDS.observe(end - first_chunk_at)
+    if debug:
+        timings['total'] = round(end - start, 6)
+        if first_chunk_at is not None:
+            timings['time_to_first_token'] = round(first_chunk_at - start, 6)
+        yield {'timing': timings}
+
+def answer_cache_key(query, namespace, snapshot):
+    """
+    Key for (normalized query, namespace generation, document set, which of its
+    documents are indexed, model, config)
+    An answer produced while ingestion is still running is stored under the
+    half-indexed state it was retrieved from, so it is never replayed once
+    indexing finishes
+    """
+    indexed = ''.join('1' if search_index.has_document(key, key) else '0'
+                      for key in distinct_documents(snapshot.keys).values())
+    fingerprint = f"{namespace.answers_generation}:{snapshot.fingerprint}:{indexed}"
+    return AnswerCache.make_key(normalize_query(query), fingerprint, model_name, GENERATION_CONFIG)
+
+def replay_answer(cache_key, timings):
+    """Events replaying a cached answer, or None on a miss"""
+    with span('answer_cache', timings):
+        cached = answer_cache.get_entry(cache_key)
+    ANSWER_CACHE.inc(result='miss' if cached is None else 'hit')
+    if cached is None:
+        return None
+    chunks, context_report = cached
+    return [{'content': text} for text in chunks] + [{'done': True, 'context': context_report}]
+
+def _chat_pipeline(query, namespace, timings):
+    try:
+        # 1. Current document set (the caller's namespace only)
+        with span('list_files', timings):
+            snapshot = namespace.corpus.snapshot
+            corpus = snapshot.keys
+        
+        file_count = len(corpus)
+        file_list = ", ".join(corpus)
+        
+        # 2. Replay a cached answer for the same question against the same documents,
+        #    before any retrieval work
+        cache_key = answer_cache_key(query, namespace, snapshot)
+        replay = replay_answer(cache_key, timings)
+        if replay:
+            yield from replay
+            return
+        
+        # 3. Retrieve the most relevant chunks (new or changed files are ingested in the background)
+        with span('sync_index', timings):
+            job_ids = sync_search_index(namespace)
+            if job_ids and not any(search_index.has_document(key) for key in corpus.values()):
+                # None of these documents is indexed yet (first question after an upload or a cold start)
+                deadline = time.monotonic() + INGEST_WAIT_TIMEOUT
+                for job_id in job_ids:
+                    ingest_queue.wait(job_id, timeout=max(0.0, deadline - time.monotonic()))
+                # Retrieval now sees the freshly indexed documents; so must the key
+                cache_key = answer_cache_key(query, namespace, snapshot)
+                replay = replay_answer(cache_key, timings)
+                if replay:
+                    yield from replay
+                    return
+        map_reduce = use_map_reduce(corpus)
+        with span('retrieve', timings):
+            hits = retrieve(query, MAP_REDUCE_TOP_K if map_reduce else RETRIEVAL_TOP_K, corpus)
+        
+        # 4. Pack them into the input token budget, fairly across documents
+        #    (or, for a large corpus, into several budget-sized shards)
+        with span('pack_context', timings):
+            budget = CONTEXT_TOKEN_BUDGET - PROMPT_OVERHEAD_TOKENS - estimate_tokens(file_list + query)
+            if map_reduce:
+                shards, context_report = shard_context(hits, max(budget, 0), MAP_REDUCE_MAX_SHARDS)
+                hits = [hit for shard in shards for hit in shard]
+            else:
+                hits, context_report = pack_context(hits, max(budget, 0))
+            all_text = format_excerpts(hits)
+        
+        # 5. Strict Check
+        if not all_text.strip():
+            yield {'content': 'I cannot answer this question because there are no documents uploaded. Please upload relevant documents first.', 'done': True}
+            return
+            
+        # 6. Strict Prompt (map-reduce mode builds a reduce prompt once the shard notes are in)
+        prompt_start = time.perf_counter()
+        if map_reduce:
+            prompt = None
+        else:
+            prompt = f"""You are a strict document analysis assistant.
+        
+        CRITICAL INSTRUCTIONS:
+        1. Answer ONLY using the information provided in the documents below.
+        2. If the answer is not explicitly in the documents, you MUST state: "I cannot find this information in the provided documents."
+        3. Do NOT use outside knowledge, general facts, or assumptions.
+        
+        DOCUMENTS ({file_count} file(s)):
+        {file_list}
+        
+        RELEVANT EXCERPTS:
+        {all_text}
+        
+        USER QUESTION: {query}
+        
+        ANSWER:"""
+        _record_stage('prompt', time.perf_counter() - prompt_start, timings)
+        
+        def produce():
+            final_prompt = prompt
+            if map_reduce:
+                # Inside the flight, so identical concurrent questions share the map calls too
+                with span('map', timings):
+                    notes = map_shards(query, shards)
+                final_prompt = reduce_prompt(query, file_count, file_list, notes)
+            with generation_slots:
+                answer = []
+                for text in stream_with_retry(get_model(), final_prompt, GENERATION_CONFIG, SAFETY_SETTINGS):
+                    answer.append(text)
+                    yield text
+            answer_cache.put(cache_key, answer, context_report)
+        
+        # Stream the response (joining an identical request that is already running)
+        generation_start = time.perf_counter()
+        first_chunk_at = None
+        for text in inflight_answers.stream(cache_key, produce):
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+                _record_stage('first_chunk', first_chunk_at - generation_start, timings)
+            yield {'content': text}
+        if first_chunk_at is not None:
+            _record_stage('stream', time.perf_counter() - first_chunk_at, timings)
+        
+        # Send done signal, with what made it into the prompt
+        yield {'done': True, 'context': context_report}
+
+    except Exception as e:
+        print(f"Chat error: {e}")
+        yield {'error': str(e), 'done': True}
+
+def warm_indexes():
+    """Queue ingestion of the documents already on disk, in every namespace"""
+    if not SESSION_NAMESPACES or mirror:
+        existing = [namespaces.get(SHARED)]
+    else:
+        existing = namespaces.load_all()
+    for namespace in existing:
+        namespace.corpus.refresh(notify=False)
+        sync_search_index(namespace)
+
+# Slow components load on a background thread; under gunicorn the master has bound
+# the port before workers import this module, so requests are served meanwhile
+warmup = WarmUp()
+warmup.add('gemini', get_model, enabled=gemini_configured)
+warmup.add('pdf', warm_up_pdf)
+warmup.add('cloudinary', storage.connect if storage else None, enabled=use_cloudinary)
+warmup.add('embeddings', lambda: embedding_index.embed(["warm-up"], cache=False), enabled=bool(embedding_index))
+warmup.add('indexes', warm_indexes)
+# PDF worker processes (forkserver/spawn) re-import the main module as __mp_main__
+# when the app is run as a script; they must not start the app's threads
+if __name__ != '__mp_main__':
+    if WARMUP:
+        warmup.start()
+    namespaces.start()
+
+def _record_stage(stage, seconds, timings):
+    """span() for stages that are not one with block (streamed, or around the prompt literal)"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings[stage] = round(seconds, 6)
+
 @app.route('/')
 def serve_frontend():
     return send_from_directory('web', 'index.html')
@@ -126,70 +781,53 @@ def upload_file():
     if 'files' not in request.files:
         return jsonify({'error': 'No files provided'}), 400
     files = request.files.getlist('files')
-    uploaded = []
-    for file in files:
-        if file and file.filename and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            try:
-                if use_cloudinary and storage:
-                    storage.upload_file(file, filename)
-                    uploaded.append(filename)
-                else:
-                    file_path = os.path.join(DATA_DIR, filename)
-                    file.save(file_path)
-                    uploaded.append(filename)
-            except Exception as e:
-                print(f"Upload error: {e}")
-    return jsonify({'message': f'Uploaded {len(uploaded)} file(s)', 'files': uploaded})
+    uploads = [(file.stream, secure_filename(file.filename)) for file in files
+               if file and file.filename and allowed_file(file.filename)]
+    uploaded, job = save_documents(namespace_for(session), uploads)
+    return jsonify({'message': f'Uploaded {len(uploaded)} file(s)', 'files': uploaded, 'job_id': job.id})
 
 @app.route('/files', methods=['GET'])
 def list_files():
-    if use_cloudinary and storage:
-        files = [f['name'] for f in storage.list_files()]
-    else:
-        files = []
-        if os.path.exists(DATA_DIR):
-            files = [f for f in os.listdir(DATA_DIR) 
-                    if os.path.isfile(os.path.join(DATA_DIR, f)) and not f.startswith('.')]
-    return jsonify({'files': files})
+    return jsonify({'files': list_documents(namespace_for(session))})
 
 @app.route('/files/<filename>', methods=['DELETE'])
 def delete_file(filename):
     try:
-        if use_cloudinary and storage:
-            storage.delete_file(filename)
-        else:
-            file_path = os.path.join(DATA_DIR, secure_filename(filename))
-            if os.path.exists(file_path):
-                os.remove(file_path)
+        remove_document(namespace_for(session), filename)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     return jsonify({'message': f'Deleted {filename}'})
 
 @app.route('/reindex', methods=['POST'])
 def reindex():
-    # Count actual files
-    file_count = 0
-    if os.path.exists(DATA_DIR):
-        files = [f for f in os.listdir(DATA_DIR) 
-                if os.path.isfile(os.path.join(DATA_DIR, f)) and not f.startswith('.')]
-        file_count = len(files)
+    file_count, job = rebuild_index(namespace_for(session))
+    return jsonify({'message': f'Indexing {file_count} file(s)', 'file_count': file_count,
+                    'job_id': job.id}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = ingest_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """SSE stream of job snapshots until the job finishes"""
+    if ingest_queue.get(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    def generate():
+        for snapshot in ingest_queue.watch(job_id):
+            yield f"data: {json.dumps(snapshot)}\n\n"
     
-    return jsonify({'message': f'Indexed {file_count} file(s)', 'file_count': file_count, 'document_count': file_count})
+    return Response(generate(), mimetype='text/event-stream')
 
 @app.route('/clear-session', methods=['POST'])
 def clear_session():
-    """Clear session and delete all local files"""
+    """Clear session and delete its documents"""
     try:
-        # Delete local files
-        if os.path.exists(DATA_DIR):
-            for filename in os.listdir(DATA_DIR):
-                file_path = os.path.join(DATA_DIR, filename)
-                if os.path.isfile(file_path):
-                    try:
-                        os.remove(file_path)
-                    except:
-                        pass
+        clear_documents(namespace_for(session))
         session.clear()
         print("✅ Session cleared")
         return '', 200
@@ -200,7 +838,7 @@ def clear_session():
 @app.route('/chat', methods=['POST'])
 def chat():
     """Streaming RAG Endpoint"""
-    if not model:
+    if not get_model():
         return jsonify({'error': 'Gemini API not configured'}), 500
     
     data = request.json
@@ -208,82 +846,26 @@ def chat():
     if not query:
         return jsonify({'error': 'No query provided'}), 400
     
+    debug = bool(request.headers.get('X-Debug-Timing'))
+    namespace = namespace_for(session)  # resolved now: the stream outlives the request context
+    
     def generate():
-        try:
-            # 1. Fetch current file list
-            local_files = []
-            if os.path.exists(DATA_DIR):
-                local_files = [f for f in os.listdir(DATA_DIR) 
-                              if os.path.isfile(os.path.join(DATA_DIR, f)) and not f.startswith('.')]
-            
-            file_count = len(local_files)
-            file_list = ", ".join(local_files)
-            
-            # 2. Extract text fresh
-            all_text = ""
-            if file_count > 0:
-                for filename in local_files:
-                    try:
-                        with open(os.path.join(DATA_DIR, filename), 'rb') as f:
-                            content = f.read()
-                        text = extract_text_from_file(content, filename)
-                        if text and text.strip():
-                             all_text += f"\n\n{'='*60}\nDOCUMENT: {filename}\n{'='*60}\n{text}\n"
-                    except Exception as e:
-                        print(f"Error reading {filename}: {e}")
-            
-            # 3. Strict Check
-            if not all_text.strip():
-                yield f"data: {json.dumps({'content': 'I cannot answer this question because there are no documents uploaded. Please upload relevant documents first.', 'done': True})}\n\n"
-                return
-                
-            # 4. Strict Prompt
-            prompt = f"""You are a strict document analysis assistant.
-            
-            CRITICAL INSTRUCTIONS:
-            1. Answer ONLY using the information provided in the documents below.
-            2. If the answer is not explicitly in the documents, you MUST state: "I cannot find this information in the provided documents."
-            3. Do NOT use outside knowledge, general facts, or assumptions.
-            
-            DOCUMENTS ({file_count} file(s)):
-            {file_list}
-            
-            CONTENT:
-            {all_text}
-            
-            USER QUESTION: {query}
-            
-            ANSWER:"""
-            
-            generation_config = {"temperature": 0.0, "max_output_tokens": 2048}
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-            ]
-            
-            # Stream the response
-            response = model.generate_content(
-                prompt, 
-                generation_config=generation_config, 
-                safety_settings=safety_settings,
-                stream=True
-            )
-            
-            for chunk in response:
-                if chunk.text:
-                    yield f"data: {json.dumps({'content': chunk.text})}\n\n"
-            
-            # Send done signal
-            yield f"data: {json.dumps({'done': True})}\n\n"
-
-        except Exception as e:
-            print(f"Chat error: {e}")
-            yield f"data: {json.dumps({'error': str(e), 'done': True})}\n\n"
+        for event in chat_events(query, namespace, debug=debug):
+            yield f"data: {json.dumps(event)}\n\n"
     
     return Response(generate(), mimetype='text/event-stream')
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Which components are warm; 503 until all enabled ones are"""
+    status = warmup.status()
+    return jsonify(status), (200 if status['ready'] else 503)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5001))
@@ -0,0 +1,136 @@
+"""
+Benchmark: chunk embedding throughput, with and without the embedding cache
+
+Usage: python -m benchmarks.bench_embeddings [--chunks 2000] [--batch-sizes 16,32,64] [--workers 1,4]
+                                             [--backend torch|onnx] [--onnx-file ...] [--fake]
+
+Builds a synthetic corpus of 200-word chunks and, for every batch size x worker
+count, runs in a fresh interpreter (so peak RSS is that configuration's own):
+  cold     every chunk embedded, cache empty
+  rebuild  the same corpus with 10% of its chunks edited (what a re-index costs)
+  warm     the same corpus again, every chunk from the cache
+--fake swaps the model for a hash-based encoder that sleeps --fake-ms per chunk
+with the GIL released, to measure the pipeline and cache without sentence-transformers.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.offline_suite import peak_rss_mb
+from benchmarks.synthetic import make_text_document
+from embedding_cache import CachedEncoder, EmbeddingCache
+from retrieval import chunk_text
+
+EDITED_FRACTION = 0.1
+
+
+class FakeEncoder:
+    """encode() like SentenceTransformer's: deterministic unit vectors, ms_per_chunk of simulated compute"""
+
+    def __init__(self, dim=384, ms_per_chunk=2.0):
+        self.dim = dim
+        self.ms_per_chunk = ms_per_chunk
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        import numpy as np
+        time.sleep(self.ms_per_chunk * len(texts) / 1000)
+        vectors = np.stack([np.random.default_rng(abs(hash(text))).standard_normal(self.dim) for text in texts])
+        return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype('float32')
+
+
+def make_chunks(count, seed=0):
+    chunks = []
+    doc = 0
+    while len(chunks) < count:
+        chunks.extend(chunk_text(make_text_document(60, seed=seed + doc), 200, 40))
+        doc += 1
+    return chunks[:count]
+
+
+def edit_chunks(chunks, fraction, seed=1):
+    rng = random.Random(seed)
+    edited = list(chunks)
+    for i in rng.sample(range(len(chunks)), int(len(chunks) * fraction)):
+        edited[i] = f"{edited[i]} (revised {i})"
+    return edited
+
+
+def run_config(args, batch_size, workers):
+    """Runs in the child process; returns one result row"""
+    model = FakeEncoder(ms_per_chunk=args.fake_ms) if args.fake else None
+    chunks = make_chunks(args.chunks)
+    edited = edit_chunks(chunks, EDITED_FRACTION)
+    with tempfile.TemporaryDirectory(prefix='embed-cache-') as cache_dir:
+        cache = EmbeddingCache(cache_dir, args.model, args.backend, args.onnx_file)
+        encoder = CachedEncoder(args.model, cache, batch_size=batch_size, workers=workers, backend=args.backend,
+                                onnx_file=args.onnx_file, model=model)
+        load_start = time.perf_counter()
+        encoder.get_model()
+        encoder.embed_uncached(chunks[:batch_size])  # first call pays one-off kernel/graph set-up
+        row = {'batch_size': batch_size, 'workers': workers, 'load_seconds': round(time.perf_counter() - load_start, 2)}
+        for phase, texts in (('cold', chunks), ('rebuild', edited), ('warm', chunks)):
+            misses = encoder.misses
+            start = time.perf_counter()
+            encoder.encode(texts)
+            elapsed = time.perf_counter() - start
+            row[phase] = {'chunks_per_sec': round(len(texts) / elapsed, 1), 'seconds': round(elapsed, 3),
+                          'embedded': encoder.misses - misses}
+        row['cache_mb'] = round(sum(os.path.getsize(os.path.join(encoder.cache.model_dir, name))
+                                    for name in os.listdir(encoder.cache.model_dir)) / (1024 * 1024), 2)
+    row['peak_rss_mb'] = peak_rss_mb()
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=2000)
+    parser.add_argument('--batch-sizes', default='16,32,64')
+    parser.add_argument('--workers', default=f"1,{os.cpu_count() or 1}", help='comma-separated worker counts')
+    parser.add_argument('--model', default='sentence-transformers/all-MiniLM-L6-v2')
+    parser.add_argument('--backend', default='torch', choices=['torch', 'onnx'])
+    parser.add_argument('--onnx-file', help="e.g. onnx/model_qint8_avx512.onnx")
+    parser.add_argument('--fake', action='store_true', help='no model: hash-based vectors')
+    parser.add_argument('--fake-ms', type=float, default=2.0, help='simulated compute per chunk with --fake')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        batch_size, workers = map(int, args.child.split(','))
+        print(json.dumps(run_config(args, batch_size, workers)))
+        return
+
+    print(f"{args.chunks} chunks, model {'fake' if args.fake else args.model} ({args.backend}), "
+          f"{os.cpu_count()} CPU cores, {int(EDITED_FRACTION * 100)}% edited for the rebuild")
+    print(f"\n{'batch':>6} {'workers':>7} {'load s':>7} {'cold c/s':>9} {'rebuild c/s':>12} {'warm c/s':>10} "
+          f"{'cache MB':>9} {'rss MB':>7}")
+    results = []
+    for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+        for workers in [int(w) for w in args.workers.split(',')]:
+            child = subprocess.run([sys.executable, '-m', 'benchmarks.bench_embeddings', *sys.argv[1:],
+                                    '--child', f"{batch_size},{workers}"],
+                                   capture_output=True, text=True, cwd=REPO_ROOT)
+            if child.returncode != 0:
+                print(f"{batch_size:>6} {workers:>7}  failed: {child.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(child.stdout.strip().splitlines()[-1])
+            results.append(r)
+            print(f"{batch_size:>6} {workers:>7} {r['load_seconds']:>7} {r['cold']['chunks_per_sec']:>9} "
+                  f"{r['rebuild']['chunks_per_sec']:>12} {r['warm']['chunks_per_sec']:>10} "
+                  f"{r['cache_mb']:>9} {r['peak_rss_mb']:>7}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'chunks': args.chunks, 'model': 'fake' if args.fake else args.model,
+                       'backend': args.backend, 'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
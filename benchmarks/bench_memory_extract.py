@@ -0,0 +1,115 @@
+"""
+Benchmark: keyword-split user_memory extraction vs the compiled single-pass extractor
+
+Usage: python -m benchmarks.bench_memory_extract [messages]
+"""
+import random
+import sys
+import time
+
+from user_memory import Memory, _scan_cues, backfill_memory_from_history, extract_user_info_from_conversation
+
+TEMPLATES = [
+    "My name is {name} and I live in {city}.",
+    "I'm {name}, based in {city}, and I love {thing}.",
+    "Can you summarize the {thing} report for me?",
+    "I really enjoy {thing}, but I am interested in {other} too.",
+    "What does section {n} say about {thing}?",
+    "I am from {city}. My hobby is {thing}.",
+    "Please compare the budget numbers in the two documents.",
+]
+NAMES = ["Alice", "Bob", "Chen", "Dana", "Eve", "Farid"]
+CITIES = ["Paris", "London", "Berlin", "Chennai", "Lagos", "Austin"]
+THINGS = ["chess", "hiking", "jazz", "machine learning", "cooking", "finance", "gardening", "robotics"]
+
+
+def make_messages(count, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice(TEMPLATES).format(name=rng.choice(NAMES), city=rng.choice(CITIES), thing=rng.choice(THINGS),
+                                         other=rng.choice(THINGS), n=rng.randint(1, 20))
+            for _ in range(count)]
+
+
+def legacy_extract(user_message, memory):
+    """The original split-per-keyword implementation"""
+    updated = False
+    message_lower = user_message.lower()
+    if "my name is" in message_lower or "i'm" in message_lower or "i am" in message_lower:
+        words = user_message.split()
+        for i, word in enumerate(words):
+            if word.lower() in ["name", "i'm", "i", "am", "called"]:
+                if i + 1 < len(words):
+                    name = words[i + 1].strip(".,!?")
+                    if name and len(name) > 1:
+                        memory["user_info"]["name"] = name
+                        updated = True
+                        break
+    for keyword in ["live in", "from", "located in", "based in"]:
+        if keyword in message_lower:
+            parts = user_message.lower().split(keyword)
+            if len(parts) > 1:
+                location = parts[1].split(".")[0].split(",")[0].strip()
+                if location:
+                    memory["user_info"]["location"] = location
+                    updated = True
+                    break
+    for keyword in ["like", "love", "enjoy", "interested in", "hobby", "passion"]:
+        if keyword in message_lower:
+            parts = user_message.lower().split(keyword)
+            if len(parts) > 1:
+                interest = parts[1].split(".")[0].split(",")[0].strip()
+                if interest and interest not in memory.get("interests", []):
+                    memory.setdefault("interests", []).append(interest)
+                    updated = True
+    return memory if updated else None
+
+
+def empty_memory():
+    return {"user_info": {}, "interests": [], "important_facts": []}
+
+
+def run(label, fn, messages, repeats=1):
+    """Best of `repeats` runs, so one scheduler hiccup doesn't decide the comparison"""
+    elapsed = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(messages)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(f"  {label:<26} {elapsed:>8.3f} s {len(messages) / elapsed:>12,.0f} msg/s")
+
+
+def compare(title, messages, repeats=1):
+    history = [{"user": message, "assistant": ""} for message in messages]
+    print(f"{title}: {len(messages):,} messages")
+
+    def legacy(batch):
+        memory = empty_memory()
+        for message in batch:
+            legacy_extract(message, memory)
+
+    def compiled(batch):
+        _scan_cues.cache_clear()  # every run starts cold, so repeats don't hit messages cached by the last one
+        memory = Memory(empty_memory())  # what load_memory returns
+        for message in batch:
+            extract_user_info_from_conversation(message, "", memory)
+
+    def batch_api(batch):
+        _scan_cues.cache_clear()
+        backfill_memory_from_history(history, empty_memory(), save=False)
+
+    run("legacy keyword split", legacy, messages, repeats)
+    run("compiled single pass", compiled, messages, repeats)
+    run("compiled batch backfill", batch_api, messages, repeats)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    # Typical chat: a few recurring interests, so the memory stays small
+    compare("recurring interests", make_messages(count), repeats=5)
+    # Long-lived memory: every message adds new interests, so dedup cost dominates (one run: the legacy
+    # dedup is quadratic)
+    compare("distinct interests", [f"I like topic {i}. I love thing {i}." for i in range(count // 2)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark: serial pypdf page loop vs page-parallel pdf_extract
+
+Usage: python -m benchmarks.bench_pdf_extract [pages ...]
+"""
+import io
+import sys
+import time
+
+from pypdf import PdfReader
+
+from benchmarks.synthetic import make_text_pdf
+from pdf_extract import PDF_WORKERS, extract_pdf_text, iter_pdf_pages
+
+
+def serial_extract(file_content):
+    """The original extract_text_from_file loop"""
+    pdf_reader = PdfReader(io.BytesIO(file_content))
+    text = ""
+    for page in pdf_reader.pages:
+        try:
+            page_text = page.extract_text()
+            if page_text:
+                text += page_text + "\n\n"
+        except:
+            continue
+    return text.strip()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def first_page_latency(file_content):
+    start = time.perf_counter()
+    next(iter_pdf_pages(file_content))
+    return time.perf_counter() - start
+
+
+def main():
+    page_counts = [int(arg) for arg in sys.argv[1:]] or [200, 500]
+    # Warm the process pool so worker start-up isn't billed to the first run
+    extract_pdf_text(make_text_pdf(64))
+    print(f"workers={PDF_WORKERS}")
+    print(f"{'pages':>6} {'MB':>6} {'serial s':>9} {'parallel s':>11} {'speedup':>8} {'1st page s':>11}")
+    for pages in page_counts:
+        pdf = make_text_pdf(pages)
+        serial_text, serial_time = timed(serial_extract, pdf)
+        parallel_text, parallel_time = timed(extract_pdf_text, pdf)
+        assert serial_text == parallel_text, "parallel output differs from serial output"
+        print(f"{pages:>6} {len(pdf) / 1e6:>6.2f} {serial_time:>9.2f} {parallel_time:>11.2f} "
+              f"{serial_time / parallel_time:>7.1f}x {first_page_latency(pdf):>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark: cold-start cost of the Flask app
+
+Usage: python -m benchmarks.bench_startup [--offline] [--runs 3]
+
+Every measurement runs in a fresh interpreter:
+  1. import time of each heavy dependency on its own (what lazy imports keep off start-up)
+  2. `import app_flask` time
+  3. time from process start to the first successful request (GET /files),
+     and to /ready reporting every enabled component warm
+--offline blanks the Gemini and Cloudinary credentials so nothing touches the network.
+"""
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['google.generativeai', 'pypdf', 'cloudinary', 'llama_index.core',
+                 'llama_index.embeddings.huggingface']
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def child_env(offline):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, PYTHONDONTWRITEBYTECODE='1')
+    if offline:
+        for name in ('GEMINI_API_KEY', 'CLOUDINARY_CLOUD_NAME', 'CLOUDINARY_API_KEY', 'CLOUDINARY_API_SECRET'):
+            env[name] = ''
+    return env
+
+
+def import_seconds(module, env, cwd):
+    result = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET.format(module=module)],
+                            capture_output=True, text=True, env=env, cwd=cwd)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def get_status(port, path):
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+        conn.request('GET', path)
+        status = conn.getresponse().status
+        conn.close()
+        return status
+    except OSError:
+        return None
+
+
+def serve_timings(env, cwd, timeout=300):
+    """(seconds to first 200 from /files, seconds to /ready == 200) for one server start"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, 'app_flask.py')],
+                               env=dict(env, PORT=str(port)), cwd=cwd,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first_request = ready = None
+    try:
+        while time.perf_counter() - start < timeout and ready is None:
+            if first_request is None and get_status(port, '/files') == 200:
+                first_request = time.perf_counter() - start
+            if first_request is not None and get_status(port, '/ready') == 200:
+                ready = time.perf_counter() - start
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait()
+    return first_request, ready
+
+
+def fmt(seconds):
+    return f"{seconds:.3f}s" if seconds is not None else "n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--offline', action='store_true', help='blank API credentials')
+    parser.add_argument('--runs', type=int, default=3, help='server starts (the median is reported)')
+    args = parser.parse_args()
+    env = child_env(args.offline)
+    cwd = tempfile.mkdtemp(prefix='chatbot-startup-')  # fresh ./data and caches
+
+    print("Heavy dependency import times (each in a fresh interpreter):")
+    for module in HEAVY_MODULES:
+        print(f"  {module:<38} {fmt(import_seconds(module, env, cwd))}")
+
+    print(f"\n  {'import app_flask':<38} {fmt(import_seconds('app_flask', env, cwd))}")
+
+    first, ready = [], []
+    for _ in range(args.runs):
+        f, r = serve_timings(env, cwd)
+        if f is not None:
+            first.append(f)
+        if r is not None:
+            ready.append(r)
+    print(f"\nServer start -> first successful request: {fmt(statistics.median(first) if first else None)}"
+          f" (median of {len(first)})")
+    print(f"Server start -> /ready (all components warm): {fmt(statistics.median(ready) if ready else None)}"
+          f" (median of {len(ready)})")
+
+
+if __name__ == '__main__':
+    main()
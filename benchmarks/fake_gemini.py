@@ -0,0 +1,76 @@
+"""
+Fake Gemini - Deterministic stand-in for genai.GenerativeModel, so the serving
+path can be benchmarked without an API key or network
+
+Streams a fixed-length answer at a configurable token rate after a configurable
+first-token delay, and can answer every Nth call with a 429 like the real API
+"""
+import itertools
+import threading
+import time
+
+
+class ResourceExhausted(Exception):
+    """Same class name and code as google.api_core's 429, so is_rate_limit_error() treats it alike"""
+    code = 429
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Drop-in for the generate_content() calls app_flask makes"""
+
+    def __init__(self, model_name='fake-gemini', tokens_per_second=50.0, first_token_delay=0.3,
+                 answer_tokens=120, tokens_per_chunk=8, rate_limit_every=0):
+        """
+        tokens_per_second: streaming speed once the first chunk has arrived
+        first_token_delay: seconds before the first chunk (queueing + prompt processing upstream)
+        answer_tokens: length of every answer, in words standing in for tokens
+        rate_limit_every: raise a 429 on every Nth call (0 = never)
+        """
+        self.model_name = model_name
+        self.tokens_per_second = tokens_per_second
+        self.first_token_delay = first_token_delay
+        self.answer_tokens = answer_tokens
+        self.tokens_per_chunk = tokens_per_chunk
+        self.rate_limit_every = rate_limit_every
+        self._calls = itertools.count(1)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.rate_limited = 0
+
+    def _answer_words(self, prompt):
+        # Deterministic per prompt, so cached and fresh answers can be compared
+        seed = sum(prompt.encode('utf-8')) % 9973
+        return [f"word{(seed + i) % 997}" for i in range(self.answer_tokens)]
+
+    def _check_rate_limit(self):
+        with self._lock:
+            call = next(self._calls)
+            self.calls = call
+            if self.rate_limit_every and call % self.rate_limit_every == 0:
+                self.rate_limited += 1
+                raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+
+    def _stream(self, words):
+        time.sleep(self.first_token_delay)
+        for i in range(0, len(words), self.tokens_per_chunk):
+            if i:
+                time.sleep(self.tokens_per_chunk / self.tokens_per_second)
+            yield FakeChunk(" ".join(words[i:i + self.tokens_per_chunk]) + " ")
+
+    def generate_content(self, prompt, generation_config=None, safety_settings=None, stream=False):
+        self._check_rate_limit()
+        words = self._answer_words(prompt)
+        if stream:
+            return self._stream(words)
+        time.sleep(self.first_token_delay + len(words) / self.tokens_per_second)
+        return FakeResponse(" ".join(words))
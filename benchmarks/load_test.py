@@ -0,0 +1,117 @@
+"""
+Load test: concurrent streaming /chat capacity of a running server
+
+Start the servers to compare, e.g.
+    gunicorn app_flask:app --bind :5001                 # current sync workers
+    uvicorn app_asgi:app --port 5002                    # asyncio mode
+then run
+    python -m benchmarks.load_test --url http://localhost:5001 --url http://localhost:5002
+
+For every concurrency level it opens N streams at once (distinct questions, so
+request coalescing doesn't hide the upstream work) and, while they run, times
+a /files request to show whether other routes are blocked.
+
+Each browser session only sees its own documents, so pass --cookie with the
+session cookie of a browser that has uploaded some (or run the server with
+SESSION_NAMESPACES=0).
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from urllib.parse import urlparse
+
+
+def stream_chat(url, query, results, headers=None):
+    parsed = urlparse(url)
+    start = time.perf_counter()
+    first_token = None
+    ok = False
+    try:
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=300)
+        conn.request('POST', '/chat', body=json.dumps({'query': query}),
+                     headers=dict(headers or {}, **{'Content-Type': 'application/json'}))
+        response = conn.getresponse()
+        for line in response:
+            if not line.startswith(b'data: '):
+                continue
+            event = json.loads(line[6:])
+            if event.get('content') and first_token is None:
+                first_token = time.perf_counter() - start
+            if event.get('done'):
+                ok = not event.get('error')
+                break
+        conn.close()
+    except Exception as e:
+        print(f"  stream error: {e}")
+    results.append({'ok': ok, 'ttft': first_token, 'total': time.perf_counter() - start})
+
+
+def time_files(url, headers=None):
+    parsed = urlparse(url)
+    start = time.perf_counter()
+    try:
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=300)
+        conn.request('GET', '/files', headers=headers or {})
+        conn.getresponse().read()
+        conn.close()
+    except Exception:
+        return None
+    return time.perf_counter() - start
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def run_level(url, concurrency, run_id, headers=None):
+    results = []
+    threads = [threading.Thread(target=stream_chat,
+                                args=(url, f"question {run_id}-{i}: what is the budget?", results, headers))
+               for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+    files_latency = time_files(url, headers)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    ttfts = [r['ttft'] for r in results if r['ttft'] is not None]
+    return {
+        'concurrency': concurrency,
+        'ok': sum(r['ok'] for r in results),
+        'elapsed': elapsed,
+        'ttft_p50': percentile(ttfts, 50),
+        'ttft_p99': percentile(ttfts, 99),
+        'total_mean': statistics.mean(r['total'] for r in results),
+        'files_latency': files_latency,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', action='append', required=True, help='server base URL (repeat to compare)')
+    parser.add_argument('--levels', default='1,4,16,32', help='comma-separated concurrency levels')
+    parser.add_argument('--cookie', help="session cookie to send, e.g. 'session=...'")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(',')]
+    headers = {'Cookie': args.cookie} if args.cookie else None
+
+    for url in args.url:
+        print(f"\n{url}")
+        print(f"{'streams':>8} {'ok':>4} {'wall s':>7} {'ttft p50':>9} {'ttft p99':>9} {'mean s':>7} {'/files s':>9}")
+        for run_id, level in enumerate(levels):
+            r = run_level(url, level, run_id, headers)
+            files_latency = f"{r['files_latency']:.3f}" if r['files_latency'] is not None else 'fail'
+            print(f"{r['concurrency']:>8} {r['ok']:>4} {r['elapsed']:>7.2f} {r['ttft_p50']:>9.3f} "
+                  f"{r['ttft_p99']:>9.3f} {r['total_mean']:>7.2f} {files_latency:>9}")
+
+
+if __name__ == '__main__':
+    main()
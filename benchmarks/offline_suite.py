@@ -0,0 +1,261 @@
+"""
+Offline benchmark suite: the Flask app end to end, with Gemini replaced by a local fake
+
+    python -m benchmarks.offline_suite --output results.json
+    python -m benchmarks.offline_suite --baseline results.json   # compare against an earlier run
+
+Runs app_flask in-process on a local port, inside a scratch working directory
+(so ./data and the caches start empty), with Cloudinary disabled and the model
+swapped for benchmarks.fake_gemini.FakeGenerativeModel. Scenarios:
+
+  upload          POST the synthetic corpus to /upload, then wait for its ingestion job
+  files           GET /files at each concurrency level
+  chat_distinct   N streaming /chat requests with distinct questions (every one reaches the model)
+  chat_repeated   N streaming /chat requests with the same question (coalescing + answer cache)
+  chat_map_reduce chat_distinct with map-reduce answering forced on (shard map calls + streamed reduce)
+
+Reports throughput, p50/p99 time-to-first-token and peak RSS, and writes JSON.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_gemini import FakeGenerativeModel
+from benchmarks.load_test import percentile, stream_chat, time_files
+from benchmarks.synthetic import make_corpus
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process (server included) in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def start_server(args):
+    """Import app_flask in a scratch directory with the fake model and serve it on a free port"""
+    workdir = tempfile.mkdtemp(prefix='chatbot-bench-')
+    os.chdir(workdir)
+    # Empty values win over .env (load_dotenv does not override), keeping the run offline
+    for name in ('GEMINI_API_KEY', 'CLOUDINARY_CLOUD_NAME', 'CLOUDINARY_API_KEY', 'CLOUDINARY_API_SECRET'):
+        os.environ[name] = ''
+    os.environ.setdefault('GEMINI_RPM', '1000000')  # measure the app, not the free-tier quota
+    import app_flask
+    from werkzeug.serving import make_server
+
+    app_flask.model = FakeGenerativeModel(tokens_per_second=args.token_rate,
+                                          first_token_delay=args.first_token_delay,
+                                          answer_tokens=args.answer_tokens,
+                                          rate_limit_every=args.rate_limit_every)
+    server = make_server('127.0.0.1', 0, app_flask.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", app_flask, workdir
+
+
+# Cookies the server hands out, sent back on every request so the whole run shares one session namespace
+COOKIES = {}
+
+
+def session_headers():
+    return {'Cookie': '; '.join(f"{name}={value}" for name, value in COOKIES.items())} if COOKIES else {}
+
+
+def request_json(url, method, path, body=None, headers=None):
+    parsed = urlparse(url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=600)
+    conn.request(method, path, body=body, headers=dict(session_headers(), **(headers or {})))
+    response = conn.getresponse()
+    for cookie in response.headers.get_all('Set-Cookie') or []:
+        name, _, value = cookie.partition('=')
+        COOKIES[name] = value.split(';', 1)[0]
+    data = json.loads(response.read() or b'{}')
+    conn.close()
+    return response.status, data
+
+
+def post_files(url, files):
+    """multipart/form-data POST of [(filename, bytes)] to /upload"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for filename, content in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="files"; '
+                     f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode())
+        parts.append(content)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return request_json(url, 'POST', '/upload', body=b''.join(parts),
+                        headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+
+def run_upload(url, corpus):
+    total_bytes = sum(len(content) for _, content in corpus)
+    start = time.perf_counter()
+    status, data = post_files(url, corpus)
+    stored = time.perf_counter() - start
+    job = {'status': 'missing'}
+    while data.get('job_id'):
+        _, job = request_json(url, 'GET', f"/jobs/{data['job_id']}")
+        if job.get('finished') is not None:
+            break
+        time.sleep(0.2)
+    ingested = time.perf_counter() - start
+    return {
+        'files': len(corpus),
+        'megabytes': round(total_bytes / 1e6, 2),
+        'http_status': status,
+        'upload_seconds': round(stored, 3),
+        'ingest_seconds': round(ingested, 3),
+        'files_per_second': round(len(corpus) / ingested, 2),
+        'failed_files': job.get('counts', {}).get('failed', 0),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_files_level(url, concurrency, requests_per_client=10):
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(requests_per_client):
+            latency = time_files(url, session_headers())
+            if latency is not None:
+                with lock:
+                    latencies.append(latency)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'concurrency': concurrency,
+        'ok': len(latencies),
+        'requests_per_second': round(len(latencies) / elapsed, 2),
+        'latency_p50': round(percentile(latencies, 50), 4),
+        'latency_p99': round(percentile(latencies, 99), 4),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_chat_level(url, concurrency, run_id, repeated):
+    results = []
+    # Repeated questions still differ between levels, so each level starts with a cold answer cache
+    queries = [f"what does the {run_id if repeated else f'{run_id}-{i}'} report say about the budget?"
+               for i in range(concurrency)]
+    threads = [threading.Thread(target=stream_chat, args=(url, query, results, session_headers()))
+               for query in queries]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    ttfts = [r['ttft'] for r in results if r['ttft'] is not None]
+    ok = sum(r['ok'] for r in results)
+    return {
+        'concurrency': concurrency,
+        'ok': ok,
+        'errors': concurrency - ok,
+        'answers_per_second': round(ok / elapsed, 3),
+        'ttft_p50': round(percentile(ttfts, 50), 4),
+        'ttft_p99': round(percentile(ttfts, 99), 4),
+        'wall_seconds': round(elapsed, 3),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(results, baseline):
+    """Print the relative change of the headline numbers against an earlier results file"""
+    headline = {'files': 'requests_per_second', 'chat_distinct': 'ttft_p50', 'chat_repeated': 'ttft_p50',
+                'chat_map_reduce': 'ttft_p50'}
+    print("\nvs baseline")
+    for scenario, key in headline.items():
+        before = {r['concurrency']: r for r in baseline['scenarios'].get(scenario, [])}
+        for row in results['scenarios'].get(scenario, []):
+            old = before.get(row['concurrency'])
+            if old and old.get(key):
+                change = (row[key] - old[key]) / old[key] * 100
+                print(f"  {scenario:<14} c={row['concurrency']:<4} {key}: {old[key]} -> {row[key]} ({change:+.1f}%)")
+    upload_before = baseline['scenarios'].get('upload', {}).get('ingest_seconds')
+    if upload_before:
+        now = results['scenarios']['upload']['ingest_seconds']
+        print(f"  upload ingest_seconds: {upload_before} -> {now} ({(now - upload_before) / upload_before * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', default='1,4,16,32', help='comma-separated concurrency levels')
+    parser.add_argument('--small-files', type=int, default=200, help='number of small TXT/MD documents')
+    parser.add_argument('--large-pdfs', type=int, default=2, help='number of large PDFs')
+    parser.add_argument('--pdf-pages', type=int, default=300, help='pages per large PDF')
+    parser.add_argument('--token-rate', type=float, default=50.0, help='fake model tokens per second')
+    parser.add_argument('--first-token-delay', type=float, default=0.3, help='fake model seconds to first chunk')
+    parser.add_argument('--answer-tokens', type=int, default=120, help='fake answer length')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='fake 429 on every Nth call (0 = never)')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the JSON results')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(',')]
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    corpus = make_corpus(args.small_files, large_pdfs=args.large_pdfs, pdf_pages=args.pdf_pages)
+    url, app_flask, workdir = start_server(args)
+    print(f"Serving app_flask from {workdir} at {url} with the fake model")
+
+    results = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+               'config': vars(args), 'scenarios': {}}
+
+    upload = run_upload(url, corpus)
+    results['scenarios']['upload'] = upload
+    print(f"\nupload: {upload['files']} files / {upload['megabytes']} MB stored in {upload['upload_seconds']}s, "
+          f"ingested in {upload['ingest_seconds']}s ({upload['files_per_second']} files/s), "
+          f"peak RSS {upload['peak_rss_mb']} MB")
+
+    print(f"\n{'/files':<8} {'ok':>5} {'req/s':>8} {'p50 s':>8} {'p99 s':>8} {'rss MB':>8}")
+    results['scenarios']['files'] = []
+    for level in levels:
+        r = run_files_level(url, level)
+        results['scenarios']['files'].append(r)
+        print(f"{level:<8} {r['ok']:>5} {r['requests_per_second']:>8} {r['latency_p50']:>8} "
+              f"{r['latency_p99']:>8} {r['peak_rss_mb']:>8}")
+
+    default_threshold = app_flask.MAP_REDUCE_THRESHOLD_TOKENS
+    for scenario, repeated in (('chat_distinct', False), ('chat_repeated', True), ('chat_map_reduce', False)):
+        # Any indexed text is "too large" for one prompt in the map-reduce scenario
+        app_flask.MAP_REDUCE_THRESHOLD_TOKENS = 1 if scenario == 'chat_map_reduce' else default_threshold
+        print(f"\n{scenario:<14} {'ok':>4} {'ans/s':>7} {'ttft p50':>9} {'ttft p99':>9} {'wall s':>7} {'rss MB':>7}")
+        results['scenarios'][scenario] = []
+        for run_id, level in enumerate(levels):
+            r = run_chat_level(url, level, f"{scenario}-{run_id}", repeated)
+            results['scenarios'][scenario].append(r)
+            print(f"{level:<14} {r['ok']:>4} {r['answers_per_second']:>7} {r['ttft_p50']:>9} "
+                  f"{r['ttft_p99']:>9} {r['wall_seconds']:>7} {r['peak_rss_mb']:>7}")
+
+    results['model_calls'] = app_flask.model.calls
+    results['model_rate_limited'] = app_flask.model.rate_limited
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Synthetic Documents - Deterministic test corpora for the benchmark scripts
+"""
+import random
+
+WORDS = (
+    "revenue policy contract network latency storage invoice customer report budget "
+    "quarter analysis summary employee schedule project deadline review security backup "
+    "server request response module feature release version document section table figure "
+    "the of and to in for with on by from as is was are be this that which it at an or"
+).split()
+
+
+def make_sentences(count, rng):
+    """count pseudo-English lines of 8-14 words"""
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 14))).capitalize() + "."
+            for _ in range(count)]
+
+
+def make_text_pdf(num_pages, lines_per_page=45, seed=0):
+    """Build a valid multi-page PDF (Helvetica text, one content stream per page) as bytes"""
+    rng = random.Random(seed)
+    bodies = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    page_ids = []
+    next_id = 4
+    for page_number in range(num_pages):
+        lines = [f"Page {page_number + 1}"] + make_sentences(lines_per_page, rng)
+        ops = " Tj T* ".join(f"({line})" for line in lines)
+        stream = f"BT /F1 10 Tf 14 TL 40 800 Td {ops} Tj ET".encode("latin-1")
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        bodies[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        bodies[page_id] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                           b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(page_id)
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    bodies[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, num_pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(bodies):
+        offsets[obj_id] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (obj_id, bodies[obj_id])
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % next_id
+    for obj_id in range(1, next_id):
+        out += b"%010d 00000 n \n" % offsets[obj_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (next_id, xref_offset)
+    return bytes(out)
+
+
+def make_text_document(num_lines, seed=0):
+    """Plain text / markdown body"""
+    return "\n".join(make_sentences(num_lines, random.Random(seed)))
+
+
+def make_corpus(small_files=200, small_lines=40, large_pdfs=2, pdf_pages=300, seed=0):
+    """[(filename, bytes)]: many small TXT/MD notes plus a few large PDFs"""
+    files = []
+    for i in range(small_files):
+        ext = 'md' if i % 2 else 'txt'
+        files.append((f"note_{i:04d}.{ext}", make_text_document(small_lines, seed=seed + i).encode('utf-8')))
+    for i in range(large_pdfs):
+        files.append((f"report_{i}.pdf", make_text_pdf(pdf_pages, seed=seed + 10000 + i)))
+    return files
@@ -0,0 +1,214 @@
+"""
+Blob Store - Content-addressed storage for uploaded documents
+Uploads are hashed while they stream to disk, kept once per SHA-256 digest and
+hard-linked into a documents directory under their filename, so a re-uploaded
+document costs no extra disk, extraction or indexing. Several BlobStores (one
+per session namespace) can share one blob directory; a blob is deleted once no
+store's manifest refers to it any more
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+STREAM_CHUNK_SIZE = 1024 * 1024  # bytes read and hashed per step
+
+
+class BlobStore:
+    """Blobs by digest plus a filename -> digest manifest for one documents directory"""
+
+    _lock = threading.Lock()  # shared: blobs are linked and released across every store
+
+    def __init__(self, blob_dir: str, data_dir: str, peer_dirs: Optional[Callable[[], Iterable[str]]] = None):
+        """
+        peer_dirs: function() -> documents directories of every store sharing blob_dir
+                   (loaded or not); their manifests keep blobs alive. Default: this one only
+        """
+        self.blob_dir = blob_dir
+        self.data_dir = data_dir  # created on the first upload
+        self.peer_dirs = peer_dirs or (lambda: [data_dir])
+        self.manifest_file = os.path.join(data_dir, ".manifest.json")
+        self._manifest_mtime = None
+        os.makedirs(blob_dir, exist_ok=True)
+        self.manifest = {}
+        self._reload()
+
+    @contextmanager
+    def _locked(self):
+        """Cross-process lock (flock, plus the class lock for this process's threads) around blob and manifest changes"""
+        with self._lock, open(os.path.join(self.blob_dir, '.lock'), 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _reload(self):
+        """Re-read the manifest if another worker has rewritten it"""
+        try:
+            mtime = os.stat(self.manifest_file).st_mtime_ns
+        except OSError:
+            self.manifest, self._manifest_mtime = {}, None
+            return
+        if mtime == self._manifest_mtime:
+            return
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            self._manifest_mtime = mtime
+        except:
+            self.manifest = {}
+
+    def _save(self):
+        tmp_path = self.manifest_file + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_file)
+        self._manifest_mtime = os.stat(self.manifest_file).st_mtime_ns
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest)
+
+    def _stream(self, fileobj):
+        """Stream fileobj to a temp file in the blob directory, hashing as it goes. Returns (digest, temp path)"""
+        h = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for block in iter(lambda: fileobj.read(STREAM_CHUNK_SIZE), b''):
+                    h.update(block)
+                    f.write(block)
+            return h.hexdigest(), tmp_path
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _commit(self, digest: str, tmp_path: str):
+        """Move a streamed upload into place as the digest's blob (caller holds the lock)"""
+        if os.path.exists(self.blob_path(digest)):
+            os.remove(tmp_path)  # already stored
+        else:
+            os.replace(tmp_path, self.blob_path(digest))
+
+    def _referenced(self, digest: str) -> bool:
+        """Whether any store's manifest still refers to digest (caller holds the lock)"""
+        if digest in self.manifest.values():
+            return True
+        own = os.path.abspath(self.manifest_file)
+        for data_dir in self.peer_dirs():
+            manifest_file = os.path.join(data_dir, ".manifest.json")
+            if os.path.abspath(manifest_file) == own:
+                continue  # self.manifest may not be saved yet
+            try:
+                with open(manifest_file, 'r', encoding='utf-8') as f:
+                    if digest in json.load(f).values():
+                        return True
+            except FileNotFoundError:
+                continue
+            except Exception:
+                return True  # unreadable manifest: keep the blob rather than guess
+        return False
+
+    def _release(self, digest: str):
+        """Delete a blob no manifest refers to any more (caller holds the lock)"""
+        if self._referenced(digest):
+            return
+        try:
+            os.remove(self.blob_path(digest))
+        except OSError:
+            pass
+
+    def write(self, fileobj) -> str:
+        """Stream fileobj into the store. Returns the digest"""
+        digest, tmp_path = self._stream(fileobj)
+        with self._locked():
+            self._commit(digest, tmp_path)
+        return digest
+
+    def _free_name(self, filename: str, digest: str) -> str:
+        """filename, or filename-2, -3, ... if that name already holds other content"""
+        stem, ext = os.path.splitext(filename)
+        name, n = filename, 1
+        while True:
+            taken = name in self.manifest or os.path.exists(os.path.join(self.data_dir, name))
+            if not taken or self.manifest.get(name) == digest:
+                return name
+            n += 1
+            name = f"{stem}-{n}{ext}"
+
+    def add(self, fileobj, filename: str) -> str:
+        """
+        Store an upload under filename and return the name it was stored as
+        Same name and same content is a no-op; same name with different content
+        gets a numbered name instead of overwriting the existing document
+        """
+        digest, tmp_path = self._stream(fileobj)
+        with self._locked():
+            self._commit(digest, tmp_path)
+            os.makedirs(self.data_dir, exist_ok=True)
+            self._reload()
+            name = self._free_name(filename, digest)
+            data_path = os.path.join(self.data_dir, name)
+            if self.manifest.get(name) != digest or not os.path.exists(data_path):
+                tmp_path = f"{data_path}.{threading.get_ident()}.tmp"
+                try:
+                    os.link(self.blob_path(digest), tmp_path)
+                except OSError:
+                    shutil.copyfile(self.blob_path(digest), tmp_path)  # no hard links on this filesystem
+                os.replace(tmp_path, data_path)
+                replaced = self.manifest.get(name)
+                self.manifest[name] = digest
+                if replaced:
+                    self._release(replaced)
+                self._save()
+            return name
+
+    def digests(self) -> Dict[str, str]:
+        with self._locked():
+            self._reload()
+            return dict(self.manifest)
+
+    def remove(self, filename: str):
+        """Delete a filename; its blob goes too once nothing else refers to it"""
+        with self._locked():
+            self._reload()
+            digest = self.manifest.pop(filename, None)
+            try:
+                os.remove(os.path.join(self.data_dir, filename))
+            except OSError:
+                pass
+            if digest:
+                self._release(digest)
+            if os.path.isdir(self.data_dir):
+                self._save()
+
+    def clear(self):
+        """Delete every document of this store, and the blobs only they linked to"""
+        with self._locked():
+            self._reload()
+            digests = set(self.manifest.values())
+            for name in self.manifest:
+                try:
+                    os.remove(os.path.join(self.data_dir, name))
+                except OSError:
+                    pass
+            self.manifest = {}
+            try:
+                os.remove(self.manifest_file)
+            except OSError:
+                pass
+            self._manifest_mtime = None
+            for digest in digests:
+                self._release(digest)
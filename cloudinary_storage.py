@@ -1,26 +1,71 @@
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
 import os
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from werkzeug.utils import secure_filename
+from metrics import span
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # bytes written per streamed read
 
 class CloudinaryStorage:
     """Handle file storage with Cloudinary"""
-    
-    def __init__(self, cloud_name=None, api_key=None, api_secret=None):
+
+    def __init__(self, cloud_name=None, api_key=None, api_secret=None, max_workers=None, list_ttl=None):
         """Initialize Cloudinary with credentials from parameters or environment"""
         cloud_name = cloud_name or os.getenv('CLOUDINARY_CLOUD_NAME')
         api_key = api_key or os.getenv('CLOUDINARY_API_KEY')
         api_secret = api_secret or os.getenv('CLOUDINARY_API_SECRET')
-        
-        cloudinary.config(
-            cloud_name=cloud_name,
-            api_key=api_key,
-            api_secret=api_secret
-        )
+
+        # The SDK is imported and configured on first use (see connect), not at start-up
+        self._credentials = dict(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret)
+        self._sdk = None
         self.folder = 'chatbot_documents'
-    
+        # Bulk operations run this many requests at once, over as many pooled connections
+        self.max_workers = max_workers or int(os.getenv('CLOUDINARY_WORKERS', 8))
+        # Seconds a listing is reused before the Admin API is asked again
+        self.list_ttl = list_ttl if list_ttl is not None else float(os.getenv('CLOUDINARY_LIST_TTL', 30))
+        self._lock = threading.Lock()
+        self._session = None
+        self._executor = None
+        self._listing = None  # (fetched_at, files)
+
+    def connect(self):
+        """Import and configure the Cloudinary SDK (once). Returns the cloudinary module"""
+        with self._lock:
+            if self._sdk is None:
+                import cloudinary
+                import cloudinary.uploader
+                import cloudinary.api
+                cloudinary.config(**self._credentials)
+                self._sdk = cloudinary
+            return self._sdk
+
+    def _get_session(self):
+        """Shared requests.Session with a connection pool sized for the worker pool"""
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+            return self._session
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='cloudinary')
+            return self._executor
+
+    def invalidate_listing(self):
+        """Forget the cached listing (called after every upload and delete)"""
+        with self._lock:
+            self._listing = None
+
     def upload_file(self, file, filename):
         """
         Upload a file to Cloudinary
@@ -28,87 +73,144 @@ class CloudinaryStorage:
         """
         try:
             # Upload to Cloudinary
-            result = cloudinary.uploader.upload(
-                file,
-                folder=self.folder,
-                resource_type='raw',  # For non-image files
-                public_id=secure_filename(filename)
-            )
+            with span('cloudinary_upload'):
+                result = self.connect().uploader.upload(
+                    file,
+                    folder=self.folder,
+                    resource_type='raw',  # For non-image files
+                    public_id=secure_filename(filename)
+                )
             return result['secure_url']
         except Exception as e:
             raise Exception(f"Cloudinary upload failed: {str(e)}")
-    
-    def list_files(self):
+        finally:
+            self.invalidate_listing()
+
+    def upload_files(self, files):
+        """
+        Upload several (file, filename) pairs concurrently
+        Returns: Dict of filename -> URL, or the Exception that upload raised
+        """
+        return self._run_all(lambda item: self.upload_file(*item), files, key=lambda item: item[1])
+
+    def list_files(self, refresh=False):
         """
-        List all files in Cloudinary folder
-        Returns: List of file info dicts with 'name' and 'url'
+        List all files in Cloudinary folder, following next_cursor across pages
+        The listing is cached for list_ttl seconds; refresh=True bypasses the cache
+        Returns: List of file info dicts with 'name', 'url', 'public_id',
+        and the 'version', 'etag' and 'bytes' used to detect changed objects
         """
+        with self._lock:
+            cached = self._listing
+        if cached and not refresh and time.monotonic() - cached[0] < self.list_ttl:
+            return list(cached[1])
+
         try:
-            result = cloudinary.api.resources(
-                type='upload',
-                prefix=self.folder,
-                resource_type='raw',
-                max_results=500
-            )
-            
             files = []
-            for resource in result.get('resources', []):
-                # Extract filename from public_id
-                public_id = resource['public_id']
-                filename = public_id.split('/')[-1]
-                files.append({
-                    'name': filename,
-                    'url': resource['secure_url'],
-                    'public_id': public_id
-                })
-            
-            return files
+            next_cursor = None
+            while True:
+                params = dict(type='upload', prefix=self.folder, resource_type='raw', max_results=500)
+                if next_cursor:
+                    params['next_cursor'] = next_cursor
+                with span('cloudinary_list'):
+                    result = self.connect().api.resources(**params)
+
+                for resource in result.get('resources', []):
+                    # Extract filename from public_id
+                    public_id = resource['public_id']
+                    filename = public_id.split('/')[-1]
+                    files.append({
+                        'name': filename,
+                        'url': resource['secure_url'],
+                        'public_id': public_id,
+                        'version': resource.get('version'),
+                        'etag': resource.get('etag'),
+                        'bytes': resource.get('bytes', 0)
+                    })
+
+                next_cursor = result.get('next_cursor')
+                if not next_cursor:
+                    break
+
+            with self._lock:
+                self._listing = (time.monotonic(), files)
+            return list(files)
         except Exception as e:
             print(f"Error listing files: {e}")
-            return []
-    
+            # A stale listing beats an empty one, which would look like every file was deleted
+            return list(cached[1]) if cached else []
+
     def delete_file(self, filename):
         """
         Delete a file from Cloudinary
         """
         try:
             public_id = f"{self.folder}/{secure_filename(filename)}"
-            result = cloudinary.uploader.destroy(
-                public_id,
-                resource_type='raw'
-            )
+            with span('cloudinary_delete'):
+                result = self.connect().uploader.destroy(
+                    public_id,
+                    resource_type='raw'
+                )
             return result.get('result') == 'ok'
         except Exception as e:
             raise Exception(f"Cloudinary delete failed: {str(e)}")
-    
+        finally:
+            self.invalidate_listing()
+
+    def delete_files(self, filenames):
+        """
+        Delete several files concurrently
+        Returns: Dict of filename -> True/False, or the Exception that delete raised
+        """
+        return self._run_all(self.delete_file, filenames)
+
     def download_file(self, url, local_path):
         """
         Download a file from Cloudinary URL to local path
+        The body is streamed in chunks to a temp file that is renamed into place,
+        so readers never see a partial file
         """
-        import requests
+        directory = os.path.dirname(local_path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.download-')
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            with open(local_path, 'wb') as f:
-                f.write(response.content)
-            
+            # Own the descriptor first, so a failed request still closes it
+            with os.fdopen(fd, 'wb') as f, span('cloudinary_download'):
+                with self._get_session().get(url, stream=True, timeout=(10, 300)) as response:
+                    response.raise_for_status()
+                    for block in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(block)
+            os.replace(tmp_path, local_path)
             return True
         except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             raise Exception(f"Download failed: {str(e)}")
-    
+
     def download_all_files(self, local_dir):
         """
-        Download all files from Cloudinary to local directory
+        Download all files from Cloudinary to local directory, several at a time
         Returns: List of local file paths
         """
         os.makedirs(local_dir, exist_ok=True)
         files = self.list_files()
-        local_paths = []
-        
-        for file_info in files:
-            local_path = os.path.join(local_dir, file_info['name'])
-            self.download_file(file_info['url'], local_path)
-            local_paths.append(local_path)
-        
+        local_paths = [os.path.join(local_dir, file_info['name']) for file_info in files]
+
+        results = self._run_all(lambda item: self.download_file(*item),
+                                [(f['url'], path) for f, path in zip(files, local_paths)],
+                                key=lambda item: item[1])
+        errors = [error for error in results.values() if isinstance(error, Exception)]
+        if errors:
+            raise errors[0]
         return local_paths
+
+    def _run_all(self, fn, items, key=lambda item: item):
+        """Run fn over items on the shared pool; one failure does not cancel the rest"""
+        items = list(items)
+        futures = [(key(item), self._get_executor().submit(fn, item)) for item in items]
+        results = {}
+        for name, future in futures:
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+        return results
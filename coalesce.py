@@ -0,0 +1,100 @@
+"""
+Request Coalescing - Concurrent identical /chat requests share one upstream
+Gemini stream instead of each starting their own
+"""
+import threading
+from typing import Callable, Iterable, Iterator
+
+
+class Flight:
+    """One in-progress upstream stream; every subscriber sees every chunk"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.abandoned = False  # every subscriber left before the stream finished
+        self._cond = threading.Condition()
+
+    def publish(self, chunk: str):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error: Exception = None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def subscribe(self) -> Iterator[str]:
+        """Yield the chunks produced so far, then the live ones until the stream ends"""
+        with self._cond:
+            self.subscribers += 1
+        try:
+            position = 0
+            while True:
+                with self._cond:
+                    while position >= len(self.chunks) and not self.done:
+                        self._cond.wait()
+                    new_chunks = self.chunks[position:]
+                    finished = self.done and position + len(new_chunks) >= len(self.chunks)
+                position += len(new_chunks)
+                for chunk in new_chunks:
+                    yield chunk
+                if finished:
+                    if self.error:
+                        raise self.error
+                    return
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+                if self.subscribers == 0 and not self.done:
+                    self.abandoned = True
+
+
+class SingleFlight:
+    """Maps a key to at most one running producer at a time"""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def stream(self, key: str, producer: Callable[[], Iterable[str]]) -> Iterator[str]:
+        """
+        Subscribe to the flight for key, starting producer() in a background thread
+        if nobody is running it yet. The upstream keeps going while any client is
+        still reading and is closed once the last one disconnects
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None or flight.abandoned
+            if is_leader:
+                flight = Flight()
+                self._flights[key] = flight
+        if is_leader:
+            threading.Thread(target=self._run, args=(key, flight, producer), daemon=True).start()
+        return flight.subscribe()
+
+    def _run(self, key: str, flight: Flight, producer: Callable[[], Iterable[str]]):
+        try:
+            chunks = producer()
+            for chunk in chunks:
+                if flight.abandoned:
+                    # Nobody is listening any more: stop the upstream call
+                    if hasattr(chunks, 'close'):
+                        chunks.close()
+                    flight.finish(ConnectionAbortedError("All clients disconnected"))
+                    return
+                flight.publish(chunk)
+            flight.finish()
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def __len__(self):
+        return len(self._flights)
@@ -0,0 +1,155 @@
+"""
+Context Packing - Fits retrieved chunks into a token budget before the prompt
+is sent, giving every document a fair share so one huge PDF cannot crowd out the rest.
+A chunk costs what it adds to the prompt: its text plus the DOCUMENT header
+format_excerpts() wraps it in
+"""
+from typing import Dict, List, Tuple
+
+CHARS_PER_TOKEN = 4  # close enough for English text with Gemini's tokenizer
+MIN_TRUNCATED_TOKENS = 64  # don't bother sending a truncated chunk smaller than this
+TRUNCATION_MARK = " …"
+RULE = "=" * 60
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, no tokenizer round trip"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Cut text to at most `tokens` tokens (truncation mark included), on a word boundary"""
+    if len(text) <= tokens * CHARS_PER_TOKEN:
+        return text
+    limit = max(tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARK), 0)
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit] + TRUNCATION_MARK
+
+
+def format_excerpt(chunk: Dict) -> str:
+    return f"\n\n{RULE}\nDOCUMENT: {chunk['source']}\n{RULE}\n{chunk['text']}\n"
+
+
+def format_excerpts(chunks: List[Dict]) -> str:
+    """The prompt's excerpt section: every chunk under a header naming its document"""
+    return "".join(format_excerpt(chunk) for chunk in chunks)
+
+
+def excerpt_tokens(chunk: Dict) -> int:
+    """Estimated tokens a chunk adds to the prompt, header included"""
+    return estimate_tokens(format_excerpt(chunk))
+
+
+def header_tokens(source: str) -> int:
+    """Estimated tokens of the header alone, i.e. what a chunk of `source` costs before its text"""
+    return excerpt_tokens({'source': source, 'text': ''})
+
+
+def pack_context(candidates: List[Dict], budget: int) -> Tuple[List[Dict], Dict]:
+    """
+    Choose chunks (dicts with 'source' and 'text', best first) that fit in `budget` tokens
+
+    Pass 1 walks the candidates in relevance order and caps each document at an
+    equal share of the budget. Pass 2 hands whatever is left to the chunks that
+    pass 1 skipped, still in relevance order, truncating the last one if needed.
+    Returns (packed chunks in relevance order, report for the client)
+    """
+    sources = list(dict.fromkeys(c['source'] for c in candidates))
+    fair_share = budget // len(sources) if sources else budget
+    used = 0
+    per_source = {source: 0 for source in sources}
+    chosen = {}  # candidate position -> text actually sent
+    truncated = []
+
+    for position, candidate in enumerate(candidates):
+        cost = excerpt_tokens(candidate)
+        if used + cost <= budget and per_source[candidate['source']] + cost <= fair_share:
+            chosen[position] = candidate['text']
+            per_source[candidate['source']] += cost
+            used += cost
+
+    for position, candidate in enumerate(candidates):
+        if position in chosen:
+            continue
+        remaining = budget - used
+        if remaining < MIN_TRUNCATED_TOKENS:
+            break
+        cost = excerpt_tokens(candidate)
+        text = candidate['text']
+        if cost > remaining:
+            room = remaining - header_tokens(candidate['source'])
+            if room < MIN_TRUNCATED_TOKENS:
+                continue
+            text = truncate_to_tokens(text, room)
+            cost = excerpt_tokens(dict(candidate, text=text))
+            truncated.append(candidate['source'])
+        chosen[position] = text
+        per_source[candidate['source']] += cost
+        used += cost
+
+    packed = [dict(candidates[position], text=chosen[position]) for position in sorted(chosen)]
+    dropped = {}
+    for position, candidate in enumerate(candidates):
+        if position not in chosen:
+            dropped[candidate['source']] = dropped.get(candidate['source'], 0) + 1
+    report = {
+        'budget_tokens': budget,
+        'used_tokens': used,
+        'included': [{'source': source, 'chunks': sum(1 for c in packed if c['source'] == source),
+                      'tokens': per_source[source]} for source in sources if per_source[source]],
+        'dropped': [{'source': source, 'chunks': count} for source, count in dropped.items()],
+        'truncated': sorted(set(truncated)),
+    }
+    return packed, report
+
+
+def shard_context(candidates: List[Dict], budget: int, max_shards: int) -> Tuple[List[List[Dict]], Dict]:
+    """
+    Split chunks (dicts with 'source' and 'text', best first) into shards of at
+    most `budget` tokens each, for map-reduce answering
+
+    Chunks are chosen in relevance order until max_shards full budgets are
+    spoken for, then grouped by document (in order of each document's best
+    chunk) so a shard reads neighbouring passages side by side.
+    Returns (shards, report for the client)
+    """
+    capacity = budget * max_shards
+    selected = []
+    dropped = {}
+    for candidate in candidates:
+        text = candidate['text']
+        if excerpt_tokens(candidate) > budget:
+            text = truncate_to_tokens(text, max(budget - header_tokens(candidate['source']), 0))
+        cost = excerpt_tokens(dict(candidate, text=text))
+        if cost <= capacity:
+            selected.append(dict(candidate, text=text))
+            capacity -= cost
+        else:
+            dropped[candidate['source']] = dropped.get(candidate['source'], 0) + 1
+
+    by_source = {}
+    for chunk in selected:
+        by_source.setdefault(chunk['source'], []).append(chunk)
+    shards = [[]]
+    used = 0
+    for chunks in by_source.values():
+        for chunk in chunks:
+            cost = excerpt_tokens(chunk)
+            if used + cost > budget and shards[-1]:
+                if len(shards) == max_shards:  # packing left gaps; the overflow is dropped
+                    dropped[chunk['source']] = dropped.get(chunk['source'], 0) + 1
+                    continue
+                shards.append([])
+                used = 0
+            shards[-1].append(chunk)
+            used += cost
+
+    shards = [shard for shard in shards if shard]
+    report = {
+        'mode': 'map_reduce',
+        'budget_tokens': budget,
+        'shards': [{'sources': list(dict.fromkeys(c['source'] for c in shard)), 'chunks': len(shard),
+                    'tokens': sum(excerpt_tokens(c) for c in shard)} for shard in shards],
+        'dropped': [{'source': source, 'chunks': count} for source, count in dropped.items()],
+    }
+    return shards, report
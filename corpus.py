@@ -0,0 +1,145 @@
+"""
+Corpus Registry - Immutable, versioned snapshot of the document set
+Request handlers read the current snapshot instead of listing the documents;
+polling (see namespaces.py) and the upload/delete/clear paths replace it when
+files change, and its fingerprint keys every cache that depends on the documents
+"""
+import hashlib
+import os
+import threading
+from types import MappingProxyType
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+FULL_SCAN_EVERY = 15  # polls between scans even when the directory mtime has not moved
+
+
+class Document(NamedTuple):
+    name: str
+    key: str        # content identity: SHA-256 for local files, version:etag for Cloudinary objects
+    size: int
+    mtime_ns: int   # 0 for remote objects
+
+
+class CorpusSnapshot:
+    """One version of the document set; never mutated after construction"""
+
+    def __init__(self, documents: List[Document], version: int):
+        self.documents = tuple(sorted(documents))
+        self.version = version
+        self.keys = MappingProxyType({d.name: d.key for d in self.documents})  # name -> content key
+        self.names = [d.name for d in self.documents]
+        h = hashlib.sha256()
+        for d in self.documents:
+            h.update(f"{d.name}:{d.key}\n".encode('utf-8'))
+        self.fingerprint = h.hexdigest()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, name):
+        return name in self.keys
+
+    def get(self, name: str) -> Optional[Document]:
+        for d in self.documents:
+            if d.name == name:
+                return d
+        return None
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan_directory(data_dir: str, previous: CorpusSnapshot, known_digests: Dict[str, str]) -> List[Document]:
+    """
+    Documents in data_dir (hidden files skipped). A file whose size and mtime
+    match the previous snapshot keeps its key; otherwise the blob store's digest
+    is used, and only files nobody has hashed yet are read
+    """
+    if not os.path.exists(data_dir):
+        return []
+    before = {d.name: d for d in previous.documents}
+    documents = []
+    for entry in os.scandir(data_dir):
+        if entry.name.startswith('.') or not entry.is_file():
+            continue
+        try:
+            st = entry.stat()
+            prev = before.get(entry.name)
+            if prev and prev.size == st.st_size and prev.mtime_ns == st.st_mtime_ns:
+                key = prev.key
+            else:
+                key = known_digests.get(entry.name) or file_sha256(entry.path)
+        except OSError:
+            continue  # deleted while scanning
+        documents.append(Document(entry.name, key, st.st_size, st.st_mtime_ns))
+    return documents
+
+
+class CorpusRegistry:
+    """Holds the current CorpusSnapshot and replaces it when a scan finds a change"""
+
+    def __init__(self, scan: Callable[[CorpusSnapshot], List[Document]], watch_dir: Optional[str] = None):
+        """
+        scan: function(previous snapshot) -> documents now present
+        watch_dir: directory whose mtime gates polling scans (None: scan on every poll)
+        """
+        self.scan = scan
+        self.watch_dir = watch_dir
+        self._snapshot = CorpusSnapshot([], 0)
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._last_mtime = None
+        self._polls = 0
+
+    @property
+    def snapshot(self) -> CorpusSnapshot:
+        """The current snapshot (scanned on first access)"""
+        snapshot = self._snapshot
+        if snapshot.version == 0:
+            return self.refresh(notify=False)
+        return snapshot
+
+    def refresh(self, notify: bool = True) -> CorpusSnapshot:
+        """
+        Rescan now and publish a new version if anything changed
+        Listeners run only when notify is set (polling); routes that change
+        the documents handle their own indexing
+        """
+        with self._lock:
+            current = self._snapshot
+            documents = tuple(sorted(self.scan(current)))
+            if documents == current.documents and current.version:
+                return current
+            snapshot = CorpusSnapshot(documents, current.version + 1)
+            self._snapshot = snapshot
+        if notify and current.version:
+            for listener in self._listeners:
+                try:
+                    listener(snapshot)
+                except Exception as e:
+                    print(f"Corpus listener error: {e}")
+        return snapshot
+
+    def on_change(self, listener: Callable[[CorpusSnapshot], None]):
+        self._listeners.append(listener)
+
+    def poll(self):
+        """
+        Pick up changes made outside the app (files copied in, another worker's upload)
+        Cheap when watch_dir's mtime has not moved; every FULL_SCAN_EVERY polls it scans anyway
+        """
+        self._polls += 1
+        if self.watch_dir:
+            try:
+                mtime = os.stat(self.watch_dir).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime == self._last_mtime and self._polls % FULL_SCAN_EVERY:
+                return
+            self._last_mtime = mtime
+        self.refresh()
@@ -0,0 +1,178 @@
+"""
+Document Mirror - Local read-through cache of the documents stored in Cloudinary
+Files are fetched on first use, re-fetched only when their version/etag changes,
+and evicted least-recently-used once the mirror grows past its disk cap. Every
+change to the manifest is made under a flock after re-reading it, so gunicorn
+workers can share one mirror directory
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+
+def remote_key(file_info: Dict) -> str:
+    """Identity of one stored object version, from list_files metadata"""
+    return f"{file_info.get('version')}:{file_info.get('etag')}"
+
+
+class DocumentMirror:
+    """Maps Cloudinary file names to up-to-date local paths"""
+
+    def __init__(self, storage, mirror_dir: str, max_bytes: int = 500 * 1024 * 1024):
+        self.storage = storage
+        self.mirror_dir = mirror_dir
+        self.max_bytes = max_bytes
+        self.manifest_file = os.path.join(mirror_dir, ".manifest.json")
+        self.lock_file = os.path.join(mirror_dir, ".lock")
+        self._lock = threading.Lock()
+        self._fetch_locks = {}  # name -> [lock, users], so concurrent requests download a file once
+        self._listing = {}      # name -> file info from the last list_files()
+        os.makedirs(mirror_dir, exist_ok=True)
+        self.manifest = {}  # name -> {'key', 'bytes', 'fetched', 'last_used'}
+        self._manifest_stat = None
+        with self._locked():
+            self._reload()
+
+    @contextmanager
+    def _locked(self):
+        """Cross-process lock (flock, plus self._lock for this process's threads) around manifest changes"""
+        with self._lock, open(self.lock_file, 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _reload(self):
+        """
+        Re-read the manifest if another worker has rewritten it (caller holds the lock)
+        Hits are only recorded in memory, so the later last_used of the two copies is kept
+        """
+        try:
+            st = os.stat(self.manifest_file)
+        except OSError:
+            self.manifest, self._manifest_stat = {}, None
+            return
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stamp == self._manifest_stat:
+            return
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except:
+            stored = {}
+        for name, entry in stored.items():
+            mine = self.manifest.get(name)
+            if mine and mine['key'] == entry['key']:
+                entry['last_used'] = max(entry['last_used'], mine['last_used'])
+        self.manifest, self._manifest_stat = stored, stamp
+
+    def _save_manifest(self):
+        """Write the manifest atomically (caller holds the lock)"""
+        tmp_path = f"{self.manifest_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_file)
+        st = os.stat(self.manifest_file)
+        self._manifest_stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.mirror_dir, name)
+
+    def refresh(self, files: List[Dict], listed_at: Optional[float] = None):
+        """
+        Record the current remote listing and drop local copies of deleted objects
+        listed_at: wall-clock time the listing may date from (default now). A copy fetched
+        after it is kept even if this listing lacks it: another worker, with a newer
+        listing, downloaded it
+        """
+        listed_at = time.time() if listed_at is None else listed_at
+        with self._locked():
+            self._listing = {f['name']: f for f in files}
+            self._reload()
+            deleted = [n for n, entry in self.manifest.items()
+                       if n not in self._listing and entry.get('fetched', 0) < listed_at]
+            for name in deleted:
+                self._drop(name)
+            if deleted:
+                self._save_manifest()
+
+    def resolve(self, name: str) -> str:
+        """Local path of an up-to-date copy of `name`, downloading it if missing or stale"""
+        with self._lock:
+            info = self._listing.get(name)
+            if info is None:
+                raise FileNotFoundError(f"{name} is not in the Cloudinary listing")
+            fetch = self._fetch_locks.setdefault(name, [threading.Lock(), 0])
+            fetch[1] += 1
+        try:
+            with fetch[0]:
+                key = remote_key(info)
+                path = self.path_for(name)
+                with self._lock:
+                    entry = self.manifest.get(name)
+                    if entry and entry['key'] == key and os.path.exists(path):
+                        entry['last_used'] = time.time()
+                        return path
+                with self._locked():
+                    self._reload()  # another worker may have fetched it already
+                    entry = self.manifest.get(name)
+                    if entry and entry['key'] == key and os.path.exists(path):
+                        entry['last_used'] = time.time()
+                        return path
+                self.storage.download_file(info['url'], path)  # streamed to a temp file, then renamed
+                with self._locked():
+                    self._reload()
+                    now = time.time()
+                    self.manifest[name] = {'key': key, 'bytes': os.path.getsize(path), 'fetched': now,
+                                           'last_used': now}
+                    self._evict(keep=name)
+                    self._save_manifest()
+                return path
+        finally:
+            with self._lock:
+                fetch[1] -= 1
+                if not fetch[1]:
+                    del self._fetch_locks[name]  # last user out; the next fetch makes a new lock
+
+    def _evict(self, keep: str):
+        """Delete least-recently-used copies until the mirror fits in max_bytes (caller holds the lock)"""
+        total = sum(entry['bytes'] for entry in self.manifest.values())
+        for name in sorted(self.manifest, key=lambda n: self.manifest[n]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            total -= self.manifest[name]['bytes']
+            self._drop(name)
+
+    def _drop(self, name: str):
+        self.manifest.pop(name, None)
+        try:
+            os.remove(self.path_for(name))
+        except OSError:
+            pass
+
+    def remove(self, name: str):
+        with self._locked():
+            self._listing.pop(name, None)
+            self._reload()
+            self._drop(name)
+            self._save_manifest()
+
+    def clear(self):
+        with self._locked():
+            self._reload()
+            for name in list(self.manifest):
+                self._drop(name)
+            self._save_manifest()
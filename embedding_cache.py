@@ -0,0 +1,231 @@
+"""
+Embedding Cache - Chunk embeddings reused across rebuilds
+Vectors are keyed by (model, SHA-256 of the chunk text), where the model is the
+name plus the backend and ONNX file (an int8 variant embeds differently). Each has its
+own directory holding an append-only float32 matrix and a parallel file of
+32-byte digests, read through numpy memmaps, so a rebuild only embeds chunks it
+has never seen. CachedEncoder embeds the misses in fixed-size batches on a
+thread pool, optionally through the ONNX backend of sentence-transformers.
+numpy and sentence-transformers are imported on first use
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+DIGEST_SIZE = 32
+BACKENDS = ('torch', 'onnx')
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+
+class EmbeddingCache:
+    """Append-only (digest -> vector) store for one model, shared by processes through flock"""
+
+    def __init__(self, cache_dir: str, model_name: str, backend: str = 'torch', onnx_file: Optional[str] = None):
+        """backend, onnx_file: as given to CachedEncoder; vectors from another variant are never mixed in"""
+        self.model_name = model_name
+        self.backend = backend
+        self.onnx_file = onnx_file if backend == 'onnx' else None  # load_encoder ignores it for torch
+        # The default torch model keeps the directory name it has always had
+        variant = model_name if backend == 'torch' else f"{model_name}\0{backend}\0{self.onnx_file or ''}"
+        self.model_dir = os.path.join(cache_dir, hashlib.sha1(variant.encode('utf-8')).hexdigest()[:16])
+        self.meta_file = os.path.join(self.model_dir, "meta.json")
+        self.vectors_file = os.path.join(self.model_dir, "vectors.float32")
+        self.keys_file = os.path.join(self.model_dir, "keys.bin")
+        self.lock_file = os.path.join(self.model_dir, ".lock")
+        self._lock = threading.Lock()
+        self.dim = None
+        self._rows = {}  # digest -> row in the matrix
+        self._count = 0  # rows read from disk (duplicates from racing writers included)
+        self._matrix = None
+        os.makedirs(self.model_dir, exist_ok=True)
+        with self._lock:
+            self._load()
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        with open(self.lock_file, 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self):
+        """Read the digests appended since the last load (all of them the first time)"""
+        if self.dim is None:
+            try:
+                with open(self.meta_file, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                if (meta.get('model'), meta.get('backend', 'torch'), meta.get('onnx_file')) != \
+                        (self.model_name, self.backend, self.onnx_file):
+                    return
+                self.dim = meta['dim']
+            except (OSError, ValueError, KeyError):
+                return
+        try:
+            size = os.path.getsize(self.keys_file)
+        except OSError:
+            return
+        # A writer that died mid-append can leave a partial record; only whole rows with a vector count
+        rows = min(size // DIGEST_SIZE, os.path.getsize(self.vectors_file) // (4 * self.dim))
+        if rows <= self._count:
+            return
+        with open(self.keys_file, 'rb') as f:
+            f.seek(self._count * DIGEST_SIZE)
+            data = f.read((rows - self._count) * DIGEST_SIZE)
+        for offset in range(0, len(data), DIGEST_SIZE):
+            self._rows.setdefault(data[offset:offset + DIGEST_SIZE], self._count)
+            self._count += 1
+        self._matrix = None
+
+    def _get_matrix(self):
+        import numpy as np
+        if self._matrix is None:
+            self._matrix = np.memmap(self.vectors_file, dtype='float32', mode='r', shape=(self._count, self.dim))
+        return self._matrix
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def get_many(self, digests: Sequence[bytes]) -> Dict[bytes, "np.ndarray"]:
+        """Cached vectors for whichever of digests are present"""
+        with self._lock:
+            if any(digest not in self._rows for digest in digests):
+                self._load()  # another process may have added them
+            found = [digest for digest in digests if digest in self._rows]
+            if not found:
+                return {}
+            matrix = self._get_matrix()
+            return {digest: matrix[self._rows[digest]] for digest in found}
+
+    def put_many(self, digests: Sequence[bytes], vectors):
+        """Append vectors (one row per digest) that are not cached yet"""
+        import numpy as np
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        with self._lock, self._locked():
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                tmp_path = f"{self.meta_file}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'model': self.model_name, 'backend': self.backend, 'onnx_file': self.onnx_file,
+                               'dim': self.dim}, f)
+                os.replace(tmp_path, self.meta_file)
+            self._load()
+            new = [i for i, digest in enumerate(digests) if digest not in self._rows]
+            new = list({digests[i]: i for i in new}.values())
+            if not new:
+                return
+            # Vectors before keys: a digest on disk always has its row
+            with open(self.vectors_file, 'ab') as f:
+                f.write(vectors[new].tobytes())
+            with open(self.keys_file, 'ab') as f:
+                f.write(b''.join(digests[i] for i in new))
+            self._load()
+
+    def clear(self):
+        with self._lock, self._locked():
+            for path in (self.vectors_file, self.keys_file, self.meta_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.dim = None
+            self._rows = {}
+            self._count = 0
+            self._matrix = None
+
+
+def load_encoder(model_name: str, backend: str = 'torch', threads: Optional[int] = None,
+                 onnx_file: Optional[str] = None):
+    """
+    SentenceTransformer on CPU
+    backend: 'torch', or 'onnx' (needs sentence-transformers[onnx]); onnx_file picks a
+        variant from the model repo, e.g. 'onnx/model_qint8_avx512.onnx' for int8 weights
+    threads: intra-op threads per batch (torch only; None keeps the default)
+    """
+    from sentence_transformers import SentenceTransformer
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend!r}")
+    if backend == 'onnx':
+        model_kwargs = {'file_name': onnx_file} if onnx_file else {}
+        return SentenceTransformer(model_name, device='cpu', backend='onnx', model_kwargs=model_kwargs)
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return SentenceTransformer(model_name, device='cpu')
+
+
+class CachedEncoder:
+    """Unit-length embeddings for chunks, from the cache or computed batch_size at a time on `workers` threads"""
+
+    def __init__(self, model_name: str, cache: Optional[EmbeddingCache] = None, batch_size: int = 32,
+                 workers: Optional[int] = None, backend: str = 'torch', onnx_file: Optional[str] = None,
+                 model=None):
+        """
+        workers: batches embedded at once (default: one per CPU core). The torch backend
+            splits the cores between them, so all cores are busy without oversubscription
+        model: anything with SentenceTransformer's encode(), instead of loading model_name
+        """
+        self.model_name = model_name
+        self.cache = cache
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.backend = backend
+        self.onnx_file = onnx_file
+        self.hits = 0
+        self.misses = 0
+        self._model = model
+        self._model_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='embed') \
+            if self.workers > 1 else None
+
+    def get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                threads = max(1, (os.cpu_count() or 1) // self.workers)
+                self._model = load_encoder(self.model_name, self.backend, threads, self.onnx_file)
+            return self._model
+
+    def _embed(self, texts: List[str]):
+        return self.get_model().encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                       convert_to_numpy=True, show_progress_bar=False).astype('float32')
+
+    def embed_uncached(self, texts: List[str]):
+        """Embed texts in batches (in parallel when there are several), bypassing the cache"""
+        import numpy as np
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if self._pool is None or len(batches) < 2:
+            results = [self._embed(batch) for batch in batches]
+        else:
+            self.get_model()  # load once, not once per thread
+            results = list(self._pool.map(self._embed, batches))
+        return np.concatenate(results) if results else np.zeros((0, 0), dtype='float32')
+
+    def encode(self, texts: List[str], cache: bool = True):
+        """(len(texts), dim) float32 matrix; cache=False for one-off text such as queries"""
+        import numpy as np
+        if not cache or self.cache is None:
+            return self.embed_uncached(texts)
+        digests = [text_digest(text) for text in texts]
+        found = self.cache.get_many(digests)
+        missing = list({digest: text for digest, text in zip(digests, texts) if digest not in found}.items())
+        self.hits += len(texts) - sum(1 for digest in digests if digest not in found)
+        self.misses += len(missing)
+        if missing:
+            vectors = self.embed_uncached([text for _, text in missing])
+            self.cache.put_many([digest for digest, _ in missing], vectors)
+            found.update(zip((digest for digest, _ in missing), vectors))
+        return np.stack([found[digest] for digest in digests]) if texts else np.zeros((0, 0), dtype='float32')
@@ -0,0 +1,268 @@
+"""
+Embedding Index - Optional semantic retrieval for the Flask app
+Chunks are embedded on CPU in batches (through embedding_cache, so a chunk
+seen before is not embedded again), stored as a memory-mapped NumPy matrix
+(float32, or int8 with per-row scales) with their texts in an append-only
+JSON-lines file, and searched with one matrix-vector product. A small manifest
+records which rows each document currently owns, so adding a document appends
+its rows instead of rewriting the index. Writers hold a flock, so gunicorn
+workers can share one index directory. numpy and sentence-transformers are
+imported on first use so the web deployment starts without them
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set
+
+from embedding_cache import CachedEncoder, EmbeddingCache
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+FORMAT = 2  # ids.json layout; an index in any other layout is rebuilt
+
+
+class EmbeddingIndex:
+    """Append-only vector store; a document's live rows are the span it was last added as"""
+
+    def __init__(self, index_dir: str, model_name: str, batch_size: int = 32, quantize: bool = False,
+                 cache_dir: Optional[str] = None, workers: Optional[int] = None, backend: str = 'torch',
+                 onnx_file: Optional[str] = None):
+        """
+        cache_dir: chunk embedding cache (None to always embed)
+        workers, backend, onnx_file: see embedding_cache.CachedEncoder
+        """
+        self.index_dir = index_dir
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.dtype = 'int8' if quantize else 'float32'
+        self.vectors_file = os.path.join(index_dir, f"vectors.{self.dtype}")
+        self.scales_file = os.path.join(index_dir, "scales.float32")
+        self.chunks_file = os.path.join(index_dir, "chunks.jsonl")  # [source, text] per matrix row
+        self.ids_file = os.path.join(index_dir, "ids.json")  # dim, row count and each document's span
+        self.lock_file = os.path.join(index_dir, ".lock")
+        self._lock = threading.RLock()
+        cache = EmbeddingCache(cache_dir, model_name, backend, onnx_file) if cache_dir else None
+        self.encoder = CachedEncoder(model_name, cache, batch_size=batch_size, workers=workers, backend=backend,
+                                     onnx_file=onnx_file)
+        os.makedirs(index_dir, exist_ok=True)
+        self._reset()
+        with self._lock, self._locked():
+            self._reload()
+            if self._ids_stat is None and os.path.exists(self.ids_file):
+                self._clear_files()  # another model, dtype or layout
+
+    def _reset(self):
+        self.dim = None
+        self.spans = {}  # source -> [first row, end row, content key]
+        self.texts = []  # chunk text per matrix row
+        self.row_sources = []  # source per matrix row
+        self._count = 0  # committed rows
+        self._generation = 0  # bumped by every compaction, which renumbers rows
+        self._chunks_offset = 0  # bytes of chunks_file read so far
+        self._ids_stat = None
+        self._matrix = None  # memmap over vectors_file, reopened whenever rows change
+        self._scales = None
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        """Cross-process lock around the index files (writers exclusive, reloads shared)"""
+        with open(self.lock_file, 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _stat(self):
+        try:
+            st = os.stat(self.ids_file)
+            return st.st_mtime_ns, st.st_size, st.st_ino
+        except OSError:
+            return None
+
+    def _sync(self):
+        """Pick up rows other processes have committed since the last look (caller holds self._lock)"""
+        if self._stat() != self._ids_stat:
+            with self._locked(exclusive=False):
+                self._reload()
+
+    def _reload(self):
+        """Re-read the manifest and any new chunk lines (caller holds both locks)"""
+        stat = self._stat()
+        if stat == self._ids_stat:
+            return
+        try:
+            with open(self.ids_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if (data.get('format'), data.get('model'), data.get('dtype')) != (FORMAT, self.model_name, self.dtype):
+                data = None
+        except (OSError, ValueError):
+            data = None
+        if data is None:
+            self._reset()
+            return
+        if data['generation'] != self._generation or data['rows'] < self._count:
+            self.texts, self.row_sources, self._chunks_offset = [], [], 0
+        try:
+            with open(self.chunks_file, 'rb') as f:
+                f.seek(self._chunks_offset)
+                while len(self.texts) < data['rows']:
+                    source, text = json.loads(f.readline())
+                    self.texts.append(text)
+                    self.row_sources.append(source)
+                self._chunks_offset = f.tell()
+        except (OSError, ValueError):
+            self._reset()  # chunk file shorter than the manifest: rebuilt like any unreadable index
+            return
+        self.dim, self.spans, self._count = data['dim'], data['spans'], data['rows']
+        self._generation, self._ids_stat = data['generation'], stat
+        self._open_matrix()
+
+    def _save_ids(self):
+        tmp_path = f"{self.ids_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'format': FORMAT, 'model': self.model_name, 'dtype': self.dtype, 'dim': self.dim,
+                                'rows': self._count, 'generation': self._generation, 'spans': self.spans}))
+        os.replace(tmp_path, self.ids_file)
+        self._ids_stat = self._stat()
+
+    def _open_matrix(self):
+        import numpy as np
+        if not self._count:
+            self._matrix = self._scales = None
+            return
+        shape = (self._count, self.dim)
+        self._matrix = np.memmap(self.vectors_file, dtype=self.dtype, mode='r', shape=shape)
+        if self.dtype == 'int8':
+            self._scales = np.memmap(self.scales_file, dtype='float32', mode='r', shape=(self._count,))
+
+    def _truncate_uncommitted(self):
+        """Drop whatever a writer that died mid-append left past the committed rows"""
+        itemsize = 1 if self.dtype == 'int8' else 4
+        for path, size in ((self.vectors_file, self._count * (self.dim or 0) * itemsize),
+                           (self.scales_file, self._count * 4), (self.chunks_file, self._chunks_offset)):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def embed(self, texts: List[str], cache: bool = True):
+        """Unit-length float32 embeddings, computed batch_size texts at a time"""
+        return self.encoder.encode(texts, cache=cache)
+
+    @property
+    def sources(self) -> List[str]:
+        with self._lock:
+            self._sync()
+            return list(self.spans)
+
+    def has_document(self, source: str, key: Optional[str] = None) -> bool:
+        with self._lock:
+            self._sync()
+            return source in self.spans and (key is None or self.spans[source][2] == key)
+
+    def add_document(self, source: str, chunks: List[str], key: Optional[str] = None):
+        """Embed a document's chunks and append them, replacing earlier rows for source"""
+        vectors = self.embed(chunks) if chunks else None
+        with self._lock, self._locked():
+            self._reload()
+            self._truncate_uncommitted()
+            start = self._count
+            if vectors is not None:
+                import numpy as np
+                self.dim = vectors.shape[1]
+                with open(self.vectors_file, 'ab') as f:
+                    if self.dtype == 'int8':
+                        scales = np.abs(vectors).max(axis=1) / 127.0
+                        scales[scales == 0] = 1.0
+                        f.write(np.round(vectors / scales[:, None]).astype('int8').tobytes())
+                        with open(self.scales_file, 'ab') as sf:
+                            sf.write(scales.astype('float32').tobytes())
+                    else:
+                        f.write(vectors.tobytes())
+                lines = ''.join(json.dumps([source, chunk], ensure_ascii=False) + '\n' for chunk in chunks)
+                with open(self.chunks_file, 'ab') as f:
+                    f.write(lines.encode('utf-8'))
+                    self._chunks_offset = f.tell()
+                self.texts.extend(chunks)
+                self.row_sources.extend([source] * len(chunks))
+                self._count += len(chunks)
+            self.spans[source] = [start, self._count, key]
+            self._commit()
+
+    def remove_document(self, source: str):
+        """Forget source; its rows stay in the files until the next compaction"""
+        with self._lock, self._locked():
+            self._reload()
+            if self.spans.pop(source, None) is not None:
+                self._commit()
+
+    def _commit(self):
+        """Compact if most rows are dead, then publish the manifest (caller holds both locks)"""
+        live = sum(end - begin for begin, end, _ in self.spans.values())
+        if (self._count - live) * 2 > self._count:
+            self._compact()
+        self._save_ids()
+        self._open_matrix()
+
+    def _compact(self):
+        """Rewrite the matrix and chunk texts without dead rows"""
+        import numpy as np
+        self._open_matrix()
+        live = [i for begin, end, _ in sorted(self.spans.values()) for i in range(begin, end)]
+        for path, rows in ((self.vectors_file, self._matrix), (self.scales_file, self._scales)):
+            if rows is None:
+                continue
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(np.ascontiguousarray(rows[live]).tobytes())
+            os.replace(tmp_path, path)
+        self.texts = [self.texts[i] for i in live]
+        self.row_sources = [self.row_sources[i] for i in live]
+        tmp_path = f"{self.chunks_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            for source, text in zip(self.row_sources, self.texts):
+                f.write((json.dumps([source, text], ensure_ascii=False) + '\n').encode('utf-8'))
+            self._chunks_offset = f.tell()
+        os.replace(tmp_path, self.chunks_file)
+        row = 0
+        for span in sorted(self.spans.values()):
+            span[0], span[1], row = row, row + span[1] - span[0], row + span[1] - span[0]
+        self._count = len(live)
+        self._generation += 1
+
+    def _clear_files(self):
+        for path in (self.vectors_file, self.scales_file, self.chunks_file, self.ids_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def clear(self):
+        with self._lock, self._locked():
+            self._clear_files()
+            self._reset()
+
+    def search(self, query: str, top_k: int = 5, sources: Optional[Set[str]] = None) -> List[Dict]:
+        """Top-k live chunks (of sources, when given) by cosine similarity to the query"""
+        import numpy as np
+        with self._lock:
+            self._sync()
+            if not self._count:
+                return []
+            matrix, scales, texts, row_sources = self._matrix, self._scales, self.texts, self.row_sources
+            spans = [(begin, end) for source, (begin, end, _) in self.spans.items()
+                     if sources is None or source in sources]
+        live = np.zeros(len(matrix), dtype=bool)
+        for begin, end in spans:
+            live[begin:end] = True
+        query_vector = self.embed([query], cache=False)[0]
+        scores = matrix @ query_vector if scales is None else (matrix @ query_vector) * scales
+        scores = np.where(live, scores, -np.inf)
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [{'source': row_sources[i], 'text': texts[i], 'score': float(scores[i])}
+                for i in best if np.isfinite(scores[i])]
@@ -0,0 +1,184 @@
+"""
+Ingestion Jobs - Background queue that extracts, chunks, embeds and indexes
+documents so that /upload and /reindex return at once and /chat never waits
+on parsing. Each job tracks per-file status for /jobs/<id> and its SSE stream
+"""
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional
+
+from rate_limiter import backoff_delay
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Job:
+    """One batch of files and the status of each"""
+
+    def __init__(self, kind: str, names: List[str], scope: str = ''):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.scope = scope  # whose documents these names are (file names are only unique within it)
+        self.created = time.time()
+        self.finished = None
+        self.files = OrderedDict((name, {'status': QUEUED, 'stage': None, 'attempts': 0, 'error': None})
+                                 for name in names)
+        if not names:
+            self.finished = self.created
+
+    @property
+    def status(self) -> str:
+        states = [f['status'] for f in self.files.values()]
+        if self.finished is None:
+            return RUNNING if any(s != QUEUED for s in states) else QUEUED
+        return FAILED if FAILED in states else DONE
+
+    def to_dict(self) -> Dict:
+        counts = {}
+        for f in self.files.values():
+            counts[f['status']] = counts.get(f['status'], 0) + 1
+        return {'id': self.id, 'kind': self.kind, 'status': self.status, 'created': self.created,
+                'finished': self.finished, 'counts': counts,
+                'files': [dict(f, name=name) for name, f in self.files.items()]}
+
+
+class JobQueue:
+    """Worker threads pulling (job, file) tasks; failed files are retried with backoff"""
+
+    def __init__(self, workers: int = 2, max_retries: int = 2, keep_jobs: int = 100):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.keep_jobs = keep_jobs
+        self._tasks = []  # heap of (not_before, sequence, job, name, handler)
+        self._pending = threading.Condition()  # guards _tasks, wakes workers when a task is added
+        self._sequence = itertools.count()
+        self._jobs = OrderedDict()
+        self._cond = threading.Condition()
+        self._version = 0  # bumped on every status change, wakes watch()
+        self._threads = []
+
+    def _start(self):
+        if not self._threads:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'ingest-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind: str, names: List[str], handler: Callable[[str, Callable[[str], None]], None],
+               scope: str = '') -> Job:
+        """
+        Queue handler(name, report_stage) for every name and return the job
+        handler raises to signal failure; report_stage(stage) updates the file's progress
+        scope: namespace the names belong to, for active_names()
+        """
+        job = Job(kind, list(dict.fromkeys(names)), scope)
+        with self._cond:
+            self._start()
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep_jobs:
+                self._jobs.popitem(last=False)
+            for name in job.files:
+                self._put(0.0, job, name, handler)
+            self._changed()
+        return job
+
+    def _put(self, not_before: float, job: Job, name: str, handler):
+        with self._pending:
+            heapq.heappush(self._tasks, (not_before, next(self._sequence), job, name, handler))
+            self._pending.notify()
+
+    def _take(self):
+        """Block until a task is due (retries wait out their backoff here) and pop it"""
+        with self._pending:
+            while True:
+                if self._tasks:
+                    delay = self._tasks[0][0] - time.monotonic()
+                    if delay <= 0:
+                        return heapq.heappop(self._tasks)
+                    self._pending.wait(delay)
+                else:
+                    self._pending.wait()
+
+    def _changed(self):
+        self._version += 1
+        self._cond.notify_all()
+
+    def _update(self, job: Job, name: str, **fields):
+        with self._cond:
+            job.files[name].update(fields)
+            if job.finished is None and all(f['status'] in (DONE, FAILED) for f in job.files.values()):
+                job.finished = time.time()
+            self._changed()
+
+    def _work(self):
+        while True:
+            _, _, job, name, handler = self._take()
+            attempts = job.files[name]['attempts'] + 1
+            self._update(job, name, status=RUNNING, attempts=attempts, error=None)
+            try:
+                handler(name, lambda stage: self._update(job, name, stage=stage))
+                self._update(job, name, status=DONE, stage=None)
+            except Exception as e:
+                print(f"Ingestion of {name} failed (attempt {attempts}): {e}")
+                if attempts <= self.max_retries:
+                    self._update(job, name, status=QUEUED, error=str(e))
+                    self._put(time.monotonic() + backoff_delay(attempts - 1), job, name, handler)
+                else:
+                    self._update(job, name, status=FAILED, error=str(e))
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def active_names(self, scope: str = '') -> set:
+        """Files of one scope queued or being ingested by any job"""
+        return set(self.active_jobs(scope))
+
+    def active_jobs(self, scope: str = '') -> Dict[str, str]:
+        """name -> id of the job ingesting it, for files of one scope that are queued or running"""
+        with self._cond:
+            return {name: job.id for job in self._jobs.values() if job.finished is None and job.scope == scope
+                    for name, f in job.files.items() if f['status'] in (QUEUED, RUNNING)}
+
+    def pending_count(self) -> int:
+        """Files queued or being ingested, across every scope"""
+        with self._cond:
+            return sum(f['status'] in (QUEUED, RUNNING) for job in self._jobs.values() if job.finished is None
+                       for f in job.files.values())
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Block until the job has finished (or timeout). Returns its final snapshot"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or job.finished is not None:
+                    return job.to_dict() if job else None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return job.to_dict()
+                self._cond.wait(remaining)
+
+    def watch(self, job_id: str, heartbeat: float = 15.0) -> Iterator[Dict]:
+        """Yield a snapshot of the job whenever it changes, ending once it has finished"""
+        seen = None
+        while True:
+            with self._cond:
+                if self._version == seen:
+                    self._cond.wait(heartbeat)
+                seen = self._version
+                job = self._jobs.get(job_id)
+                snapshot = job.to_dict() if job else None
+            if snapshot is None:
+                return
+            yield snapshot
+            if snapshot['finished'] is not None:
+                return
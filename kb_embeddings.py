@@ -0,0 +1,42 @@
+"""
+Knowledge Base Embeddings - LlamaIndex embedding model backed by embedding_cache
+Rebuilding the Streamlit index only embeds chunks whose text has not been
+embedded before; the rest come from the on-disk cache. Imports LlamaIndex, so
+app.py only imports it on the warm-up thread
+"""
+from typing import List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+from embedding_cache import CachedEncoder
+
+MAX_EMBED_BATCH = 2048  # LlamaIndex's upper bound for embed_batch_size
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Drop-in for HuggingFaceEmbedding (same normalised sentence-transformers vectors)"""
+
+    _encoder: CachedEncoder = PrivateAttr()
+
+    def __init__(self, encoder: CachedEncoder, **kwargs):
+        # Hand the encoder enough chunks per call to keep every worker busy
+        batch = min(MAX_EMBED_BATCH, encoder.batch_size * encoder.workers)
+        super().__init__(model_name=encoder.model_name, embed_batch_size=batch, **kwargs)
+        self._encoder = encoder
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._encoder.encode([query], cache=False)[0].tolist()
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._encoder.encode(texts).tolist()
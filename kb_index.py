@@ -0,0 +1,113 @@
+"""
+Knowledge Base Index - Incremental (re)indexing for the Streamlit app
+A manifest of file hashes lives inside PERSIST_DIR, so a refresh embeds only
+new or changed files and deletes the nodes of removed ones. LlamaIndex is
+imported on the first sync, not when the module is loaded
+"""
+import hashlib
+import json
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+MANIFEST_NAME = "manifest.json"
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file, read in 1 MB blocks"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(persist_dir: str) -> Optional[Dict]:
+    """{filename: {'hash': ..., 'ref_doc_ids': [...]}}, or None if there is no manifest"""
+    path = os.path.join(persist_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except:
+            pass
+    return None
+
+
+def save_manifest(persist_dir: str, manifest: Dict):
+    os.makedirs(persist_dir, exist_ok=True)
+    path = os.path.join(persist_dir, MANIFEST_NAME)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def manifest_version(manifest: Dict) -> str:
+    """Short hash of a manifest: identifies the index contents across reloads and processes"""
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def list_data_files(data_dir: str) -> Dict[str, str]:
+    """filename -> path for every regular, non-hidden file in data_dir"""
+    if not os.path.exists(data_dir):
+        return {}
+    return {name: os.path.join(data_dir, name) for name in sorted(os.listdir(data_dir))
+            if os.path.isfile(os.path.join(data_dir, name)) and not name.startswith('.')}
+
+
+def sync_index(data_dir: str, persist_dir: str, progress: Optional[Callable[[float, str], None]] = None
+               ) -> Tuple[Optional["VectorStoreIndex"], Dict]:
+    """
+    Bring the persisted index in line with data_dir
+    Returns (index or None when there are no files, {'added', 'updated', 'removed', 'unchanged', 'version'}),
+    where version is the manifest_version of the synced index
+    """
+    from llama_index.core import (
+        VectorStoreIndex,
+        SimpleDirectoryReader,
+        StorageContext,
+        load_index_from_storage
+    )
+    report = progress or (lambda fraction, message: None)
+    files = list_data_files(data_dir)
+    manifest = load_manifest(persist_dir)
+
+    index = None
+    if manifest is not None and os.path.exists(os.path.join(persist_dir, "docstore.json")):
+        try:
+            storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+            index = load_index_from_storage(storage_context)
+        except:
+            index = None
+    if index is None:
+        # No manifest (or unreadable storage): nothing can be reused, start empty
+        manifest = {}
+        index = VectorStoreIndex([], storage_context=StorageContext.from_defaults())
+
+    report(0.05, "Checking for changed files...")
+    hashes = {name: file_digest(path) for name, path in files.items()}
+    removed = [name for name in manifest if name not in files]
+    changed = [name for name in files if name in manifest and manifest[name]['hash'] != hashes[name]]
+    added = [name for name in files if name not in manifest]
+    stats = {'added': len(added), 'updated': len(changed), 'removed': len(removed),
+             'unchanged': len(files) - len(added) - len(changed)}
+
+    for name in removed + changed:
+        for ref_doc_id in manifest[name]['ref_doc_ids']:
+            index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+        del manifest[name]
+
+    to_embed = changed + added
+    for i, name in enumerate(to_embed):
+        report(0.1 + 0.8 * i / len(to_embed), f"Embedding {name} ({i + 1}/{len(to_embed)})...")
+        documents = SimpleDirectoryReader(input_files=[files[name]]).load_data()
+        for document in documents:
+            index.insert(document)
+        manifest[name] = {'hash': hashes[name], 'ref_doc_ids': [d.doc_id for d in documents]}
+
+    if removed or to_embed or not os.path.exists(os.path.join(persist_dir, MANIFEST_NAME)):
+        report(0.95, "Saving index...")
+        index.storage_context.persist(persist_dir=persist_dir)
+        save_manifest(persist_dir, manifest)
+    stats['version'] = manifest_version(manifest)
+    report(1.0, "Done")
+    return (index if files else None), stats
@@ -0,0 +1,133 @@
+"""
+Knowledge Base Retrieval - Tunable retriever for the Streamlit app
+Keyword (BM25 over the index's nodes) and vector candidates are fused by
+reciprocal rank, then maximal marginal relevance drops near-duplicate passages.
+Imports LlamaIndex, so app.py only imports it once the index exists
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+
+from llama_index.core import Settings
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from retrieval import BM25Index, reciprocal_rank_fusion
+
+VECTOR = 'vector'
+KEYWORD = 'keyword'
+HYBRID = 'hybrid'
+MODES = (HYBRID, VECTOR, KEYWORD)
+CANDIDATES_PER_RESULT = 4  # candidates fetched per returned node when fusing or diversifying
+WHOLE_NODE = 1 << 30       # BM25 chunk size that keeps every node in one chunk
+
+
+def build_keyword_index(index) -> BM25Index:
+    """BM25 over every node in the index's docstore, keyed by node id"""
+    keyword_index = BM25Index(chunk_size=WHOLE_NODE, overlap=0)
+    for node_id, node in index.docstore.docs.items():
+        keyword_index.add_document(node_id, node.get_content())
+    return keyword_index
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def mmr(query_embedding: List[float], candidates: List[Tuple[str, List[float]]], top_k: int,
+        relevance_weight: float) -> List[str]:
+    """
+    Maximal marginal relevance: repeatedly pick the candidate that is most similar to
+    the query and least similar to what is already picked. Returns node ids
+    """
+    relevance = {node_id: cosine(query_embedding, embedding) for node_id, embedding in candidates}
+    embeddings = dict(candidates)
+    selected = []
+    remaining = [node_id for node_id, _ in candidates]
+    while remaining and len(selected) < top_k:
+        def score(node_id):
+            redundancy = max((cosine(embeddings[node_id], embeddings[s]) for s in selected), default=0.0)
+            return relevance_weight * relevance[node_id] - (1 - relevance_weight) * redundancy
+        best = max(remaining, key=score)
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+
+class HybridRetriever(BaseRetriever):
+    """Vector, keyword or fused retrieval over a VectorStoreIndex, optionally diversified with MMR"""
+
+    def __init__(self, index, top_k: int = 4, mode: str = HYBRID, mmr_lambda: Optional[float] = None,
+                 keyword_index: Optional[BM25Index] = None):
+        """
+        mmr_lambda: relevance weight for MMR (1.0 = pure relevance), None to skip MMR
+        keyword_index: prebuilt build_keyword_index(index), shared between retrievers
+        """
+        super().__init__()
+        self.index = index
+        self.top_k = top_k
+        self.mode = mode
+        self.mmr_lambda = mmr_lambda
+        self.keyword_index = keyword_index if mode != VECTOR else None
+        if mode != VECTOR and keyword_index is None:
+            self.keyword_index = build_keyword_index(index)
+        fused = mode == HYBRID or mmr_lambda is not None
+        self.candidates = top_k * CANDIDATES_PER_RESULT if fused else top_k
+        self.vector_retriever = index.as_retriever(similarity_top_k=self.candidates) if mode != KEYWORD else None
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self.retrieve_with_details(query_bundle)[0]
+
+    def retrieve_with_details(self, query) -> Tuple[List[NodeWithScore], List[Dict]]:
+        """
+        The nodes to answer from, plus per node {'file', 'score', 'similarity',
+        'vector_rank', 'keyword_rank'} for display (ranks are 1-based, None if absent)
+        """
+        query_bundle = query if isinstance(query, QueryBundle) else QueryBundle(query)
+        nodes = {}
+        similarity, bm25 = {}, {}
+        ranked = []
+        vector_rank, keyword_rank = {}, {}
+        if self.vector_retriever:
+            hits = self.vector_retriever.retrieve(query_bundle)
+            for rank, hit in enumerate(hits, 1):
+                nodes[hit.node.node_id] = hit.node
+                similarity[hit.node.node_id] = hit.score
+                vector_rank[hit.node.node_id] = rank
+            ranked.append([{'source': hit.node.node_id, 'text': ''} for hit in hits])
+        if self.keyword_index:
+            hits = self.keyword_index.search(query_bundle.query_str, self.candidates)
+            for rank, hit in enumerate(hits, 1):
+                nodes.setdefault(hit['source'], self.index.docstore.get_node(hit['source']))
+                keyword_rank[hit['source']] = rank
+                bm25[hit['source']] = hit['score']
+            ranked.append([{'source': hit['source'], 'text': ''} for hit in hits])
+
+        fused = reciprocal_rank_fusion(ranked, self.candidates)
+        # Fused lists are scored by reciprocal rank; a single list keeps its own scores
+        scores = {VECTOR: similarity, KEYWORD: bm25}.get(self.mode) or \
+            {hit['source']: hit['score'] for hit in fused}
+        order = [hit['source'] for hit in fused]
+        if self.mmr_lambda is not None and len(order) > self.top_k:
+            order = self._diversify(query_bundle, order)
+        order = order[:self.top_k]
+
+        results = [NodeWithScore(node=nodes[node_id], score=scores[node_id]) for node_id in order]
+        details = [{'file': nodes[node_id].metadata.get('file_name', node_id),
+                    'score': scores[node_id],
+                    'similarity': similarity.get(node_id),
+                    'vector_rank': vector_rank.get(node_id),
+                    'keyword_rank': keyword_rank.get(node_id)} for node_id in order]
+        return results, details
+
+    def _diversify(self, query_bundle: QueryBundle, order: List[str]) -> List[str]:
+        """MMR over the fused candidates, using the embeddings already in the vector store"""
+        query_embedding = query_bundle.embedding or Settings.embed_model.get_query_embedding(query_bundle.query_str)
+        candidates = []
+        for node_id in order:
+            try:
+                candidates.append((node_id, self.index.vector_store.get(node_id)))
+            except Exception:
+                return order  # store can't hand embeddings back; keep the fused order
+        return mmr(query_embedding, candidates, self.top_k, self.mmr_lambda)
@@ -0,0 +1,148 @@
+"""
+Metrics - In-process counters, histograms and timing spans, rendered in the
+Prometheus text format by /metrics. Standard library only
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_text(labels: Tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set"""
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_label_text(key + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{_label_text(key + (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(key)} {round(series[-2], 6)}")
+                lines.append(f"{self.name}_count{_label_text(key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time"""
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], float]):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Registry:
+    """Named metrics, created on first use so modules can share them by name"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get(name, lambda: Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(name, lambda: Histogram(name, help_text, buckets))
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], float]) -> Gauge:
+        with self._lock:
+            self._metrics[name] = Gauge(name, help_text, fn)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram("chatbot_stage_seconds", "Time spent in each pipeline stage")
+TTFT_SECONDS = REGISTRY.histogram("chatbot_time_to_first_token_seconds",
+                                  "From /chat request to the first answer chunk")
+STREAM_SECONDS = REGISTRY.histogram("chatbot_stream_seconds", "From the first answer chunk to the last")
+ANSWER_CACHE = REGISTRY.counter("chatbot_answer_cache_total", "Answer cache lookups by result")
+MAP_SHARDS = REGISTRY.counter("chatbot_map_shards_total", "Map-reduce shard extractions by result")
+GEMINI_RETRIES = REGISTRY.counter("chatbot_gemini_retries_total", "Gemini calls retried after an error")
+GEMINI_RATE_LIMITED = REGISTRY.counter("chatbot_gemini_rate_limited_total", "Gemini calls answered with 429")
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.histogram("chatbot_rate_limit_wait_seconds",
+                                             "Time Gemini calls waited for a rate-limit slot, by priority")
+
+
+@contextmanager
+def span(stage: str, timings: Optional[Dict[str, float]] = None):
+    """Time a block into chatbot_stage_seconds{stage}, and into timings[stage] when given"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed, 6)
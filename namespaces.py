@@ -0,0 +1,158 @@
+"""
+Namespaces - Per-session document sets
+Each browser session gets its own documents directory under DATA_DIR (hard links
+into the shared blob store) and its own corpus snapshot, so prompts only carry
+the caller's documents. Identical files across sessions share one blob, one
+extracted text and one index entry. Namespaces nobody has used for a while are
+garbage-collected in the background
+"""
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+from typing import Callable, List, Optional
+
+SHARED = ''  # the one namespace used when sessions are not separated
+TOUCH_INTERVAL = 60  # seconds between idle-clock updates of a busy namespace
+_NAME = re.compile(r'[0-9a-f]{32}')
+
+
+class Namespace:
+    """One session's documents: its directory, blob store and corpus registry"""
+
+    def __init__(self, name: str, data_dir: str, corpus, blob_store=None):
+        self.name = name
+        self.data_dir = data_dir
+        self.corpus = corpus
+        self.blob_store = blob_store  # None when documents live in Cloudinary
+        self.answers_generation = 0  # part of its answer-cache keys; bumped to drop them all
+        self.last_used = time.time()
+        self._touched = 0.0
+
+    def touch(self):
+        """Mark the namespace as in use; the directory mtime is its idle clock on disk"""
+        now = self.last_used = time.time()
+        if now - self._touched < TOUCH_INTERVAL:
+            return
+        try:
+            os.utime(self.data_dir)
+            self._touched = now
+        except OSError:
+            pass  # nothing uploaded yet
+
+
+class NamespaceManager:
+    """Creates namespaces on demand, polls their corpora and expires idle ones"""
+
+    def __init__(self, root_dir: str, factory: Callable[[str, str], Namespace], idle_seconds: float,
+                 poll_interval: float = 2.0, on_expire: Optional[Callable[[Namespace], None]] = None):
+        """
+        factory: function(name, data_dir) -> Namespace
+        idle_seconds: unused namespaces are deleted after this long (0 = never)
+        on_expire: called before an idle namespace's directory is removed
+        """
+        self.root_dir = root_dir
+        self.factory = factory
+        self.idle_seconds = idle_seconds
+        self.poll_interval = poll_interval
+        self.on_expire = on_expire
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @staticmethod
+    def new_name() -> str:
+        return secrets.token_hex(16)
+
+    @staticmethod
+    def valid_name(name) -> bool:
+        return name == SHARED or bool(isinstance(name, str) and _NAME.fullmatch(name))
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.root_dir, name) if name else self.root_dir
+
+    def get(self, name: str) -> Namespace:
+        if not self.valid_name(name):
+            raise ValueError(f"Invalid namespace: {name!r}")
+        with self._lock:
+            namespace = self._namespaces.get(name)
+            if namespace is None:
+                namespace = self.factory(name, self.path_for(name))
+                self._namespaces[name] = namespace
+        return namespace
+
+    def on_disk(self) -> List[str]:
+        """Names of the session namespaces that have a directory"""
+        if not os.path.isdir(self.root_dir):
+            return []
+        return [entry.name for entry in os.scandir(self.root_dir)
+                if entry.is_dir() and _NAME.fullmatch(entry.name)]
+
+    def loaded(self) -> List[Namespace]:
+        with self._lock:
+            return list(self._namespaces.values())
+
+    def load_all(self) -> List[Namespace]:
+        """Every namespace on disk (after a restart, for warm-up)"""
+        for name in self.on_disk():
+            self.get(name)
+        return self.loaded()
+
+    def discard(self, name: str):
+        """Forget a session namespace and delete its (already emptied) directory"""
+        with self._lock:
+            self._namespaces.pop(name, None)
+        shutil.rmtree(self.path_for(name), ignore_errors=True)
+
+    def expire_idle(self) -> List[str]:
+        """Delete session namespaces unused for idle_seconds. Returns their names"""
+        if not self.idle_seconds:
+            return []
+        expired = []
+        cutoff = time.time() - self.idle_seconds
+        for name in self.on_disk():
+            path = self.path_for(name)
+            try:
+                if os.stat(path).st_mtime >= cutoff:
+                    continue
+            except OSError:
+                continue
+            namespace = self.get(name)
+            with self._lock:
+                self._namespaces.pop(name, None)
+            if self.on_expire:
+                try:
+                    self.on_expire(namespace)
+                except Exception as e:
+                    print(f"Namespace cleanup error: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            expired.append(name)
+        # Sessions that never uploaded anything have no directory, only a loaded namespace
+        with self._lock:
+            for name, namespace in list(self._namespaces.items()):
+                if name != SHARED and namespace.last_used < cutoff and not os.path.isdir(namespace.data_dir):
+                    del self._namespaces[name]
+        if expired:
+            print(f"🧹 Removed {len(expired)} idle namespace(s)")
+        return expired
+
+    def start(self):
+        """Poll every loaded corpus for outside changes, and expire idle namespaces, on one thread"""
+        if self._thread is None and self.poll_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='namespaces', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        last_gc = time.monotonic()
+        while True:
+            time.sleep(self.poll_interval)
+            for namespace in self.loaded():
+                try:
+                    namespace.corpus.poll()
+                except Exception as e:
+                    print(f"Corpus scan error: {e}")
+            if self.idle_seconds and time.monotonic() - last_gc >= min(self.idle_seconds, 600):
+                last_gc = time.monotonic()
+                self.expire_idle()
@@ -0,0 +1,135 @@
+"""
+PDF Extraction - Page-parallel text extraction for uploaded PDFs
+Pages are sharded across a process pool and yielded back in page order. The
+PDF is written to a temp file once and each worker parses it once, rather than
+every shard shipping and re-parsing the whole file. Workers are started with
+forkserver (spawn where that is missing), never forked from the threaded server
+pypdf is imported on first use, keeping it off the server's start-up path
+"""
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", 2000))      # pages beyond this are ignored
+PDF_TIMEOUT = float(os.getenv("PDF_TIMEOUT", 120))         # seconds per file
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", 16))
+PARALLEL_MIN_PAGES = 32  # smaller PDFs are cheaper to parse inline than to ship to the pool
+
+_executor = None
+_worker_reader = None  # in a worker: (path, PdfReader) of the PDF it last parsed
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Shared process pool, created on first use"""
+    global _executor
+    if _executor is None:
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _executor
+
+
+def _discard_executor(executor: ProcessPoolExecutor):
+    """Forget a pool whose worker died (killed, out of memory); the next call starts a fresh one"""
+    global _executor
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def warm_up():
+    """Import pypdf and create the process pool ahead of the first upload"""
+    import pypdf  # noqa: F401
+    _get_executor()
+
+
+def _page_text(page) -> str:
+    try:
+        return page.extract_text() or ""
+    except:
+        return ""
+
+
+def _extract_shard(path: str, start: int, stop: int, deadline: float) -> List[str]:
+    """
+    Worker: extract pages [start, stop) of the PDF at path (a unique temp file), parsed once per worker
+    Gives up at deadline (wall-clock), since a shard that is already running can't be cancelled
+    """
+    global _worker_reader
+    if _worker_reader is None or _worker_reader[0] != path:
+        from pypdf import PdfReader
+        _worker_reader = (path, PdfReader(path))
+    reader = _worker_reader[1]
+    texts = []
+    for i in range(start, stop):
+        if time.time() > deadline:
+            raise TimeoutError(f"PDF extraction deadline passed at page {i}")
+        texts.append(_page_text(reader.pages[i]))
+    return texts
+
+
+def iter_pdf_pages(file_content: bytes, max_pages: int = PDF_MAX_PAGES, timeout: float = PDF_TIMEOUT,
+                   workers: int = PDF_WORKERS) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page_number, text) in page order as soon as each page is ready
+    Raises TimeoutError once the per-file timeout is used up, and BrokenProcessPool
+    if a worker died (the pool is replaced for the next call)
+    """
+    from pypdf import PdfReader
+    deadline = time.monotonic() + timeout
+    reader = PdfReader(io.BytesIO(file_content))
+    page_count = min(len(reader.pages), max_pages)
+    if len(reader.pages) > max_pages:
+        print(f"⚠️ PDF has {len(reader.pages)} pages, extracting only the first {max_pages}")
+
+    if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+        for i in range(page_count):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"PDF extraction exceeded {timeout}s at page {i}")
+            yield i, _page_text(reader.pages[i])
+        return
+
+    executor = _get_executor()
+    shards = [(start, min(start + PDF_PAGES_PER_SHARD, page_count))
+              for start in range(0, page_count, PDF_PAGES_PER_SHARD)]
+    # The name is never reused, so a worker's cached reader can't be mistaken for another PDF's
+    fd, path = tempfile.mkstemp(prefix=f'pdf-{uuid.uuid4().hex}-', suffix='.pdf')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(file_content)
+    futures = []
+    try:
+        wall_deadline = time.time() + (deadline - time.monotonic())
+        futures = [executor.submit(_extract_shard, path, start, stop, wall_deadline) for start, stop in shards]
+        for (start, _), future in zip(shards, futures):
+            try:
+                texts = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FuturesTimeout:
+                raise TimeoutError(f"PDF extraction exceeded {timeout}s at page {start}")
+            for offset, text in enumerate(texts):
+                yield start + offset, text
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+        os.remove(path)  # workers that are still running have already read it
+
+
+def extract_pdf_text(file_content: bytes, filename: Optional[str] = None, **kwargs) -> str:
+    """
+    Extract the text of a whole PDF
+    Raises on a timeout or a dead worker rather than returning part of the text,
+    so the caller can retry instead of caching an incomplete document
+    """
+    pages = []
+    for _, text in iter_pdf_pages(file_content, **kwargs):
+        if text:
+            pages.append(text)
+    return "\n\n".join(pages).strip()
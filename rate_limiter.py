@@ -0,0 +1,237 @@
+"""
+Rate Limiter - Token-bucket scheduling for every Gemini call
+Requests-per-minute and tokens-per-minute budgets are enforced before a call
+reaches the API, interactive chat is served before background work, and a 429
+pauses the whole process (every worker, with a state_dir) with jittered backoff
+instead of each caller retrying
+"""
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for quota / 429 errors from google-generativeai (or anything that looks like one)"""
+    if getattr(error, 'code', None) == 429 or type(error).__name__ in ('ResourceExhausted', 'TooManyRequests'):
+        return True
+    message = str(error).lower()
+    return '429' in message or 'quota' in message or 'rate limit' in message
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to `capacity` tokens, refilled at rate_per_minute"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _shortfall(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available, as of the last refill"""
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are now)"""
+        self._refill(time.monotonic())
+        return self._shortfall(amount)
+
+    def take(self, amount: float):
+        self._refill(time.monotonic())
+        self.tokens -= min(amount, self.capacity)
+
+
+class Pause:
+    """How long every queued call is held back after a 429 (this process only)"""
+
+    def __init__(self):
+        self.until = 0.0
+
+    def remaining(self) -> float:
+        return max(0.0, self.until - time.monotonic())
+
+    def extend(self, delay: float):
+        self.until = max(self.until, time.monotonic() + delay)
+
+
+class Budget:
+    """The RPM bucket, TPM bucket and 429 pause a call has to get past (this process only)"""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.request_bucket = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm)
+        self.pause = Pause()
+
+    def try_acquire(self, requests: float, tokens: float) -> float:
+        """
+        Spend `requests` and `tokens` if the pause is over and both buckets hold enough.
+        Returns 0 when spent, else the seconds to wait (nothing is spent)
+        """
+        wait = max(self.pause.remaining(), self.request_bucket.wait_time(requests),
+                   self.token_bucket.wait_time(tokens))
+        if wait > 0:
+            return wait
+        self.request_bucket.take(requests)
+        self.token_bucket.take(tokens)
+        return 0.0
+
+    def paused(self) -> float:
+        return self.pause.remaining()
+
+    def extend_pause(self, delay: float):
+        self.pause.extend(delay)
+
+
+class FileBudget(Budget):
+    """
+    Budget kept in one flock-guarded JSON file, so every gunicorn worker on the host
+    draws from the same buckets and a 429 seen by one worker holds back all of them.
+    try_acquire checks the pause and both buckets and debits them under a single lock,
+    so two workers can never both spend the last of the budget
+    """
+
+    def __init__(self, rpm: float, tpm: float, state_file: str):
+        super().__init__(rpm, tpm)
+        self.state_file = state_file
+        os.makedirs(os.path.dirname(state_file) or '.', exist_ok=True)
+
+    def _locked(self, fn):
+        """Load the shared state into the buckets, run fn(now) and write the state back, all under flock"""
+        import fcntl
+        with open(self.state_file, 'a+', encoding='utf-8') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or '{}')
+                except ValueError:
+                    state = {}
+                # Wall-clock time: monotonic clocks are not comparable between processes
+                now = time.time()
+                for key, bucket in (('requests', self.request_bucket), ('tokens', self.token_bucket)):
+                    saved = state.get(key) or {}
+                    bucket.tokens = saved.get('tokens', bucket.capacity)
+                    bucket.updated = saved.get('updated', now)
+                    bucket._refill(now)
+                self.pause.until = state.get('until', 0.0)
+                result = fn(now)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({
+                    'requests': {'tokens': self.request_bucket.tokens, 'updated': now},
+                    'tokens': {'tokens': self.token_bucket.tokens, 'updated': now},
+                    'until': self.pause.until,
+                }))
+                f.flush()  # before the lock is released, or the next reader finds the file empty
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def try_acquire(self, requests: float, tokens: float) -> float:
+        def attempt(now):
+            wait = max(self.pause.until - now, self.request_bucket._shortfall(requests),
+                       self.token_bucket._shortfall(tokens))
+            if wait > 0:
+                return wait
+            self.request_bucket.tokens -= min(requests, self.request_bucket.capacity)
+            self.token_bucket.tokens -= min(tokens, self.token_bucket.capacity)
+            return 0.0
+        return self._locked(attempt)
+
+    def paused(self) -> float:
+        return max(0.0, self._locked(lambda now: self.pause.until - now))
+
+    def extend_pause(self, delay: float):
+        def extend(now):
+            self.pause.until = max(self.pause.until, now + delay)
+        self._locked(extend)
+
+
+class RateLimiter:
+    """Priority queue in front of a Budget (an RPM bucket, a TPM bucket and the 429 pause)"""
+
+    def __init__(self, rpm: float, tpm: float, state_dir: Optional[str] = None):
+        if state_dir:
+            self.budget = FileBudget(rpm, tpm, os.path.join(state_dir, 'budget.json'))
+        else:
+            self.budget = Budget(rpm, tpm)
+        self._cond = threading.Condition()
+        self._queue = []  # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self.granted = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self, tokens: int = 0, priority: int = INTERACTIVE, timeout: Optional[float] = None) -> float:
+        """
+        Block until one request and `tokens` tokens may be spent, then spend them
+        Lower priority values are served first. Returns the time spent waiting
+        """
+        start = time.monotonic()
+        ticket = (priority, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if timeout is not None and now - start > timeout:
+                        raise TimeoutError("Timed out waiting for a Gemini rate-limit slot")
+                    if self._queue[0] == ticket:
+                        wait = self.budget.try_acquire(1, tokens)
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = 1.0  # woken up by notify_all when the head changes
+                    self._cond.wait(wait)
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+            waited = time.monotonic() - start
+            self.granted += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            return waited
+
+    def report_rate_limited(self, attempt: int) -> float:
+        """Record a 429 and hold every queued call back for a jittered backoff. Returns the pause"""
+        delay = backoff_delay(attempt)
+        with self._cond:
+            self.rate_limited += 1
+            self.budget.extend_pause(delay)
+            self._cond.notify_all()
+        return delay
+
+    def metrics(self) -> Dict:
+        """Queue depth and wait-time statistics"""
+        with self._cond:
+            return {
+                'queue_depth': len(self._queue),
+                'paused_seconds': round(self.budget.paused(), 3),
+                'granted': self.granted,
+                'rate_limited': self.rate_limited,
+                'total_wait_seconds': round(self.total_wait, 3),
+                'mean_wait_seconds': round(self.total_wait / self.granted, 3) if self.granted else 0.0,
+                'max_wait_seconds': round(self.max_wait, 3),
+            }
@@ -0,0 +1,161 @@
+"""
+Retrieval - Splits document text into overlapping chunks and ranks them against
+a query with BM25, so /chat only sends the relevant passages to the model
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens used for both indexing and querying"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def chunk_text(text: str, chunk_size: int = 200, overlap: int = 40) -> List[str]:
+    """Split text into chunks of chunk_size words, each sharing overlap words with the previous one"""
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, chunk_size - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_size]))
+        if start + chunk_size >= len(words):
+            break
+    return chunks
+
+
+class BM25Index:
+    """In-memory inverted index over document chunks with BM25 scoring"""
+
+    def __init__(self, chunk_size: int = 200, overlap: int = 40, k1: float = 1.5, b: float = 0.75):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        """Drop every document from the index"""
+        with self._lock:
+            self.chunks = {}         # chunk id -> {'source', 'text', 'length', 'terms'}
+            self.postings = {}       # term -> {chunk id: term frequency}
+            self.doc_chunks = {}     # source -> [chunk ids]
+            self.doc_keys = {}       # source -> content key the chunks were built from
+            self.total_length = 0
+            self.doc_chars = {}      # source -> characters of indexed text, for token estimates
+            self._next_id = 0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @property
+    def sources(self) -> List[str]:
+        with self._lock:
+            return list(self.doc_chunks)
+
+    def has_document(self, source: str, key: Optional[str] = None) -> bool:
+        """True if source is indexed (and, when key is given, was indexed from that content)"""
+        with self._lock:
+            if source not in self.doc_chunks:
+                return False
+            return key is None or self.doc_keys.get(source) == key
+
+    def add_document(self, source: str, text: str, key: Optional[str] = None) -> int:
+        """(Re)index a document, replacing any previous chunks for source. Returns the chunk count"""
+        chunks = chunk_text(text, self.chunk_size, self.overlap)
+        tokenized = [(chunk, Counter(tokenize(chunk))) for chunk in chunks]
+        with self._lock:
+            self.remove_document(source)
+            ids = []
+            for chunk, tf in tokenized:
+                chunk_id = self._next_id
+                self._next_id += 1
+                length = sum(tf.values())
+                self.chunks[chunk_id] = {'source': source, 'text': chunk, 'length': length, 'terms': list(tf)}
+                self.total_length += length
+                for term, count in tf.items():
+                    self.postings.setdefault(term, {})[chunk_id] = count
+                ids.append(chunk_id)
+            self.doc_chunks[source] = ids
+            self.doc_keys[source] = key
+            self.doc_chars[source] = sum(len(chunk) for chunk, _ in tokenized)
+        return len(ids)
+
+    def remove_document(self, source: str):
+        """Remove every chunk that belongs to source"""
+        with self._lock:
+            ids = self.doc_chunks.pop(source, None)
+            self.doc_keys.pop(source, None)
+            self.doc_chars.pop(source, None)
+            if not ids:
+                return
+            for chunk_id in ids:
+                chunk = self.chunks.pop(chunk_id)
+                self.total_length -= chunk['length']
+                for term in chunk['terms']:
+                    posting = self.postings[term]
+                    del posting[chunk_id]
+                    if not posting:
+                        del self.postings[term]
+
+    def text_chars(self, sources: Iterable[str]) -> int:
+        """Characters of indexed text across sources"""
+        with self._lock:
+            return sum(self.doc_chars.get(source, 0) for source in sources)
+
+    def search(self, query: str, top_k: int = 5, sources: Optional[Set[str]] = None) -> List[Dict]:
+        """
+        Return up to top_k chunks as dicts with 'source', 'text' and 'score', best first
+        sources: only consider chunks of these documents (None = all)
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self.chunks)
+            if not n or not terms:
+                return []
+            avg_length = self.total_length / n or 1.0
+            scores = {}
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                df = len(posting)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for chunk_id, tf in posting.items():
+                    if sources is not None and self.chunks[chunk_id]['source'] not in sources:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.chunks[chunk_id]['length'] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [{'source': self.chunks[chunk_id]['source'],
+                     'text': self.chunks[chunk_id]['text'],
+                     'score': score} for chunk_id, score in best]
+
+    def leading_chunks(self, top_k: int = 5, sources: Optional[Set[str]] = None) -> List[Dict]:
+        """First chunk of each document (of sources, when given), used when the query matches nothing"""
+        with self._lock:
+            results = []
+            for source, ids in self.doc_chunks.items():
+                if ids and (sources is None or source in sources):
+                    results.append({'source': source, 'text': self.chunks[ids[0]]['text'], 'score': 0.0})
+            return results[:top_k]
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict]], top_k: int = 5, k: int = 60) -> List[Dict]:
+    """Merge several ranked hit lists: each hit scores sum(1 / (k + rank)) across the lists"""
+    fused = {}
+    for results in result_lists:
+        for rank, hit in enumerate(results):
+            key = (hit['source'], hit['text'])
+            if key not in fused:
+                fused[key] = dict(hit, score=0.0)
+            fused[key]['score'] += 1.0 / (k + rank + 1)
+    return heapq.nlargest(top_k, fused.values(), key=lambda hit: hit['score'])
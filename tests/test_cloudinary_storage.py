@@ -0,0 +1,199 @@
+"""
+CloudinaryStorage.download_file against a local HTTP server standing in for the CDN,
+and list_files against a stubbed Admin API
+"""
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cloudinary_storage import CloudinaryStorage
+
+BODY = os.urandom(3 * 1024 * 1024 + 17)  # spans several download chunks
+
+
+class CDNHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so pooled connections can be reused
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        if self.path == '/missing.pdf':
+            body = b'not found'
+            self.send_response(404)
+        else:
+            body = BODY
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), CDNHandler)
+    httpd.lock = threading.Lock()
+    httpd.connections = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url_for(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def open_fds():
+    return len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else None
+
+
+def test_download_writes_the_whole_body(server, tmp_path):
+    storage = CloudinaryStorage(max_workers=2)
+    target = tmp_path / 'report.pdf'
+
+    assert storage.download_file(url_for(server, '/report.pdf'), str(target))
+
+    assert target.read_bytes() == BODY
+    assert [p.name for p in tmp_path.iterdir()] == ['report.pdf']  # no temp file left behind
+
+
+def test_http_error_leaves_nothing_behind(server, tmp_path):
+    storage = CloudinaryStorage(max_workers=2)
+    target = tmp_path / 'missing.pdf'
+    storage.download_file(url_for(server, '/report.pdf'), str(tmp_path / 'warm.pdf'))  # open the session first
+    fds_before = open_fds()
+
+    for _ in range(5):
+        with pytest.raises(Exception, match='Download failed'):
+            storage.download_file(url_for(server, '/missing.pdf'), str(target))
+
+    assert not target.exists()
+    assert [p.name for p in tmp_path.iterdir()] == ['warm.pdf']
+    if fds_before is not None:
+        assert open_fds() <= fds_before
+
+
+def test_connection_refused_leaves_nothing_behind(tmp_path):
+    storage = CloudinaryStorage(max_workers=1)
+    fds_before = open_fds()
+
+    with pytest.raises(Exception, match='Download failed'):
+        storage.download_file('http://127.0.0.1:9/report.pdf', str(tmp_path / 'report.pdf'))
+
+    assert list(tmp_path.iterdir()) == []
+    if fds_before is not None:
+        assert open_fds() <= fds_before
+
+
+def test_downloads_reuse_pooled_connections(server, tmp_path):
+    storage = CloudinaryStorage(max_workers=2)
+
+    for i in range(6):
+        storage.download_file(url_for(server, '/report.pdf'), str(tmp_path / f"copy{i}.pdf"))
+
+    assert server.connections == 1
+
+
+def test_download_all_files_shares_the_pool(server, tmp_path, monkeypatch):
+    storage = CloudinaryStorage(max_workers=2)
+    files = [{'name': f"doc{i}.pdf", 'url': url_for(server, f"/doc{i}.pdf")} for i in range(8)]
+    monkeypatch.setattr(storage, 'list_files', lambda refresh=False: files)
+
+    paths = storage.download_all_files(str(tmp_path / 'mirror'))
+
+    assert sorted(os.path.basename(p) for p in paths) == sorted(f['name'] for f in files)
+    assert all(open(p, 'rb').read() == BODY for p in paths)
+    assert server.connections <= storage.max_workers
+
+
+class FakeAdminAPI:
+    """Stands in for cloudinary.api: resources() pages through a fixed listing, page_size at a time"""
+
+    def __init__(self, names, page_size):
+        self.names = list(names)
+        self.page_size = page_size
+        self.calls = []
+
+    def resources(self, **params):
+        self.calls.append(params)
+        start = int(params.get('next_cursor') or 0)
+        page = self.names[start:start + self.page_size]
+        result = {'resources': [{'public_id': f"chatbot_documents/{name}", 'secure_url': f"https://cdn/{name}",
+                                 'version': 1, 'etag': name, 'bytes': 10} for name in page]}
+        if start + self.page_size < len(self.names):
+            result['next_cursor'] = str(start + self.page_size)
+        return result
+
+
+def stub_sdk(storage, names, page_size=2):
+    api = FakeAdminAPI(names, page_size)
+    uploader = SimpleNamespace(upload=lambda file, public_id, **kwargs: {'secure_url': f"https://cdn/{public_id}"},
+                               destroy=lambda public_id, **kwargs: {'result': 'ok'})
+    storage._sdk = SimpleNamespace(api=api, uploader=uploader)  # what connect() returns once configured
+    return api
+
+
+def test_list_files_follows_next_cursor():
+    storage = CloudinaryStorage(list_ttl=60)
+    names = [f"doc{i}.pdf" for i in range(5)]
+    api = stub_sdk(storage, names)
+
+    files = storage.list_files()
+
+    assert [f['name'] for f in files] == names
+    assert len(api.calls) == 3
+    assert 'next_cursor' not in api.calls[0]
+    assert [call['next_cursor'] for call in api.calls[1:]] == ['2', '4']
+
+
+def test_list_files_is_cached_within_the_ttl():
+    storage = CloudinaryStorage(list_ttl=60)
+    api = stub_sdk(storage, ['a.pdf', 'b.pdf', 'c.pdf'])
+
+    first = storage.list_files()
+    calls = len(api.calls)
+    second = storage.list_files()
+
+    assert second == first
+    assert len(api.calls) == calls
+    storage.list_files(refresh=True)
+    assert len(api.calls) == 2 * calls
+
+
+def test_list_files_expires_after_the_ttl():
+    storage = CloudinaryStorage(list_ttl=0)
+    api = stub_sdk(storage, ['a.pdf'])
+
+    storage.list_files()
+    storage.list_files()
+
+    assert len(api.calls) == 2
+
+
+def test_upload_and_delete_invalidate_the_listing():
+    storage = CloudinaryStorage(list_ttl=60)
+    api = stub_sdk(storage, ['a.pdf'])
+
+    storage.list_files()
+    api.names.append('b.pdf')
+    storage.upload_file(b'data', 'b.pdf')
+    assert [f['name'] for f in storage.list_files()] == ['a.pdf', 'b.pdf']
+    assert len(api.calls) == 2
+
+    api.names.remove('a.pdf')
+    storage.delete_file('a.pdf')
+    assert [f['name'] for f in storage.list_files()] == ['b.pdf']
+    assert len(api.calls) == 3
@@ -0,0 +1,155 @@
+"""
+Extracted Text Cache - Stores extracted document text keyed by content hash
+so that /chat does not re-parse every uploaded file on every question
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+
+class TextCache:
+    """Two-level cache (in-process LRU + on-disk) of extracted document text"""
+
+    def __init__(self, cache_dir: str, extractor: Callable[[bytes, str], str], max_entries: int = 64):
+        """
+        cache_dir: directory that holds one <sha256>.txt file per document
+        extractor: function(file_content, filename) -> text, called on a miss
+        max_entries: number of texts kept in memory
+        """
+        self.cache_dir = cache_dir
+        self.extractor = extractor
+        self.max_entries = max_entries
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self._lru = OrderedDict()
+        self._lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # file path -> [mtime_ns, size, digest], the fast pre-check before hashing
+        self._stats = self._load_index()
+
+    def _load_index(self) -> Dict:
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except:
+                pass
+        return {}
+
+    def _save_index(self):
+        # Per process and thread: several workers can share one cache directory
+        tmp_path = f"{self.index_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._stats, f)
+        os.replace(tmp_path, self.index_file)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.txt")
+
+    def _remember(self, digest: str, text: str):
+        self._lru[digest] = text
+        self._lru.move_to_end(digest)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _lookup(self, digest: str) -> Optional[str]:
+        """Look a digest up in memory first, then on disk"""
+        if digest in self._lru:
+            self._lru.move_to_end(digest)
+            return self._lru[digest]
+        blob_path = self._blob_path(digest)
+        if os.path.exists(blob_path):
+            try:
+                with open(blob_path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                self._remember(digest, text)
+                return text
+            except:
+                pass
+        return None
+
+    def digest_for(self, file_path: str) -> Optional[str]:
+        """Return the cached content hash of a file if its mtime/size still match"""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._stats.get(file_path)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2]
+        return None
+
+    def get_text(self, file_path: str, digest: Optional[str] = None) -> str:
+        """
+        Return the extracted text for a file, extracting only on a cache miss
+        digest: the content hash, when the caller already knows it (skips hashing)
+        """
+        known = digest
+        digest = digest or self.digest_for(file_path)
+        if digest:
+            with self._lock:
+                text = self._lookup(digest)
+                if text is not None and known:
+                    self._record(file_path, digest)
+            if text is not None:
+                return text
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        return self.put(file_path, content)
+
+    def put(self, file_path: str, content: bytes) -> str:
+        """
+        Hash the file content, extract it if unseen and record it for file_path
+        Nothing is stored when the extractor raises, so a failed extraction is retried next time
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            text = self._lookup(digest)
+        if text is None:
+            text = self.extractor(content, os.path.basename(file_path))
+            blob_path = self._blob_path(digest)
+            tmp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, blob_path)
+        with self._lock:
+            self._remember(digest, text)
+            self._record(file_path, digest)
+        return text
+
+    def _record(self, file_path: str, digest: str):
+        """Remember that file_path (at its current mtime/size) has this digest"""
+        st = os.stat(file_path)
+        entry = [st.st_mtime_ns, st.st_size, digest]
+        if self._stats.get(file_path) != entry:
+            self._stats[file_path] = entry
+            self._save_index()
+
+    def evict(self, file_path: str):
+        """Forget a file; its text is dropped unless another file has the same content"""
+        with self._lock:
+            entry = self._stats.pop(file_path, None)
+            if not entry:
+                return
+            digest = entry[2]
+            if not any(e[2] == digest for e in self._stats.values()):
+                self._lru.pop(digest, None)
+                try:
+                    os.remove(self._blob_path(digest))
+                except OSError:
+                    pass
+            self._save_index()
+
+    def clear(self):
+        """Drop every cached entry, in memory and on disk"""
+        with self._lock:
+            self._lru.clear()
+            self._stats = {}
+            for name in os.listdir(self.cache_dir):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
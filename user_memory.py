@@ -2,26 +2,155 @@
 User Memory System - Stores and manages user information, preferences, and conversation history
 Similar to Snapchat's My AI personality system
 """
+import copy
 import json
 import os
+import re
+import threading
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, List, Optional
 
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
 MEMORY_DIR = "./user_memory"
 MEMORY_FILE = os.path.join(MEMORY_DIR, "user_memory.json")
-CONVERSATION_FILE = os.path.join(MEMORY_DIR, "conversation_history.json")
+CONVERSATION_FILE = os.path.join(MEMORY_DIR, "conversation_history.json")  # legacy whole-file format
+CONVERSATION_LOG = os.path.join(MEMORY_DIR, "conversation_history.jsonl")  # one turn per line
+LOCK_FILE = os.path.join(MEMORY_DIR, ".lock")
+MAX_HISTORY_ENTRIES = 50
+MIN_COMPACTION_BYTES = 64 * 1024
 
 # Ensure memory directory exists
 os.makedirs(MEMORY_DIR, exist_ok=True)
 
-def load_memory() -> Dict:
-    """Load user memory from file"""
-    if os.path.exists(MEMORY_FILE):
+# Log size at which this process next compacts; 0 forces a check on the first append
+_compaction_threshold = 0
+
+# Per-process cache: recent turns mirrored from the log, plus rendered prompt fragments
+_version = 0  # bumped by save_memory / save_conversation_history / add_to_conversation
+_recent_turns = deque(maxlen=MAX_HISTORY_ENTRIES)
+_log_state = {'stamp': None, 'offset': 0}  # (inode, size, mtime_ns) of the log when mirrored
+_rendered = {}  # fragment name -> (cache key, text)
+_cache_lock = threading.RLock()
+_file_lock = threading.RLock()  # flock does not order threads sharing a file description; this does
+
+def _bump_version():
+    global _version
+    _version += 1
+
+def _memoized(name: str, key, render) -> str:
+    """Return the cached fragment for name if it was rendered under the same key"""
+    with _cache_lock:
+        cached = _rendered.get(name)
+        if cached and cached[0] == key:
+            return cached[1]
+        text = render()
+        _rendered[name] = (key, text)
+        return text
+
+@contextmanager
+def _locked(exclusive: bool = True):
+    """Cross-process lock (flock, plus a lock for this process's threads) around reads and writes of the memory files"""
+    with _file_lock, open(LOCK_FILE, 'a') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
         try:
-            with open(MEMORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            pass
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _write_atomic(path: str, data: str):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _parse_lines(lines: List[str]) -> List[Dict]:
+    turns = []
+    for line in lines:
+        line = line.strip()
+        if line:
+            try:
+                turns.append(json.loads(line))
+            except ValueError:
+                continue  # torn write from a crashed process
+    return turns
+
+def _migrate_legacy_history():
+    """Convert conversation_history.json into the JSONL log once (call without holding the lock)"""
+    if not os.path.exists(CONVERSATION_FILE):
+        return
+    with _locked():
+        if not os.path.exists(CONVERSATION_FILE):
+            return
+        if not os.path.exists(CONVERSATION_LOG):
+            try:
+                with open(CONVERSATION_FILE, 'r', encoding='utf-8') as f:
+                    history = json.load(f)
+            except:
+                history = []
+            _write_atomic(CONVERSATION_LOG, "".join(json.dumps(t, ensure_ascii=False) + "\n" for t in history))
+        os.replace(CONVERSATION_FILE, CONVERSATION_FILE + ".bak")
+
+def _read_tail(path: str, count: int, block_size: int = 8192) -> List[str]:
+    """Last `count` lines of a file, reading backwards from the end"""
+    if count <= 0 or not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= count:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode('utf-8', errors='ignore').splitlines()
+    return lines[-count:]
+
+def _read_memory() -> Optional[Dict]:
+    """The stored memory, or None (caller holds the lock)"""
+    try:
+        with open(MEMORY_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except:
+        return None
+
+class Memory(dict):
+    """
+    User memory as returned by load_memory: a plain dict that also remembers the copy
+    it was loaded (or last saved) as, so save_memory can tell the caller's own edits,
+    deletions included, from changes another worker saved in the meantime
+    """
+
+    def __init__(self, data: Dict):
+        super().__init__(data)
+        self._base = copy.deepcopy(data)
+        self._seen = {}  # list field -> [the list, set of its items, its length when last synced]
+        self._edits = 0  # in-place edits since load; part of the key the rendered prompt is cached under
+        self._rendered = None  # (key, text) from format_memory_for_prompt
+
+    def mark_dirty(self):
+        """Record an in-place edit, so format_memory_for_prompt renders the memory again"""
+        self._edits += 1
+
+    def _unique(self, field: str) -> list:
+        """[items, seen, length] for a list field; rebuilt if the list was replaced or resized elsewhere"""
+        items = self.setdefault(field, [])
+        entry = self._seen.get(field)
+        if entry is None or entry[0] is not items or entry[2] != len(items):
+            entry = self._seen[field] = [items, set(items), len(items)]
+        return entry
+
+
+def _empty_memory() -> Dict:
     return {
         "user_info": {},
         "preferences": {},
@@ -32,52 +161,180 @@ def load_memory() -> Dict:
         "last_updated": None
     }
 
+def load_memory() -> Memory:
+    """Load user memory from file"""
+    memory = None
+    if os.path.exists(MEMORY_FILE):
+        with _locked(exclusive=False):
+            memory = _read_memory()
+    return Memory(memory if memory is not None else _empty_memory())
+
+_MISSING = object()
+
+def _lookup(items: List):
+    """Membership test target for a list: a set when its items are hashable"""
+    try:
+        return set(items)
+    except TypeError:
+        return items
+
+def _merge_value(stored, base, mine):
+    """Three-way merge of one value: mine if the caller changed it since base, else stored"""
+    if mine == base:
+        return stored
+    if isinstance(mine, dict) and isinstance(stored, dict) and (base is _MISSING or isinstance(base, dict)):
+        return _merge_memory(stored, {} if base is _MISSING else base, mine)
+    if isinstance(mine, list) and isinstance(stored, list) and (base is _MISSING or isinstance(base, list)):
+        base = _lookup([] if base is _MISSING else base)
+        kept = _lookup(mine)
+        merged = [item for item in stored if item not in base or item in kept]
+        present = _lookup(stored)
+        return merged + [item for item in mine if item not in base and item not in present]
+    return mine
+
+def _merge_memory(stored: Dict, base: Dict, memory: Dict) -> Dict:
+    """
+    Three-way merge: whatever the caller changed since base (the copy it loaded) is
+    applied to what is on disk now, removals included, and everything else keeps the
+    stored value, so an update saved by another worker in the meantime is not lost
+    """
+    merged = {}
+    for key in {**stored, **base, **memory}:
+        value = _merge_value(stored.get(key, _MISSING), base.get(key, _MISSING), memory.get(key, _MISSING))
+        if value is not _MISSING:
+            merged[key] = value
+    return merged
+
 def save_memory(memory: Dict):
-    """Save user memory to file"""
-    memory["last_updated"] = datetime.now().isoformat()
-    with open(MEMORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(memory, f, indent=2, ensure_ascii=False)
-
-def load_conversation_history() -> List[Dict]:
-    """Load conversation history"""
-    if os.path.exists(CONVERSATION_FILE):
-        try:
-            with open(CONVERSATION_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            pass
-    return []
+    """
+    Save user memory to file: read, merge and write under one lock (atomically,
+    skipped when nothing changed). memory is updated in place to the merged result.
+    A Memory from load_memory is merged against the copy it was loaded as; a plain
+    dict has no such copy and replaces the stored memory as given
+    """
+    with _locked():
+        stored = _read_memory()
+        if stored is None:
+            merged = dict(memory)
+        else:
+            merged = _merge_memory(stored, getattr(memory, "_base", stored), memory)
+        _dedupe_lists(merged)
+        memory.clear()
+        memory.update(merged)
+        if isinstance(memory, Memory):
+            memory._base = copy.deepcopy(merged)
+            memory._seen.clear()
+            memory.mark_dirty()  # the merge may have pulled in changes even if nothing is written
+        if stored is not None:
+            stored.pop("last_updated", None)
+            if stored == {k: v for k, v in merged.items() if k != "last_updated"}:
+                return
+        memory["last_updated"] = datetime.now().isoformat()
+        _write_atomic(MEMORY_FILE, json.dumps(memory, indent=2, ensure_ascii=False))
+        if isinstance(memory, Memory):
+            memory._base["last_updated"] = memory["last_updated"]
+    _bump_version()
+
+def load_conversation_history(max_entries: int = MAX_HISTORY_ENTRIES) -> List[Dict]:
+    """Load conversation history (the last max_entries turns; the log itself is compacted lazily)"""
+    _migrate_legacy_history()
+    with _locked(exclusive=False):
+        return _parse_lines(_read_tail(CONVERSATION_LOG, max_entries))
 
-def save_conversation_history(history: List[Dict], max_entries: int = 50):
+def save_conversation_history(history: List[Dict], max_entries: int = MAX_HISTORY_ENTRIES):
     """Save conversation history (keep last N entries)"""
     # Keep only the most recent entries
     history = history[-max_entries:]
-    with open(CONVERSATION_FILE, 'w', encoding='utf-8') as f:
-        json.dump(history, f, indent=2, ensure_ascii=False)
+    with _locked():
+        _write_atomic(CONVERSATION_LOG, "".join(json.dumps(t, ensure_ascii=False) + "\n" for t in history))
+    _bump_version()
 
-def add_to_conversation(user_message: str, assistant_message: str):
-    """Add a conversation turn to history"""
-    history = load_conversation_history()
-    history.append({
+def _compact_conversation_log(max_entries: int):
+    """Rewrite the log down to its last max_entries turns (caller holds the lock)"""
+    global _compaction_threshold
+    turns = _parse_lines(_read_tail(CONVERSATION_LOG, max_entries))
+    _write_atomic(CONVERSATION_LOG, "".join(json.dumps(t, ensure_ascii=False) + "\n" for t in turns))
+    _compaction_threshold = max(2 * os.path.getsize(CONVERSATION_LOG), MIN_COMPACTION_BYTES)
+
+def add_to_conversation(user_message: str, assistant_message: str, max_entries: int = MAX_HISTORY_ENTRIES):
+    """Add a conversation turn to history (an O(1) append; compacts once the log doubles)"""
+    turn = {
         "timestamp": datetime.now().isoformat(),
         "user": user_message,
         "assistant": assistant_message
-    })
-    save_conversation_history(history)
+    }
+    _migrate_legacy_history()
+    with _locked():
+        with open(CONVERSATION_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(turn, ensure_ascii=False) + "\n")
+            size = f.tell()
+        if size > _compaction_threshold:
+            _compact_conversation_log(max_entries)
+    _bump_version()
+
+def _sync_recent_turns():
+    """
+    Bring the in-memory deque up to date with the log (written by any process)
+    Only bytes appended since the last sync are read; a rewritten log is re-read from its tail.
+    Returns the log stamp, which doubles as the cache key for rendered history
+    """
+    try:
+        st = os.stat(CONVERSATION_LOG)
+    except FileNotFoundError:
+        _recent_turns.clear()
+        _log_state.update(stamp=None, offset=0)
+        return None
+    stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+    if stamp == _log_state['stamp']:
+        return stamp
+    previous = _log_state['stamp']
+    if previous and previous[0] == st.st_ino and st.st_size >= _log_state['offset']:
+        with open(CONVERSATION_LOG, 'rb') as f:
+            f.seek(_log_state['offset'])
+            data = f.read(st.st_size - _log_state['offset'])
+        complete = data[:data.rfind(b"\n") + 1]  # leave a half-written last line for next time
+        _recent_turns.extend(_parse_lines(complete.decode('utf-8', errors='ignore').splitlines()))
+        _log_state['offset'] += len(complete)
+    else:
+        _recent_turns.clear()
+        _recent_turns.extend(_parse_lines(_read_tail(CONVERSATION_LOG, _recent_turns.maxlen)))
+        _log_state['offset'] = st.st_size
+    _log_state['stamp'] = stamp
+    return stamp
 
 def get_recent_conversation_context(max_turns: int = 10) -> str:
     """Get recent conversation context for continuity"""
-    history = load_conversation_history()
-    recent = history[-max_turns:] if len(history) > max_turns else history
-    
-    context = ""
-    for turn in recent:
-        context += f"User: {turn['user']}\nAssistant: {turn['assistant']}\n\n"
-    
-    return context
+    _migrate_legacy_history()
+    with _locked(exclusive=False):
+        if max_turns > _recent_turns.maxlen:
+            recent = _parse_lines(_read_tail(CONVERSATION_LOG, max_turns))
+            return "".join(f"User: {turn['user']}\nAssistant: {turn['assistant']}\n\n" for turn in recent)
+        with _cache_lock:
+            stamp = _sync_recent_turns()
+            
+            def render():
+                recent = list(_recent_turns)[-max_turns:] if max_turns > 0 else []
+                return "".join(f"User: {turn['user']}\nAssistant: {turn['assistant']}\n\n" for turn in recent)
+            
+            return _memoized(f"context:{max_turns}", (stamp, _version), render)
 
 def format_memory_for_prompt(memory: Dict) -> str:
-    """Format user memory into a prompt-friendly string"""
+    """
+    Format user memory into a prompt-friendly string
+    For a Memory the result is cached under (_version, edits): save_memory bumps the
+    version and extract_user_info_from_conversation marks unsaved edits, so both show
+    up. Code that edits a Memory in place any other way calls memory.mark_dirty().
+    A plain dict is rendered every time
+    """
+    if not isinstance(memory, Memory):
+        return _render_memory(memory)
+    key = (_version, memory._edits)
+    cached = memory._rendered
+    if cached is None or cached[0] != key:
+        cached = memory._rendered = (key, _render_memory(memory))
+    return cached[1]
+
+def _render_memory(memory: Dict) -> str:
     if not memory.get("user_info") and not memory.get("important_facts"):
         return "No previous information about the user."
     
@@ -103,54 +360,136 @@ def format_memory_for_prompt(memory: Dict) -> str:
     
     return "\n".join(info)
 
-def extract_user_info_from_conversation(user_message: str, assistant_message: str, memory: Dict) -> Dict:
+# All name, location and interest cues in one alternation, matched in a single pass
+# over the lowercased message. Values are captured inside lookaheads so a cue never
+# swallows the next one ("I am based in Paris" still finds "based in paris"). The
+# leading lookahead lists the letters a cue can start with, so the engine only tries
+# the alternation (and the word-start check) at those positions
+_CUE_RE = re.compile(r"""
+    (?=[mcilbfehp])(?<![\w'])(?:
+        (?:my\ name\ is|i'm|i\ am|called)(?=\s+(?P<name>[a-z][\w'-]*))
+      | (?:live\ in|located\ in|based\ in|from)\b(?=(?P<location>[^.,]*))
+      | (?:interested\ in|like|love|enjoy|hobby|passion)\b(?=(?P<interest>[^.,]*))
+    )
+""", re.VERBOSE)
+
+# Words that follow "I am" / "I'm" without being a name
+_NOT_NAMES = {
+    "a", "an", "the", "not", "so", "very", "really", "just", "also", "from", "in", "at", "on",
+    "based", "located", "living", "going", "interested", "here", "fine", "good", "ok", "okay",
+    "happy", "sad", "tired", "sure", "glad", "sorry", "trying", "looking", "working", "still",
+}
+
+# Memory lists whose entries are kept unique
+_UNIQUE_FIELDS = ("interests", "important_facts")
+
+@lru_cache(maxsize=4096)
+def _scan_cues(user_message: str):
     """
-    Extract important user information from conversation
-    This is a simple extraction - in production, you'd use NLP/ML models
+    (name or None, location or None, (interests)) from one pass over the message
+    Cached: chat messages and re-run back-fills see the same text again and again
     """
-    updated = False
+    name = location = None
+    interests = []
     message_lower = user_message.lower()
-    
-    # Extract name patterns
-    if "my name is" in message_lower or "i'm" in message_lower or "i am" in message_lower:
-        # Simple name extraction (can be improved)
-        words = user_message.split()
-        for i, word in enumerate(words):
-            if word.lower() in ["name", "i'm", "i", "am", "called"]:
-                if i + 1 < len(words):
-                    name = words[i + 1].strip(".,!?")
-                    if name and len(name) > 1:
-                        memory["user_info"]["name"] = name
-                        updated = True
-                        break
-    
-    # Extract location
-    location_keywords = ["live in", "from", "located in", "based in"]
-    for keyword in location_keywords:
-        if keyword in message_lower:
-            parts = user_message.lower().split(keyword)
-            if len(parts) > 1:
-                location = parts[1].split(".")[0].split(",")[0].strip()
-                if location:
-                    memory["user_info"]["location"] = location
-                    updated = True
+    for name_cue, location_cue, interest_cue in _CUE_RE.findall(message_lower):
+        if interest_cue:
+            interest_cue = interest_cue.strip()
+            if interest_cue:
+                interests.append(interest_cue)
+        elif location_cue:
+            if location is None:
+                location = location_cue.strip() or None
+        elif name_cue and name is None and len(name_cue) > 1 and name_cue not in _NOT_NAMES:
+            name = name_cue
+    # Names keep their original case when lowercasing didn't shift character offsets
+    if name and len(message_lower) == len(user_message):
+        if message_lower.count(name) == 1:
+            start = message_lower.find(name)
+            name = user_message[start:start + len(name)]
+        else:
+            for match in _CUE_RE.finditer(message_lower):
+                if match.group('name') == name:
+                    name = user_message[match.start('name'):match.end('name')]
                     break
-    
-    # Extract interests/hobbies
-    interest_keywords = ["like", "love", "enjoy", "interested in", "hobby", "passion"]
-    for keyword in interest_keywords:
-        if keyword in message_lower:
-            # Extract the thing they like
-            parts = user_message.lower().split(keyword)
-            if len(parts) > 1:
-                interest = parts[1].split(".")[0].split(",")[0].strip()
-                if interest and interest not in memory.get("interests", []):
-                    if "interests" not in memory:
-                        memory["interests"] = []
-                    memory["interests"].append(interest)
-                    updated = True
-    
-    return memory if updated else None
+    return name, location, tuple(interests)
+
+def extract_cues(user_message: str) -> Dict:
+    """Scan one message once: {'name': str|None, 'location': str|None, 'interests': [str]}"""
+    name, location, interests = _scan_cues(user_message)
+    return {'name': name, 'location': location, 'interests': list(interests)}
 
+def _extend_unique(memory: Dict, field: str, values: List[str]) -> bool:
+    """
+    Append the values not already in memory[field]
+    A Memory keeps a set of each list's items between calls; a plain dict gets one built here
+    """
+    if isinstance(memory, Memory):
+        entry = memory._unique(field)
+        items, seen = entry[0], entry[1]
+    else:
+        entry = None
+        items = memory.setdefault(field, [])
+        seen = set(items)
+    added = False
+    for value in values:
+        if value not in seen:
+            items.append(value)
+            seen.add(value)
+            added = True
+    if entry is not None:
+        entry[2] = len(items)
+    return added
 
+def _dedupe_lists(memory: Dict):
+    """Drop repeated entries from the list fields (first occurrence wins)"""
+    for field in _UNIQUE_FIELDS:
+        items = memory.get(field)
+        if isinstance(items, list) and len(items) > 1:
+            unique = list(dict.fromkeys(items))
+            if len(unique) != len(items):
+                memory[field] = unique
 
+def _apply_cues(memory: Dict, user_message: str) -> bool:
+    name, location, interests = _scan_cues(user_message)
+    updated = False
+    if name or location:
+        user_info = memory.setdefault("user_info", {})
+        if name:
+            user_info["name"] = name
+        if location:
+            user_info["location"] = location
+        updated = True
+    if interests and _extend_unique(memory, "interests", interests):
+        updated = True
+    if updated and isinstance(memory, Memory):
+        memory.mark_dirty()
+    return updated
+
+def extract_user_info_from_conversation(user_message: str, assistant_message: str, memory: Dict) -> Dict:
+    """
+    Extract important user information from conversation
+    This is a simple extraction - in production, you'd use NLP/ML models
+    """
+    updated = _apply_cues(memory, user_message)
+    return memory if updated else None
+
+def backfill_memory_from_history(history: Optional[List[Dict]] = None, memory: Optional[Dict] = None,
+                                 save: bool = True) -> Dict:
+    """
+    Run the extractor over a whole conversation log (default: the stored history)
+    and merge everything into memory, saving once at the end
+    """
+    history = load_conversation_history() if history is None else history
+    memory = load_memory() if memory is None else memory
+    _dedupe_lists(memory)
+    working = memory if isinstance(memory, Memory) else Memory(memory)  # keeps one set of interests for the run
+    updated = False
+    for turn in history:
+        if _apply_cues(working, turn.get("user", "")):
+            updated = True
+    if working is not memory:
+        memory.update(working)
+    if updated and save:
+        save_memory(memory)
+    return memory
@@ -0,0 +1,76 @@
+"""
+Warm-up - Builds slow components (SDK clients, models) on a background thread
+after start-up, so the server answers requests while they load and /ready can
+report which ones are warm
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+PENDING = 'pending'
+WARMING = 'warming'
+READY = 'ready'
+FAILED = 'failed'
+DISABLED = 'disabled'
+
+
+class WarmUp:
+    """Named start-up tasks, run in registration order on one background thread"""
+
+    def __init__(self):
+        self._components = OrderedDict()  # name -> {'fn', 'status', 'seconds', 'error', 'result', 'event'}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, name: str, fn: Callable[[], Any], enabled: bool = True):
+        self._components[name] = {'fn': fn, 'status': PENDING if enabled else DISABLED,
+                                  'seconds': None, 'error': None, 'result': None,
+                                  'event': threading.Event()}
+        if not enabled:
+            self._components[name]['event'].set()
+
+    def start(self):
+        """Start the background thread (once)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='warmup', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        for name in list(self._components):
+            self._warm(name)
+
+    def _warm(self, name: str):
+        component = self._components[name]
+        with self._lock:
+            if component['status'] != PENDING:
+                return
+            component['status'] = WARMING
+        start = time.perf_counter()
+        try:
+            component['result'] = component['fn']()
+            component['status'] = READY
+        except Exception as e:
+            print(f"⚠️  Warm-up of {name} failed: {e}")
+            component['error'] = str(e)
+            component['status'] = FAILED
+        component['seconds'] = round(time.perf_counter() - start, 3)
+        component['event'].set()
+
+    def wait(self, name: str, timeout: Optional[float] = None) -> Any:
+        """
+        The component's result, building it on the calling thread if warm-up has not reached it yet
+        Returns None for disabled or failed components
+        """
+        component = self._components[name]
+        self._warm(name)  # no-op unless still pending
+        component['event'].wait(timeout)
+        return component['result']
+
+    def status(self) -> Dict:
+        """{'ready': every enabled component is warm, 'components': {name: status}}"""
+        components = {name: {'status': c['status'], 'seconds': c['seconds'], 'error': c['error']}
+                      for name, c in self._components.items()}
+        ready = all(c['status'] in (READY, DISABLED) for c in components.values())
+        return {'ready': ready, 'components': components}
@@ -149,6 +149,7 @@ async function handleFiles(files) {
         if (response.ok) {
             showStatus(data.message, 'success');
             loadFiles();
+            if (data.job_id) followJob(data.job_id, 'Indexing');
         } else {
             showStatus(data.error || 'Upload failed', 'error');
         }
@@ -294,9 +295,10 @@ async function reindexFiles() {
         const data = await response.json();
 
         if (response.ok) {
-            showStatus(`✅ Indexed ${data.file_count} file(s), ${data.document_count} document(s)`, 'success');
+            showStatus(`${data.message}...`, 'info');
             hasIndex = data.file_count > 0;
             updateChatState();
+            if (data.job_id) followJob(data.job_id, 'Indexing');
         } else {
             showStatus(data.error || 'Reindex failed', 'error');
         }
@@ -616,6 +618,28 @@ function removeTypingIndicator(id) {
 }
 
 // Utility Functions
+// Ingestion progress, streamed from /jobs/<id>/events while files are indexed in the background
+function followJob(jobId, label) {
+    const source = new EventSource(`${API_URL}/jobs/${jobId}/events`);
+    source.onmessage = (e) => {
+        const job = JSON.parse(e.data);
+        const total = job.files.length;
+        const finished = (job.counts.done || 0) + (job.counts.failed || 0);
+        if (job.finished === null) {
+            showStatus(`${label} ${finished}/${total} file(s)...`, 'info');
+            return;
+        }
+        source.close();
+        if (job.counts.failed) {
+            const failed = job.files.filter(f => f.status === 'failed').map(f => f.name);
+            showStatus(`⚠️ Could not index: ${failed.join(', ')}`, 'error');
+        } else {
+            showStatus(`✅ Indexed ${total} file(s)`, 'success');
+        }
+    };
+    source.onerror = () => source.close();
+}
+
 function showStatus(message, type) {
     uploadStatus.textContent = message;
     uploadStatus.className = `status-message ${type}`;